@@ -0,0 +1,138 @@
+"""
+Benchmark de recall vs latencia del índice IVF frente a la búsqueda exacta.
+
+Genera embeddings sintéticos de 128 dimensiones agrupados (como los de rostros
+reales, que se concentran por rasgos similares) sobre un subespacio de pocas
+dimensiones: los embeddings de rostros ocupan una variedad de dimensión
+intrínseca baja, y con ruido isótropo en las 128 las consultas casi nunca
+cruzan el borde de su lista, lo que da recall 1.0 con un solo sondeo. Construye
+IndiceGaleria e IndiceIVF con los mismos datos y mide, para varios valores de
+num_sondeos, qué fracción de consultas devuelve la misma persona que la
+búsqueda exacta y cuánto tarda cada consulta.
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks.benchmark_ann --personas 100000 --sondeos 1 4 8 16 32
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from galeria import IndiceGaleria, IndiceIVF
+
+
+def generar_embeddings(num_personas, dimension, num_grupos, rng, dimension_intrinseca=16):
+    """
+    Embeddings sintéticos agrupados alrededor de centros aleatorios de un subespacio
+
+    Returns:
+        tuple: (embeddings, base) con base la matriz ortonormal del subespacio
+    """
+    base = np.linalg.qr(rng.normal(size=(dimension, dimension_intrinseca)))[0].T
+    escala = 1.0 / np.sqrt(dimension_intrinseca)
+    centros = rng.normal(0.0, escala, size=(num_grupos, dimension_intrinseca))
+    grupos = rng.integers(0, num_grupos, size=num_personas)
+    ruido = rng.normal(0.0, 0.6 * escala, size=(num_personas, dimension_intrinseca))
+    return ((centros[grupos] + ruido) @ base).astype(np.float32), base
+
+
+def generar_consultas(galeria, base, num_consultas, ruido, rng, fraccion_subespacio=0.8):
+    """
+    Consultas = personas de la galería con ruido de captura de norma ~`ruido`;
+    `fraccion_subespacio` de su varianza cae en el subespacio de los embeddings
+    """
+    indices = rng.choice(len(galeria), num_consultas, replace=False)
+    dimension_intrinseca, dimension = base.shape
+    en_subespacio = rng.normal(0.0, np.sqrt(fraccion_subespacio / dimension_intrinseca),
+                               size=(num_consultas, dimension_intrinseca)) @ base
+    fuera = rng.normal(0.0, np.sqrt((1 - fraccion_subespacio) / dimension), size=(num_consultas, dimension))
+    return (galeria[indices] + ruido * (en_subespacio + fuera)).astype(np.float32)
+
+
+def medir(indice, consultas, lote):
+    """Ejecuta las consultas en lotes y retorna (ids, distancias, ms por consulta)"""
+    ids = []
+    distancias = []
+    inicio = time.perf_counter()
+    for i in range(0, len(consultas), lote):
+        ids_lote, distancias_lote = indice.buscar(consultas[i:i + lote])
+        ids.append(ids_lote)
+        distancias.append(distancias_lote)
+    transcurrido = time.perf_counter() - inicio
+    return np.concatenate(ids), np.concatenate(distancias), transcurrido * 1000 / len(consultas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--personas', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=128)
+    parser.add_argument('--grupos', type=int, default=500, help='Centros de los embeddings sintéticos')
+    parser.add_argument('--dimension-intrinseca', type=int, default=16,
+                        help='Dimensión del subespacio donde varían los embeddings sintéticos')
+    parser.add_argument('--consultas', type=int, default=1000)
+    parser.add_argument('--lote', type=int, default=4, help='Rostros por consulta (rostros por frame)')
+    parser.add_argument('--ruido', type=float, default=0.4,
+                        help='Ruido de captura de las consultas (distancia típica a la misma persona)')
+    parser.add_argument('--listas', type=int, default=None, help='Listas IVF (por defecto 4*sqrt(N))')
+    parser.add_argument('--sondeos', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--tolerancia', type=float, default=0.6)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', help='Ruta donde guardar los resultados en JSON')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.semilla)
+    embeddings, base = generar_embeddings(args.personas, args.dimension, args.grupos, rng,
+                                          args.dimension_intrinseca)
+    ids = np.arange(1, args.personas + 1)
+    consultas = generar_consultas(embeddings, base, args.consultas, args.ruido, rng)
+
+    exacto = IndiceGaleria(dimension=args.dimension)
+    exacto.reconstruir(ids, embeddings)
+    ids_exactos, distancias_exactas, ms_exacto = medir(exacto, consultas, args.lote)
+    dentro_tolerancia = distancias_exactas < args.tolerancia
+
+    inicio = time.perf_counter()
+    ivf = IndiceIVF(dimension=args.dimension, num_listas=args.listas, min_entrenamiento=1, semilla=args.semilla)
+    ivf.reconstruir(ids, embeddings)
+    segundos_entrenamiento = time.perf_counter() - inicio
+
+    print(f"Personas: {args.personas}  Consultas: {args.consultas}  Listas: {len(ivf._ids_listas)}")
+    print(f"Entrenamiento IVF: {segundos_entrenamiento:.2f} s")
+    print(f"Exacto: {ms_exacto:.3f} ms/consulta")
+    print(f"{'sondeos':>8} {'recall@1':>9} {'coinc. tol.':>11} {'ms/consulta':>12} {'aceleración':>12}")
+
+    resultados = {
+        'personas': args.personas,
+        'consultas': args.consultas,
+        'listas': len(ivf._ids_listas),
+        'entrenamiento_s': segundos_entrenamiento,
+        'exacto_ms_por_consulta': ms_exacto,
+        'ivf': []
+    }
+
+    for num_sondeos in args.sondeos:
+        ivf.num_sondeos = num_sondeos
+        ids_ivf, distancias_ivf, ms_ivf = medir(ivf, consultas, args.lote)
+
+        # recall@1: misma persona que la búsqueda exacta
+        recall = float(np.mean(ids_ivf == ids_exactos))
+        # Coincidencia de decisión: mismo resultado final tras aplicar la tolerancia
+        decision_ivf = np.where(distancias_ivf < args.tolerancia, ids_ivf, -1)
+        decision_exacta = np.where(dentro_tolerancia, ids_exactos, -1)
+        coincidencia = float(np.mean(decision_ivf == decision_exacta))
+
+        print(f"{num_sondeos:>8} {recall:>9.4f} {coincidencia:>11.4f} {ms_ivf:>12.3f} {ms_exacto / ms_ivf:>11.1f}x")
+        resultados['ivf'].append({
+            'sondeos': num_sondeos,
+            'recall_at_1': recall,
+            'coincidencia_tolerancia': coincidencia,
+            'ms_por_consulta': ms_ivf
+        })
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
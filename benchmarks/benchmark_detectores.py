@@ -0,0 +1,161 @@
+"""
+Comparación de velocidad y recall de los detectores de rostros (detectores.py).
+
+Ejecuta cada detector, a cada escala de reducción, sobre una carpeta de imágenes
+de prueba y mide el tiempo por imagen y qué fracción de los rostros esperados
+encuentra (recall) y de sus cajas son rostros (precisión). Los rostros esperados
+vienen de un JSON de anotaciones {"archivo.jpg": [[top, right, bottom, left], ...]},
+por defecto el `anotaciones.json` de la carpeta. Sin carpeta se usan las fotos
+anotadas de benchmarks/fixtures/imagenes. Sin anotaciones se toman como
+referencia las cajas de `--referencia` (por defecto MTCNN, el más sensible), así
+que el recall es relativo a ese detector.
+
+Al final recomienda el detector más barato que alcanza `--recall-minimo`.
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks.benchmark_detectores
+    python -m benchmarks.benchmark_detectores fotos/ --detectores hog haar dnn --escalas 0.5 1.0
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detectores import DETECTORES, crear_detector
+from seguimiento import calcular_iou
+
+EXTENSIONES = ('.jpg', '.jpeg', '.png', '.bmp')
+IMAGENES_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'imagenes')
+
+
+def cargar_imagenes(carpeta, limite):
+    imagenes = {}
+    for archivo in sorted(os.listdir(carpeta)):
+        if archivo.lower().endswith(EXTENSIONES):
+            imagen = cv2.imread(os.path.join(carpeta, archivo))
+            if imagen is not None:
+                imagenes[archivo] = imagen
+        if limite and len(imagenes) >= limite:
+            break
+    return imagenes
+
+
+def emparejar(esperadas, detectadas, umbral_iou):
+    """Emparejamiento voraz por IoU; retorna el número de cajas esperadas encontradas"""
+    pares = sorted(
+        ((calcular_iou(e, d), i, j) for i, e in enumerate(esperadas) for j, d in enumerate(detectadas)),
+        reverse=True
+    )
+    usadas_e, usadas_d = set(), set()
+    for iou, i, j in pares:
+        if iou < umbral_iou:
+            break
+        if i in usadas_e or j in usadas_d:
+            continue
+        usadas_e.add(i)
+        usadas_d.add(j)
+    return len(usadas_e)
+
+
+def evaluar(detector, imagenes, esperadas, escala, umbral_iou):
+    # Calentamiento: carga del modelo y primera inferencia fuera de la medición
+    detector.detectar(next(iter(imagenes.values())), escala)
+
+    tiempos = []
+    encontradas = total_esperadas = total_detectadas = 0
+    for archivo, imagen in imagenes.items():
+        inicio = time.perf_counter()
+        detectadas = detector.detectar(imagen, escala)
+        tiempos.append(time.perf_counter() - inicio)
+
+        cajas = esperadas.get(archivo, [])
+        encontradas += emparejar(cajas, detectadas, umbral_iou)
+        total_esperadas += len(cajas)
+        total_detectadas += len(detectadas)
+
+    tiempos = np.asarray(tiempos) * 1000
+    return {
+        'ms_media': float(tiempos.mean()),
+        'ms_p95': float(np.percentile(tiempos, 95)),
+        'rostros_detectados': total_detectadas,
+        'recall': encontradas / total_esperadas if total_esperadas else None,
+        'precision': encontradas / total_detectadas if total_detectadas else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('carpeta', nargs='?', default=IMAGENES_FIXTURE,
+                        help='Carpeta con las imágenes de prueba (por defecto, las de benchmarks/fixtures)')
+    parser.add_argument('--anotaciones',
+                        help='JSON con las cajas esperadas por archivo (por defecto, anotaciones.json de la carpeta)')
+    parser.add_argument('--referencia', choices=list(DETECTORES), default='mtcnn',
+                        help='Detector cuyas cajas se usan como referencia si no hay anotaciones')
+    parser.add_argument('--detectores', nargs='+', choices=list(DETECTORES), default=list(DETECTORES))
+    parser.add_argument('--escalas', type=float, nargs='+', default=[0.5, 1.0])
+    parser.add_argument('--iou', type=float, default=0.3,
+                        help='IoU mínimo para considerar encontrado un rostro (las cajas de cada detector difieren)')
+    parser.add_argument('--recall-minimo', type=float, default=0.9)
+    parser.add_argument('--limite', type=int, default=None, help='Máximo de imágenes a usar')
+    parser.add_argument('--json', help='Ruta donde guardar los resultados')
+    args = parser.parse_args()
+
+    imagenes = cargar_imagenes(args.carpeta, args.limite)
+    if not imagenes:
+        print(f"No hay imágenes en {args.carpeta}")
+        return 1
+
+    anotaciones = args.anotaciones
+    if anotaciones is None and os.path.exists(os.path.join(args.carpeta, 'anotaciones.json')):
+        anotaciones = os.path.join(args.carpeta, 'anotaciones.json')
+    if anotaciones:
+        with open(anotaciones, 'r', encoding='utf-8') as f:
+            esperadas = {archivo: [tuple(caja) for caja in cajas] for archivo, cajas in json.load(f).items()}
+        origen = anotaciones
+    else:
+        referencia = crear_detector(args.referencia)
+        esperadas = {archivo: referencia.detectar(imagen) for archivo, imagen in imagenes.items()}
+        origen = f"detector {args.referencia} a escala 1.0"
+    print(f"{len(imagenes)} imágenes, {sum(map(len, esperadas.values()))} rostros esperados ({origen})")
+
+    resultados = []
+    for nombre in args.detectores:
+        try:
+            detector = crear_detector(nombre)
+        except (FileNotFoundError, RuntimeError) as e:
+            print(f"  {nombre:<6} omitido: {e}")
+            continue
+        for escala in args.escalas:
+            try:
+                medida = evaluar(detector, imagenes, esperadas, escala, args.iou)
+            except Exception as e:
+                # Modelo o dependencia no disponible en este equipo
+                print(f"  {nombre:<6} escala {escala:<5} omitido: {e}")
+                break
+            resultados.append({'detector': nombre, 'escala': escala, **medida})
+            recall = f"{medida['recall']:.3f}" if medida['recall'] is not None else "-"
+            precision = f"{medida['precision']:.3f}" if medida['precision'] is not None else "-"
+            print(f"  {nombre:<6} escala {escala:<5} {medida['ms_media']:8.1f} ms/imagen "
+                  f"(p95 {medida['ms_p95']:.1f})  recall {recall}  precisión {precision}")
+
+    aptos = [r for r in resultados if r['recall'] is not None and r['recall'] >= args.recall_minimo]
+    recomendado = min(aptos, key=lambda r: r['ms_media']) if aptos else None
+    if recomendado:
+        print(f"Recomendado: {recomendado['detector']} a escala {recomendado['escala']} "
+              f"({recomendado['ms_media']:.1f} ms, recall {recomendado['recall']:.3f})")
+    else:
+        print(f"Ningún detector alcanza recall {args.recall_minimo}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'imagenes': len(imagenes), 'referencia': origen, 'resultados': resultados,
+                       'recomendado': recomendado}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Benchmark de las consultas de estadísticas e historial sobre una tabla grande.
+
+Genera una base SQLite con N detecciones sintéticas (10 millones por defecto)
+repartidas entre varias personas a lo largo de un año, y mide las consultas
+de DatabaseManager antes y después de crear los índices. Los resúmenes por
+hora/día se reconstruyen tras la carga masiva. Opcionalmente mide
+también la versión anterior (cargar todas las filas como objetos ORM y
+contarlas en Python) sobre una persona, para comparar.
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks.benchmark_estadisticas --filas 10000000 --db bench_estadisticas.db
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from database import DatabaseManager, DeteccionEmocion
+
+EMOCIONES = ['Enojo', 'Disgusto', 'Miedo', 'Felicidad', 'Tristeza', 'Sorpresa', 'Neutral']
+
+
+def generar_detecciones(db, filas, personas, semilla, tamano_lote=200000):
+    """Inserta filas sintéticas directamente con el driver (executemany por lotes)"""
+    rng = random.Random(semilla)
+    ahora = datetime.now()
+    segundos_anio = 365 * 24 * 3600
+
+    conexion = db.engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        insertadas = 0
+        while insertadas < filas:
+            n = min(tamano_lote, filas - insertadas)
+            lote = [
+                (
+                    rng.randint(1, personas),
+                    rng.choice(EMOCIONES),
+                    rng.random(),
+                    (ahora - timedelta(seconds=rng.randint(0, segundos_anio))).strftime('%Y-%m-%d %H:%M:%S.%f')
+                )
+                for _ in range(n)
+            ]
+            cursor.executemany(
+                "INSERT INTO detecciones_emociones (persona_id, emocion, confianza, fecha_deteccion) "
+                "VALUES (?, ?, ?, ?)",
+                lote
+            )
+            conexion.commit()
+            insertadas += n
+            print(f"  {insertadas}/{filas} filas", end='\r')
+        print()
+    finally:
+        conexion.close()
+
+
+def cronometrar(funcion, repeticiones):
+    """Retorna el mejor tiempo en ms de varias ejecuciones"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+
+def medir_consultas(db, persona_id, repeticiones):
+    consultas = {
+        'estadisticas_generales': lambda: db.obtener_estadisticas_emociones(),
+        'estadisticas_persona': lambda: db.obtener_estadisticas_emociones(persona_id),
+        'estadisticas_persona_30_dias': lambda: db.obtener_estadisticas_emociones(persona_id, dias=30),
+        'conteo_persona_30_dias': lambda: db.obtener_conteo_detecciones(persona_id, 30),
+        'conteos_por_persona_30_dias': lambda: db.obtener_conteos_por_persona(30),
+        'historial_diario_persona_30_dias': lambda: db.obtener_historial_diario(persona_id, 30),
+        'ultimas_10_por_persona_30_dias': lambda: db.obtener_ultimas_detecciones_por_persona(10, 30),
+        'ultimas_10_persona': lambda: db.obtener_ultimas_detecciones(persona_id, 10),
+        'iterar_historial_persona_30_dias': lambda: sum(1 for _ in db.iterar_historial_emociones(persona_id, 30)),
+    }
+    resultados = {}
+    for nombre, consulta in consultas.items():
+        resultados[nombre] = cronometrar(consulta, repeticiones)
+        print(f"  {nombre:<36} {resultados[nombre]:>10.1f} ms")
+    return resultados
+
+
+def estadisticas_orm(db, persona_id):
+    """Versión anterior: cargar todas las filas como objetos ORM y contarlas en Python"""
+    detecciones = db.session.query(DeteccionEmocion).filter_by(persona_id=persona_id).all()
+    estadisticas = {}
+    for deteccion in detecciones:
+        estadisticas[deteccion.emocion] = estadisticas.get(deteccion.emocion, 0) + 1
+    return estadisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filas', type=int, default=10_000_000)
+    parser.add_argument('--personas', type=int, default=200)
+    parser.add_argument('--db', default='bench_estadisticas.db')
+    parser.add_argument('--reutilizar', action='store_true', help='Usar la base existente sin regenerarla')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--orm', action='store_true', help='Medir también la versión ORM anterior')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', help='Ruta donde guardar los resultados en JSON')
+    args = parser.parse_args()
+
+    if not args.reutilizar and os.path.exists(args.db):
+        os.remove(args.db)
+
+    db = DatabaseManager(args.db)
+    persona_id = 1
+    resultados = {'filas': args.filas, 'personas': args.personas}
+
+    if not args.reutilizar:
+        # Insertar sin índices (más rápido) y medir primero las consultas sin ellos
+        for indice in DeteccionEmocion.__table__.indexes:
+            indice.drop(db.engine)
+
+        print(f"Generando {args.filas} detecciones...")
+        inicio = time.perf_counter()
+        generar_detecciones(db, args.filas, args.personas, args.semilla)
+        resultados['generacion_s'] = time.perf_counter() - inicio
+
+        # La carga masiva no pasa por el escritor: generar los resúmenes de una vez
+        inicio = time.perf_counter()
+        db.reconstruir_resumenes()
+        resultados['reconstruccion_resumenes_s'] = time.perf_counter() - inicio
+        print(f"Resúmenes reconstruidos en {resultados['reconstruccion_resumenes_s']:.1f} s")
+
+        print("Consultas sin índices:")
+        resultados['sin_indices_ms'] = medir_consultas(db, persona_id, 1)
+
+        inicio = time.perf_counter()
+        db.crear_indices()
+        resultados['creacion_indices_s'] = time.perf_counter() - inicio
+        print(f"Índices creados en {resultados['creacion_indices_s']:.1f} s")
+
+    with db.engine.connect() as conexion:
+        conexion.exec_driver_sql("ANALYZE")
+
+    print("Consultas con índices:")
+    resultados['con_indices_ms'] = medir_consultas(db, persona_id, args.repeticiones)
+
+    if args.orm:
+        resultados['orm_estadisticas_persona_ms'] = cronometrar(lambda: estadisticas_orm(db, persona_id), 1)
+        print(f"  {'orm_estadisticas_persona':<36} {resultados['orm_estadisticas_persona_ms']:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de carga del servicio local de reconocimiento (servicio.py).
+
+Abre C conexiones keep-alive contra el servicio y envía N solicitudes
+POST /reconocer con la misma imagen, midiendo en el cliente el throughput y
+las latencias p50/p99; al final consulta /metricas para ver el tamaño medio
+de los micro-lotes formados por el servidor.
+
+Uso (con el servicio ya iniciado en otra terminal):
+    python servicio.py --puerto 8765
+    python -m benchmarks.benchmark_servicio foto.jpg --solicitudes 2000 --concurrencia 32
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+
+async def solicitar(reader, writer, host, metodo, ruta, cuerpo=b''):
+    """Envía una solicitud HTTP/1.1 keep-alive y retorna (estado, JSON de respuesta)"""
+    writer.write(
+        f"{metodo} {ruta} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(cuerpo)}\r\n\r\n".encode('latin-1')
+        + cuerpo
+    )
+    await writer.drain()
+
+    cabecera = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    estado = int(cabecera[0].split(' ')[1])
+    longitud = 0
+    for linea in cabecera[1:]:
+        if linea.lower().startswith('content-length:'):
+            longitud = int(linea.split(':', 1)[1])
+    return estado, json.loads(await reader.readexactly(longitud))
+
+
+async def cliente(host, puerto, imagen, cola, latencias, estados):
+    reader, writer = await asyncio.open_connection(host, puerto)
+    try:
+        while True:
+            try:
+                cola.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            inicio = time.perf_counter()
+            estado, _ = await solicitar(reader, writer, host, 'POST', '/reconocer', imagen)
+            latencias.append(time.perf_counter() - inicio)
+            estados[estado] = estados.get(estado, 0) + 1
+    finally:
+        writer.close()
+
+
+async def ejecutar(args):
+    with open(args.imagen, 'rb') as f:
+        imagen = f.read()
+
+    cola = asyncio.Queue()
+    for i in range(args.solicitudes):
+        cola.put_nowait(i)
+
+    latencias = []
+    estados = {}
+    inicio = time.perf_counter()
+    await asyncio.gather(*(
+        cliente(args.host, args.puerto, imagen, cola, latencias, estados)
+        for _ in range(args.concurrencia)
+    ))
+    segundos = time.perf_counter() - inicio
+
+    reader, writer = await asyncio.open_connection(args.host, args.puerto)
+    _, metricas_servidor = await solicitar(reader, writer, args.host, 'GET', '/metricas')
+    writer.close()
+
+    resultados = {
+        'solicitudes': len(latencias),
+        'concurrencia': args.concurrencia,
+        'segundos': segundos,
+        'solicitudes_por_segundo': len(latencias) / segundos,
+        'p50_ms': 1000 * float(np.percentile(latencias, 50)),
+        'p99_ms': 1000 * float(np.percentile(latencias, 99)),
+        'estados': estados,
+        'servidor': metricas_servidor,
+    }
+    print(f"{resultados['solicitudes']} solicitudes en {segundos:.1f} s "
+          f"({resultados['solicitudes_por_segundo']:.1f}/s) con {args.concurrencia} conexiones")
+    print(f"Cliente: p50 {resultados['p50_ms']:.1f} ms, p99 {resultados['p99_ms']:.1f} ms, estados {estados}")
+    print(f"Servidor: p50 {metricas_servidor['p50_ms']:.1f} ms, p99 {metricas_servidor['p99_ms']:.1f} ms, "
+          f"lote medio {metricas_servidor['tamano_medio_lote']:.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('imagen', help='Imagen JPEG/PNG a enviar')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--solicitudes', type=int, default=1000)
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--json', help='Ruta donde guardar los resultados en JSON')
+    asyncio.run(ejecutar(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
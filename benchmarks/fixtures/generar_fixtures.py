@@ -0,0 +1,152 @@
+"""
+Genera las entradas fijas de los benchmarks a partir de retrato.png.
+
+El retrato (de las demos de Tk, ver LICENCIA_retrato.txt) se compone sobre
+fondos sintéticos a distintas escalas, posiciones, iluminaciones y con
+desenfoque o giro leve, de modo que la posición exacta de cada rostro es
+conocida y sirve de anotación:
+
+    imagenes/*.jpg              fotos fijas con 0 a 4 rostros
+    imagenes/anotaciones.json   {"archivo.jpg": [[top, right, bottom, left], ...]}
+    video.mp4                   clip de 45 frames (15 fps) con rostros en movimiento
+    video.json                  por frame, la lista de cajas
+
+Los archivos generados están versionados: solo hace falta volver a ejecutarlo
+si se cambian las escenas, y entonces los resultados dejan de ser comparables
+con los de commits anteriores.
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks.fixtures.generar_fixtures
+"""
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RUTA_RETRATO = os.path.join(DIRECTORIO, 'retrato.png')
+
+# Caja del rostro en retrato.png (top, right, bottom, left), de las cejas a la barbilla
+CAJA_RETRATO = (62, 114, 146, 30)
+
+TAMANO_IMAGEN = (480, 360)
+CALIDAD_JPEG = 85
+
+# Fotos fijas: lista de rostros (escala, centro x, centro y, opciones) por archivo
+ESCENAS = {
+    'un_rostro.jpg': [(1.6, 240, 180, {})],
+    'dos_rostros.jpg': [(1.0, 130, 170, {}), (1.3, 340, 190, {'voltear': True})],
+    'rostros_pequenos.jpg': [(0.7, 90, 120, {}), (0.7, 240, 230, {'voltear': True}), (0.75, 390, 130, {})],
+    'poca_luz.jpg': [(1.8, 250, 180, {'gamma': 2.2})],
+    'girado.jpg': [(1.4, 220, 175, {'angulo': 10, 'voltear': True})],
+    'desenfocado.jpg': [(1.2, 260, 170, {'desenfoque': 7})],
+    'cuatro_rostros.jpg': [(0.9, 90, 110, {}), (0.8, 360, 100, {'voltear': True}),
+                           (1.1, 120, 270, {'voltear': True}), (1.0, 370, 265, {})],
+    'sin_rostros.jpg': [],
+}
+
+FRAMES_VIDEO = 45
+FPS_VIDEO = 15
+
+
+def fondo(rng, ancho, alto):
+    """Fondo suave con manchas de color, que se comprime bien y no es uniforme"""
+    base = rng.uniform(40, 200, size=3)
+    x = np.linspace(0, 1, ancho)[None, :, None]
+    y = np.linspace(0, 1, alto)[:, None, None]
+    imagen = base + 50 * (x - 0.5) * rng.uniform(-1, 1, size=3) + 50 * (y - 0.5) * rng.uniform(-1, 1, size=3)
+    imagen = np.clip(imagen, 0, 255).astype(np.uint8)
+    for _ in range(8):
+        centro = (int(rng.integers(0, ancho)), int(rng.integers(0, alto)))
+        ejes = (int(rng.integers(20, 120)), int(rng.integers(20, 120)))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.ellipse(imagen, centro, ejes, float(rng.uniform(0, 180)), 0, 360, color, -1)
+    return cv2.GaussianBlur(imagen, (0, 0), 9)
+
+
+def pegar(imagen, retrato, escala, centro_x, centro_y, voltear=False, angulo=0.0, gamma=1.0, desenfoque=0):
+    """Pega el retrato con el rostro centrado en (centro_x, centro_y); retorna la caja del rostro"""
+    top, right, bottom, left = CAJA_RETRATO
+    if voltear:
+        retrato = cv2.flip(retrato, 1)
+        left, right = retrato.shape[1] - right, retrato.shape[1] - left
+    if angulo:
+        centro = (retrato.shape[1] / 2, retrato.shape[0] / 2)
+        matriz = cv2.getRotationMatrix2D(centro, angulo, 1.0)
+        retrato = cv2.warpAffine(retrato, matriz, (retrato.shape[1], retrato.shape[0]),
+                                 borderMode=cv2.BORDER_REFLECT)
+        # El rostro gira con la imagen: se desplaza la caja a su nuevo centro, mismo tamaño
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        nx, ny = matriz @ np.array([cx, cy, 1.0])
+        dx, dy = nx - cx, ny - cy
+        top, bottom, left, right = top + dy, bottom + dy, left + dx, right + dx
+
+    retrato = cv2.resize(retrato, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    if gamma != 1.0:
+        tabla = (255 * (np.arange(256) / 255) ** gamma).astype(np.uint8)
+        retrato = cv2.LUT(retrato, tabla)
+    if desenfoque:
+        retrato = cv2.GaussianBlur(retrato, (0, 0), desenfoque / 3)
+
+    # Origen del retrato para que el centro del rostro caiga en (centro_x, centro_y)
+    origen_x = int(round(centro_x - escala * (left + right) / 2))
+    origen_y = int(round(centro_y - escala * (top + bottom) / 2))
+    alto_imagen, ancho_imagen = imagen.shape[:2]
+    x0, y0 = max(0, origen_x), max(0, origen_y)
+    x1 = min(ancho_imagen, origen_x + retrato.shape[1])
+    y1 = min(alto_imagen, origen_y + retrato.shape[0])
+    imagen[y0:y1, x0:x1] = retrato[y0 - origen_y:y1 - origen_y, x0 - origen_x:x1 - origen_x]
+
+    caja = (origen_y + escala * top, origen_x + escala * right, origen_y + escala * bottom, origen_x + escala * left)
+    top, right, bottom, left = (int(round(v)) for v in caja)
+    return [max(0, top), min(ancho_imagen, right), min(alto_imagen, bottom), max(0, left)]
+
+
+def generar_imagenes(retrato):
+    directorio = os.path.join(DIRECTORIO, 'imagenes')
+    os.makedirs(directorio, exist_ok=True)
+    anotaciones = {}
+    for numero, (archivo, rostros) in enumerate(ESCENAS.items()):
+        rng = np.random.default_rng(numero)
+        imagen = fondo(rng, *TAMANO_IMAGEN)
+        anotaciones[archivo] = [pegar(imagen, retrato, escala, x, y, **opciones)
+                                for escala, x, y, opciones in rostros]
+        cv2.imwrite(os.path.join(directorio, archivo), imagen, [cv2.IMWRITE_JPEG_QUALITY, CALIDAD_JPEG])
+    with open(os.path.join(directorio, 'anotaciones.json'), 'w', encoding='utf-8') as f:
+        json.dump(anotaciones, f, indent=1)
+    return anotaciones
+
+
+def generar_video(retrato):
+    """Un rostro cruza la escena acercándose; un segundo entra a la mitad del clip"""
+    ancho, alto = TAMANO_IMAGEN
+    base = fondo(np.random.default_rng(100), ancho, alto)
+    escritor = cv2.VideoWriter(os.path.join(DIRECTORIO, 'video.mp4'),
+                               cv2.VideoWriter_fourcc(*'mp4v'), FPS_VIDEO, (ancho, alto))
+    cajas = []
+    for i in range(FRAMES_VIDEO):
+        t = i / (FRAMES_VIDEO - 1)
+        frame = base.copy()
+        cajas_frame = [pegar(frame, retrato, 1.1 + 0.4 * t, 100 + 160 * t, 180 + 12 * math.sin(6 * t))]
+        if i >= FRAMES_VIDEO // 2:
+            cajas_frame.append(pegar(frame, retrato, 0.9, 420 - 40 * (t - 0.5), 150, voltear=True))
+        escritor.write(frame)
+        cajas.append(cajas_frame)
+    escritor.release()
+    with open(os.path.join(DIRECTORIO, 'video.json'), 'w', encoding='utf-8') as f:
+        json.dump(cajas, f)
+    return cajas
+
+
+def main():
+    retrato = cv2.imread(RUTA_RETRATO)
+    anotaciones = generar_imagenes(retrato)
+    cajas = generar_video(retrato)
+    print(f"{len(anotaciones)} imágenes ({sum(map(len, anotaciones.values()))} rostros), "
+          f"video de {len(cajas)} frames")
+
+
+if __name__ == '__main__':
+    main()
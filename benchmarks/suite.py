@@ -0,0 +1,506 @@
+"""
+Suite de benchmarks por etapa del sistema.
+
+Mide cada etapa real del procesamiento sobre entradas fijas y galerías generadas
+de varios tamaños. Por defecto la entrada es el clip de benchmarks/fixtures/
+(rostros reales con sus cajas anotadas); con --video o --imagenes se usa otra,
+pero solo son comparables las ejecuciones con la misma entrada (ver 'huella'):
+
+    deteccion      detección de rostros (HOG) a varias escalas de reducción
+    codificacion   embeddings de 128 dimensiones de una caja ya localizada
+    galeria        búsqueda exacta e IVF con galerías de distintos tamaños
+    emociones      clasificador de emociones con lotes de 1, 4 y 16 rostros
+    seguimiento    seguidor de rostros frame a frame
+    overlay        anotación del frame y conversión para mostrarlo en Tk
+    presentacion   CPU del hilo de Tk por frame mostrado: PhotoImage nueva por
+                   frame frente a RenderizadorVista (requiere pantalla)
+    escritura_bd   registro de detecciones (escritor en lote y ORM síncrono)
+    reportes       reporte PDF de una persona (sin caché, caché fría y caliente)
+
+Las etapas cuyas dependencias no están instaladas (face_recognition,
+tensorflow) se marcan como omitidas. El resultado es un JSON que puede
+compararse con el de otro commit para detectar regresiones.
+
+Uso (desde la carpeta del proyecto):
+    python -m benchmarks.suite --json resultados.json
+    python -m benchmarks.suite --etapas galeria escritura_bd --comparar base.json --umbral 1.2
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from galeria import IndiceGaleria, IndiceIVF
+from benchmarks.benchmark_ann import generar_embeddings, generar_consultas
+
+ETAPAS = ['deteccion', 'codificacion', 'galeria', 'emociones', 'seguimiento',
+          'overlay', 'presentacion', 'escritura_bd', 'reportes']
+
+# Módulos que cada etapa necesita; los errores de importación de face_recognition
+# se registran dentro del reconocedor en lugar de propagarse, así que se
+# comprueban antes de medir para no cronometrar el camino de error
+DEPENDENCIAS = {
+    'deteccion': ['face_recognition'],
+    'codificacion': ['face_recognition'],
+    'seguimiento': ['face_recognition'],
+    'emociones': ['tensorflow'],
+}
+
+DIRECTORIO_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+VIDEO_FIXTURE = os.path.join(DIRECTORIO_FIXTURES, 'video.mp4')
+
+EMOCIONES = ['Enojo', 'Disgusto', 'Miedo', 'Felicidad', 'Tristeza', 'Sorpresa', 'Neutral']
+
+
+def medir(funcion, repeticiones, calentamiento=2):
+    """Ejecuta la función varias veces y retorna las estadísticas de tiempo en ms"""
+    for _ in range(calentamiento):
+        funcion()
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    tiempos = np.asarray(tiempos)
+    return {
+        'iteraciones': repeticiones,
+        'ms_media': float(tiempos.mean()),
+        'ms_p50': float(np.percentile(tiempos, 50)),
+        'ms_p95': float(np.percentile(tiempos, 95)),
+    }
+
+
+def _leer_json(ruta):
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def cargar_frames(args):
+    """
+    Frames de prueba del video o de la carpeta de imágenes, con las cajas anotadas si
+    las hay (`<video>.json` con una lista por frame, o `anotaciones.json` en la carpeta)
+
+    Returns:
+        tuple: (frames, cajas por frame o None, huella sha256 de los archivos leídos)
+    """
+    frames, cajas = [], []
+    huella = hashlib.sha256()
+    if args.imagenes:
+        anotaciones = _leer_json(os.path.join(args.imagenes, 'anotaciones.json')) or {}
+        for archivo in sorted(os.listdir(args.imagenes)):
+            ruta = os.path.join(args.imagenes, archivo)
+            frame = cv2.imread(ruta)
+            if frame is None:
+                continue
+            with open(ruta, 'rb') as f:
+                huella.update(f.read())
+            frames.append(frame)
+            cajas.append([tuple(caja) for caja in anotaciones.get(archivo, [])])
+            if len(frames) >= args.frames:
+                break
+        if not anotaciones:
+            cajas = None
+    else:
+        video = args.video or VIDEO_FIXTURE
+        with open(video, 'rb') as f:
+            huella.update(f.read())
+        cap = cv2.VideoCapture(video)
+        while len(frames) < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        anotaciones = _leer_json(os.path.splitext(video)[0] + '.json')
+        cajas = [[tuple(caja) for caja in anotaciones[i]] for i in range(len(frames))] if anotaciones else None
+
+    if not frames:
+        raise SystemExit("No se pudieron leer frames de prueba")
+    return frames, cajas, huella.hexdigest()[:16]
+
+
+def caja_central(frame, fraccion=0.4):
+    """Caja (top, right, bottom, left) centrada, para las etapas que parten de un rostro ya localizado"""
+    alto, ancho = frame.shape[:2]
+    lado = int(min(alto, ancho) * fraccion)
+    top, left = (alto - lado) // 2, (ancho - lado) // 2
+    return (top, left + lado, top + lado, left)
+
+
+def ciclo(frames):
+    """Función que retorna un frame distinto en cada llamada"""
+    estado = {'i': 0}
+
+    def siguiente():
+        frame = frames[estado['i'] % len(frames)]
+        estado['i'] += 1
+        return frame
+    return siguiente
+
+
+class Contexto:
+    """Recursos compartidos entre etapas (base temporal, reconocedor, analizador)"""
+
+    def __init__(self, args, directorio):
+        self.args = args
+        self.directorio = directorio
+        self.frames, self.cajas, self.huella = cargar_frames(args)
+        self._db = None
+        self._reconocedor = None
+        self._analizador = None
+
+    def rostros(self):
+        """Pares (frame, caja) de los frames con algún rostro; sin anotaciones, una caja central"""
+        if self.cajas is not None:
+            rostros = [(frame, cajas[0]) for frame, cajas in zip(self.frames, self.cajas) if cajas]
+            if rostros:
+                return rostros
+        return [(frame, caja_central(frame)) for frame in self.frames]
+
+    @property
+    def db(self):
+        if self._db is None:
+            from database import DatabaseManager
+            self._db = DatabaseManager(os.path.join(self.directorio, 'suite.db'))
+        return self._db
+
+    @property
+    def reconocedor(self):
+        if self._reconocedor is None:
+            from face_recognizer import ReconocedorFacial
+            self._reconocedor = ReconocedorFacial(self.db, ruta_instantanea=False)
+            self._reconocedor.precargar()
+        return self._reconocedor
+
+    @property
+    def analizador(self):
+        if self._analizador is None:
+            from emotion_analyzer import AnalizadorEmocionesFER
+            self._analizador = AnalizadorEmocionesFER()
+            self._analizador.precargar()
+        return self._analizador
+
+
+def etapa_deteccion(ctx):
+    siguiente = ciclo(ctx.frames)
+    resultados = {}
+    for escala in ctx.args.escalas:
+        resultados[f'escala_{escala}'] = medir(lambda: ctx.reconocedor.detectar_rostros(siguiente(), escala),
+                                               ctx.args.repeticiones)
+    return resultados
+
+
+def etapa_codificacion(ctx):
+    siguiente = ciclo(ctx.rostros())
+
+    def codificar():
+        frame, caja = siguiente()
+        return ctx.reconocedor.codificar_rostros(frame, [caja])
+    return {'un_rostro': medir(codificar, ctx.args.repeticiones)}
+
+
+def etapa_galeria(ctx):
+    rng = np.random.default_rng(ctx.args.semilla)
+    resultados = {}
+    for tamano in ctx.args.galerias:
+        # Misma galería sintética que benchmark_ann: las listas del IVF tienen tamaños realistas
+        embeddings, base = generar_embeddings(tamano, 128, min(500, tamano), rng)
+        ids = np.arange(1, tamano + 1)
+        consultas = generar_consultas(embeddings, base, 4, 0.4, rng)
+
+        exacto = IndiceGaleria()
+        exacto.reconstruir(ids, embeddings)
+        resultados[f'exacto_{tamano}'] = medir(lambda: exacto.buscar(consultas), ctx.args.repeticiones * 5)
+
+        if tamano >= 10000:
+            ivf = IndiceIVF(min_entrenamiento=1, semilla=ctx.args.semilla)
+            ivf.reconstruir(ids, embeddings)
+            resultados[f'ivf_{tamano}'] = medir(lambda: ivf.buscar(consultas), ctx.args.repeticiones * 5)
+    return resultados
+
+
+def etapa_emociones(ctx):
+    frame, caja = ctx.rostros()[0]
+    resultados = {}
+    for rostros in (1, 4, 16):
+        resultados[f'lote_{rostros}'] = medir(
+            lambda: ctx.analizador.predecir_emociones_lote([frame] * rostros, [[caja]] * rostros),
+            ctx.args.repeticiones
+        )
+    return resultados
+
+
+def etapa_seguimiento(ctx):
+    from seguimiento import SeguidorRostros
+    seguidor = SeguidorRostros(ctx.reconocedor)
+    siguiente = ciclo(ctx.frames)
+    return {'por_frame': medir(lambda: seguidor.procesar(siguiente()), ctx.args.repeticiones * 3)}
+
+
+def etapa_overlay(ctx):
+    from PIL import Image
+    frame, caja = ctx.rostros()[0]
+
+    def anotar():
+        procesado = frame.copy()
+        top, right, bottom, left = caja
+        cv2.rectangle(procesado, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(procesado, "Persona", (left, top - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.putText(procesado, "Felicidad (90.0%)", (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        return procesado
+
+    def convertir():
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    return {
+        'anotacion': medir(anotar, ctx.args.repeticiones * 5),
+        'conversion_tk': medir(convertir, ctx.args.repeticiones * 5),
+    }
+
+
+def etapa_presentacion(ctx):
+    import tkinter as tk
+    from tkinter import ttk
+    from PIL import Image, ImageTk
+    from presentacion import RenderizadorVista
+
+    try:
+        raiz = tk.Tk()
+    except tk.TclError as e:
+        return {'omitida': f"sin pantalla: {e}"}
+
+    resultados = {}
+    try:
+        contenedor = ttk.Frame(raiz)
+        contenedor.pack()
+        label = ttk.Label(contenedor)
+        label.pack()
+        raiz.update()
+
+        def medir_cpu(mostrar, frames):
+            for frame in frames[:3]:
+                mostrar(frame)
+                raiz.update_idletasks()
+            tiempos = []
+            for frame in frames:
+                inicio = time.thread_time()
+                mostrar(frame)
+                raiz.update_idletasks()
+                tiempos.append((time.thread_time() - inicio) * 1000)
+            return {'iteraciones': len(tiempos), 'ms_cpu_media': float(np.mean(tiempos)),
+                    'ms_cpu_p95': float(np.percentile(tiempos, 95))}
+
+        def anterior(frame):
+            img_tk = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+            label.img_tk = img_tk
+            label.config(image=img_tk)
+
+        renderizador = RenderizadorVista(label, 'suite', fps_maximo=1000)
+        rng = np.random.default_rng(ctx.args.semilla)
+        for alto, ancho in ((480, 640), (720, 1280)):
+            frames = [rng.integers(0, 256, size=(alto, ancho, 3), dtype=np.uint8)
+                      for _ in range(ctx.args.repeticiones * 2)]
+            resultados[f'photoimage_nueva_{ancho}x{alto}'] = medir_cpu(anterior, frames)
+            resultados[f'renderizador_{ancho}x{alto}'] = medir_cpu(
+                lambda frame: renderizador.mostrar(frame, forzar=True), frames)
+    finally:
+        raiz.destroy()
+    return resultados
+
+
+def _generar_personas(db, cantidad):
+    rng = np.random.default_rng(0)
+    existentes = len(db.obtener_todas_personas())
+    for i in range(existentes, cantidad):
+        db.registrar_persona(f"Nombre{i}", f"Apellido{i}", f"persona{i}@suite.local",
+                             rng.normal(size=128).astype(np.float32))
+
+
+def etapa_escritura_bd(ctx):
+    db = ctx.db
+    _generar_personas(db, 20)
+    rng = random.Random(ctx.args.semilla)
+    filas = ctx.args.filas_bd
+
+    escritor = db.crear_escritor_detecciones()
+    inicio = time.perf_counter()
+    for _ in range(filas):
+        escritor.registrar(rng.randint(1, 20), rng.choice(EMOCIONES), rng.random(), timeout=None)
+    encolado = time.perf_counter() - inicio
+    escritor.cerrar()
+    total = time.perf_counter() - inicio
+
+    sincronas = max(1, filas // 50)
+    inicio_sincrono = time.perf_counter()
+    for _ in range(sincronas):
+        db.registrar_deteccion(rng.randint(1, 20), rng.choice(EMOCIONES), rng.random())
+    sincrono = time.perf_counter() - inicio_sincrono
+
+    return {
+        'escritor_lote': {
+            'filas': filas,
+            'us_encolar_por_fila': 1e6 * encolado / filas,
+            'filas_por_segundo': filas / total,
+        },
+        'orm_sincrono': {
+            'filas': sincronas,
+            'ms_por_fila': 1000 * sincrono / sincronas,
+        },
+    }
+
+
+def etapa_reportes(ctx):
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    from report_generator import GeneradorReportes
+    from cache_reportes import CacheReportes
+
+    db = ctx.db
+    _generar_personas(db, 20)
+    escritor = db.crear_escritor_detecciones()
+    rng = random.Random(ctx.args.semilla)
+    ahora = datetime.now()
+    for _ in range(20000):
+        escritor.registrar(1, rng.choice(EMOCIONES), rng.random(),
+                           ahora - timedelta(seconds=rng.randint(0, 60 * 86400)), timeout=None)
+    escritor.cerrar()
+
+    salida = os.path.join(ctx.directorio, 'reporte.pdf')
+    sin_cache = GeneradorReportes(db)
+    resultados = {'sin_cache': medir(lambda: sin_cache.generar_reporte_persona(1, salida),
+                                     max(3, ctx.args.repeticiones // 5), calentamiento=1)}
+
+    directorio_cache = os.path.join(ctx.directorio, 'cache')
+    con_cache = GeneradorReportes(db, CacheReportes(directorio_cache))
+    inicio = time.perf_counter()
+    con_cache.generar_reporte_persona(1, salida)
+    resultados['cache_fria'] = {'iteraciones': 1, 'ms_media': 1000 * (time.perf_counter() - inicio)}
+    resultados['cache_caliente'] = medir(lambda: con_cache.generar_reporte_persona(1, salida),
+                                         ctx.args.repeticiones, calentamiento=0)
+    return resultados
+
+
+def ejecutar_etapas(ctx, etapas):
+    resultados = {}
+    for nombre in etapas:
+        funcion = globals()[f'etapa_{nombre}']
+        print(f"[{nombre}]")
+        faltantes = [m for m in DEPENDENCIAS.get(nombre, []) if importlib.util.find_spec(m) is None]
+        try:
+            if faltantes:
+                raise ImportError(f"No module named '{faltantes[0]}'")
+            resultados[nombre] = funcion(ctx)
+        except ImportError as e:
+            # Dependencia opcional no instalada: la etapa queda registrada como omitida
+            resultados[nombre] = {'omitida': str(e)}
+        for caso, medida in resultados[nombre].items():
+            print(f"  {caso:<20} {json.dumps(medida) if isinstance(medida, dict) else medida}")
+    return resultados
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, base, umbral):
+    """
+    Compara los ms medios caso por caso; retorna la lista de regresiones
+    (casos cuyo tiempo creció más que el umbral)
+    """
+    regresiones = []
+    print(f"Comparación con {base.get('commit') or 'base'} (umbral {umbral:.2f}x):")
+    huella, huella_base = actual['entradas'].get('huella'), base.get('entradas', {}).get('huella')
+    if huella != huella_base:
+        print(f"  AVISO: entradas distintas ({huella_base} -> {huella}); los tiempos no son comparables")
+    for etapa, casos in actual['etapas'].items():
+        for caso, medida in casos.items():
+            anterior = base.get('etapas', {}).get(etapa, {}).get(caso)
+            if not isinstance(medida, dict) or not isinstance(anterior, dict):
+                continue
+            if 'ms_media' not in medida or not anterior.get('ms_media'):
+                continue
+            razon = medida['ms_media'] / anterior['ms_media']
+            marca = "  REGRESIÓN" if razon > umbral else ""
+            print(f"  {etapa}.{caso:<20} {anterior['ms_media']:>9.3f} -> {medida['ms_media']:>9.3f} ms "
+                  f"({razon:.2f}x){marca}")
+            if razon > umbral:
+                regresiones.append(f"{etapa}.{caso}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=ETAPAS)
+    parser.add_argument('--video', help='Video de prueba (por defecto, benchmarks/fixtures/video.mp4)')
+    parser.add_argument('--imagenes', help='Carpeta de imágenes de prueba (con anotaciones.json opcional)')
+    parser.add_argument('--frames', type=int, default=45, help='Frames de prueba a usar')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--escalas', type=float, nargs='+', default=[0.25, 0.5, 1.0],
+                        help='Escalas de reducción para la detección')
+    parser.add_argument('--galerias', type=int, nargs='+', default=[100, 10000, 100000],
+                        help='Tamaños de galería generados')
+    parser.add_argument('--filas-bd', type=int, default=50000, help='Detecciones a escribir en la etapa de BD')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', help='Ruta donde guardar los resultados')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior para comparar')
+    parser.add_argument('--umbral', type=float, default=1.2, help='Razón de tiempo que se considera regresión')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ctx = Contexto(args, directorio)
+        resultados = {
+            'version': 1,
+            'commit': commit_actual(),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'entorno': {
+                'python': platform.python_version(),
+                'plataforma': platform.platform(),
+                'procesadores': os.cpu_count(),
+                'numpy': np.__version__,
+                'opencv': cv2.__version__,
+            },
+            'entradas': {
+                'video': None if args.imagenes else (args.video or 'benchmarks/fixtures/video.mp4'),
+                'imagenes': args.imagenes,
+                'huella': ctx.huella,
+                'frames': len(ctx.frames),
+                'rostros_anotados': sum(map(len, ctx.cajas)) if ctx.cajas is not None else None,
+                'resolucion': list(ctx.frames[0].shape[:2]),
+            },
+            'etapas': ejecutar_etapas(ctx, args.etapas),
+        }
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            regresiones = comparar(resultados, json.load(f), args.umbral)
+        if regresiones:
+            print(f"{len(regresiones)} regresiones: {', '.join(regresiones)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
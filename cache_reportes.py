@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar el diseño o el formato de las páginas para no reutilizar las viejas
+VERSION_CACHE = 2
+
+
+class CacheReportes:
+    """
+    Caché en disco direccionada por contenido para las páginas de los reportes.
+
+    Cada entrada es un archivo cuyo nombre es el hash de sus entradas (tipo de
+    página y datos con los que se dibujó), de modo que una página solo se vuelve
+    a renderizar si cambian sus datos. El tamaño total está acotado: al superarlo
+    se eliminan las entradas usadas hace más tiempo (LRU por fecha de modificación,
+    que se actualiza en cada acierto).
+    """
+
+    def __init__(self, directorio='cache_reportes', tamano_maximo=200 * 1024 * 1024):
+        self.directorio = directorio
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._tamano = sum(tamano for _, _, tamano in self._entradas())
+
+    @staticmethod
+    def clave(*partes):
+        """Hash estable de las entradas de una página (cualquier dato serializable a JSON)"""
+        contenido = json.dumps([VERSION_CACHE, *partes], default=str, ensure_ascii=False)
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave)
+
+    def _entradas(self):
+        """Lista (ruta, último uso, tamaño) de las entradas en disco"""
+        entradas = []
+        with os.scandir(self.directorio) as iterador:
+            for entrada in iterador:
+                if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                    estado = entrada.stat()
+                    entradas.append((entrada.path, estado.st_mtime, estado.st_size))
+        return entradas
+
+    def obtener(self, clave):
+        """Retorna los bytes guardados para la clave o None si no están en caché"""
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            os.utime(ruta)
+            self.aciertos += 1
+            return datos
+        except OSError:
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, datos):
+        """Guarda los bytes de forma atómica y aplica el límite de tamaño"""
+        ruta = self._ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar en la caché de reportes: {str(e)}")
+            return
+
+        with self._lock:
+            self._tamano += len(datos)
+            if self._tamano > self.tamano_maximo:
+                self._recortar()
+
+    def _recortar(self):
+        """Elimina las entradas menos usadas hasta quedar en el 90% del límite"""
+        entradas = sorted(self._entradas(), key=lambda entrada: entrada[1])
+        self._tamano = sum(tamano for _, _, tamano in entradas)
+        objetivo = self.tamano_maximo * 0.9
+        eliminadas = 0
+
+        for ruta, _, tamano in entradas:
+            if self._tamano <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                eliminadas += 1
+            except OSError:
+                # Otro proceso pudo eliminarla o tenerla abierta
+                pass
+            self._tamano -= tamano
+
+        logger.info(f"Caché de reportes recortada: {eliminadas} entradas eliminadas")
+
+    def tamano(self):
+        return self._tamano
@@ -1,12 +1,45 @@
 import sqlalchemy as db
-from sqlalchemy import Column, Integer, String, DateTime, Float, LargeBinary, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import Column, Integer, String, DateTime, Float, LargeBinary, ForeignKey, Index, func, select
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship, deferred
+from sqlalchemy.dialects.sqlite import insert as insertar_sqlite
 from datetime import datetime, timedelta
+from collections import namedtuple
 import numpy as np
+import argparse
 import pickle
+import struct
+import queue
+import threading
+import time
+import logging
+from metricas import cronometrado
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+# Formato binario de los embeddings: cabecera (firma, versión, dimensión) + float32 little-endian
+FIRMA_EMBEDDING = b'EMB'
+VERSION_EMBEDDING = 1
+CABECERA_EMBEDDING = struct.Struct('<3sBH')
+
+# Datos mínimos de una persona para la galería de reconocimiento
+PersonaGaleria = namedtuple('PersonaGaleria', ['id', 'nombre', 'apellido'])
+
+def serializar_embedding(embedding):
+    """Serializa un embedding como cabecera + float32 little-endian"""
+    vector = np.asarray(embedding, dtype='<f4').ravel()
+    return CABECERA_EMBEDDING.pack(FIRMA_EMBEDDING, VERSION_EMBEDDING, len(vector)) + vector.tobytes()
+
+def deserializar_embedding(datos):
+    """Decodifica un embedding serializado con serializar_embedding"""
+    firma, version, dimension = CABECERA_EMBEDDING.unpack_from(datos)
+    if firma != FIRMA_EMBEDDING or version != VERSION_EMBEDDING:
+        raise ValueError("Formato de embedding desconocido")
+    if len(datos) != CABECERA_EMBEDDING.size + 4 * dimension:
+        raise ValueError("Longitud de embedding inconsistente con su dimensión")
+    return np.frombuffer(datos, dtype='<f4', offset=CABECERA_EMBEDDING.size)
+
 class Persona(Base):
     __tablename__ = 'personas'
     
@@ -15,7 +48,8 @@ class Persona(Base):
     apellido = Column(String(100), nullable=False)
     email = Column(String(150), unique=True, nullable=False)
     fecha_registro = Column(DateTime, default=datetime.now)
-    embedding_facial = Column(LargeBinary, nullable=False)
+    # Diferido: listar personas no carga los embeddings
+    embedding_facial = deferred(Column(LargeBinary, nullable=False))
     detecciones = relationship("DeteccionEmocion", back_populates="persona")
 
 class DeteccionEmocion(Base):
@@ -27,13 +61,305 @@ class DeteccionEmocion(Base):
     confianza = Column(Float, nullable=False)
     fecha_deteccion = Column(DateTime, default=datetime.now)
     persona = relationship("Persona", back_populates="detecciones")
+    
+    # Índices para el historial por persona y para los filtros por rango de fechas
+    __table_args__ = (
+        Index('ix_detecciones_persona_fecha', 'persona_id', 'fecha_deteccion'),
+        Index('ix_detecciones_fecha', 'fecha_deteccion'),
+    )
+
+class ResumenEmocion(Base):
+    """
+    Resumen incremental de detecciones por persona, emoción y periodo (hora o día).
+    Se actualiza en la misma transacción que inserta las detecciones. Las detecciones
+    sin persona se resumen con persona_id PERSONA_DESCONOCIDA (NULL no puede ser parte
+    de la clave del upsert), así los totales coinciden con la tabla de detecciones.
+    """
+    __tablename__ = 'resumen_emociones'
+    
+    granularidad = Column(String(4), primary_key=True)  # 'hora' o 'dia'
+    periodo = Column(DateTime, primary_key=True)         # inicio de la hora o del día
+    persona_id = Column(Integer, primary_key=True)
+    emocion = Column(String(50), primary_key=True)
+    conteo = Column(Integer, nullable=False, default=0)
+    suma_confianza = Column(Float, nullable=False, default=0.0)
+    primera_deteccion = Column(DateTime, nullable=False)
+    ultima_deteccion = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_resumen_persona_periodo', 'granularidad', 'persona_id', 'periodo'),
+    )
+
+# persona_id de los resúmenes de detecciones sin persona (los ids de personas empiezan en 1)
+PERSONA_DESCONOCIDA = 0
+
+# Inicio del periodo de cada granularidad del resumen
+GRANULARIDADES_RESUMEN = {
+    'hora': lambda fecha: fecha.replace(minute=0, second=0, microsecond=0),
+    'dia': lambda fecha: fecha.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+def acumular_resumenes(conexion, detecciones):
+    """
+    Suma un lote de detecciones a los resúmenes por hora y por día (upsert).
+    
+    Args:
+        conexion: Connection o Session con la transacción en curso
+        detecciones: dicts con persona_id, emocion, confianza y fecha_deteccion
+    """
+    acumulados = {}
+    for deteccion in detecciones:
+        fecha = deteccion['fecha_deteccion']
+        persona_id = deteccion['persona_id']
+        if persona_id is None:
+            persona_id = PERSONA_DESCONOCIDA
+        for granularidad, inicio_periodo in GRANULARIDADES_RESUMEN.items():
+            clave = (granularidad, inicio_periodo(fecha), persona_id, deteccion['emocion'])
+            acumulado = acumulados.get(clave)
+            if acumulado is None:
+                acumulados[clave] = [1, deteccion['confianza'], fecha, fecha]
+            else:
+                acumulado[0] += 1
+                acumulado[1] += deteccion['confianza']
+                acumulado[2] = min(acumulado[2], fecha)
+                acumulado[3] = max(acumulado[3], fecha)
+    
+    if not acumulados:
+        return
+    
+    tabla = ResumenEmocion.__table__
+    sentencia = insertar_sqlite(tabla)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=[tabla.c.granularidad, tabla.c.periodo, tabla.c.persona_id, tabla.c.emocion],
+        set_={
+            'conteo': tabla.c.conteo + sentencia.excluded.conteo,
+            'suma_confianza': tabla.c.suma_confianza + sentencia.excluded.suma_confianza,
+            'primera_deteccion': func.min(tabla.c.primera_deteccion, sentencia.excluded.primera_deteccion),
+            'ultima_deteccion': func.max(tabla.c.ultima_deteccion, sentencia.excluded.ultima_deteccion),
+        }
+    )
+    conexion.execute(sentencia, [
+        {
+            'granularidad': granularidad,
+            'periodo': periodo,
+            'persona_id': persona_id,
+            'emocion': emocion,
+            'conteo': conteo,
+            'suma_confianza': suma_confianza,
+            'primera_deteccion': primera,
+            'ultima_deteccion': ultima
+        }
+        for (granularidad, periodo, persona_id, emocion), (conteo, suma_confianza, primera, ultima)
+        in acumulados.items()
+    ])
+    incrementar_version_resumenes(conexion)
+
+def incrementar_version_resumenes(conexion):
+    """Marca de agua de los resúmenes: cambia cada vez que se les suman detecciones"""
+    tabla = MetadatoSistema.__table__
+    sentencia = insertar_sqlite(tabla).values(clave='version_resumenes', valor=1)
+    conexion.execute(sentencia.on_conflict_do_update(
+        index_elements=[tabla.c.clave],
+        set_={'valor': tabla.c.valor + 1}
+    ))
+
+class MetadatoSistema(Base):
+    __tablename__ = 'metadatos_sistema'
+    
+    clave = Column(String(50), primary_key=True)
+    valor = Column(Integer, nullable=False, default=0)
+
+class EscritorDetecciones:
+    """
+    Registro asíncrono (write-behind) de detecciones de emociones.
+    
+    Las detecciones se encolan en memoria y un hilo las inserta en lote con una
+    única sentencia executemany por transacción, cuando se acumulan `tamano_lote`
+    filas o pasan `intervalo_vaciado` segundos. Si la cola se llena, registrar()
+    espera hasta `timeout` (contrapresión) y luego descarta la detección.
+    """
+    
+    _FIN = object()
+    
+    def __init__(self, engine, tamano_lote=500, intervalo_vaciado=1.0, capacidad=10000):
+        self.engine = engine
+        self.tamano_lote = tamano_lote
+        self.intervalo_vaciado = intervalo_vaciado
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._cerrado = False
+        # Protege _cerrado, _encolando y los contadores. El put bloqueante ocurre fuera
+        # del lock; cerrar() espera a los registrar() en curso antes de encolar la
+        # marca de fin, de modo que nada queda detrás de ella
+        self._lock = threading.Condition()
+        self._encolando = 0
+        self.escritas = 0
+        self.descartadas = 0
+        self.lotes = 0
+        self._hilo = threading.Thread(target=self._ejecutar, name="escritor-detecciones", daemon=True)
+        self._hilo.start()
+    
+    def registrar(self, persona_id, emocion, confianza, fecha=None, timeout=1.0):
+        """Encola una detección; retorna False si se descartó por cola llena o escritor cerrado"""
+        fila = {
+            'persona_id': persona_id,
+            'emocion': emocion,
+            'confianza': float(confianza),
+            'fecha_deteccion': fecha or datetime.now()
+        }
+        with self._lock:
+            if self._cerrado:
+                return False
+            self._encolando += 1
+        try:
+            self._cola.put(fila, timeout=timeout)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.descartadas += 1
+            logger.warning("Cola de detecciones llena: detección descartada")
+            return False
+        finally:
+            with self._lock:
+                self._encolando -= 1
+                self._lock.notify_all()
+    
+    def pendientes(self):
+        """Número de detecciones en cola aún no escritas"""
+        return self._cola.qsize()
+    
+    def cerrar(self, timeout=10.0):
+        """
+        Deja de aceptar detecciones, escribe todas las pendientes y detiene el hilo,
+        esperando en total hasta `timeout` segundos
+        """
+        limite = time.monotonic() + timeout
+        with self._lock:
+            if self._cerrado:
+                return
+            self._cerrado = True
+            self._lock.wait_for(lambda: self._encolando == 0, timeout=timeout)
+        try:
+            self._cola.put(self._FIN, timeout=max(0.0, limite - time.monotonic()))
+        except queue.Full:
+            logger.error("Escritor de detecciones sin vaciar la cola: se cierra sin esperar al hilo")
+            return
+        self._hilo.join(timeout=max(0.0, limite - time.monotonic()))
+        logger.info(
+            f"Escritor de detecciones cerrado: {self.escritas} escritas en {self.lotes} lotes, "
+            f"{self.descartadas} descartadas"
+        )
+    
+    def _ejecutar(self):
+        lote = []
+        limite = time.monotonic() + self.intervalo_vaciado
+        terminar = False
+        
+        while not terminar:
+            try:
+                fila = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                # Tomar sin esperar lo que ya esté encolado, hasta completar el lote
+                while fila is not self._FIN:
+                    lote.append(fila)
+                    if len(lote) >= self.tamano_lote:
+                        break
+                    fila = self._cola.get_nowait()
+                terminar = fila is self._FIN
+            except queue.Empty:
+                pass
+            
+            if lote and (terminar or len(lote) >= self.tamano_lote or time.monotonic() >= limite):
+                self._escribir(lote)
+                lote = []
+            
+            if time.monotonic() >= limite:
+                limite = time.monotonic() + self.intervalo_vaciado
+    
+    @cronometrado('escritura_lote_segundos', 'Inserción de un lote de detecciones')
+    def _escribir(self, lote):
+        try:
+            with self.engine.begin() as conexion:
+                conexion.execute(db.insert(DeteccionEmocion.__table__), lote)
+                acumular_resumenes(conexion, lote)
+            self.escritas += len(lote)
+            self.lotes += 1
+        except Exception as e:
+            with self._lock:
+                self.descartadas += len(lote)
+            logger.error(f"Error al escribir lote de detecciones: {str(e)}")
 
 class DatabaseManager:
     def __init__(self, db_path='facial_emotion_system.db'):
+        self.db_path = db_path
         self.engine = db.create_engine(f'sqlite:///{db_path}')
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        self.crear_indices()
+        # Sesión por hilo: el pipeline de detección registra desde sus trabajadores.
+        # expire_on_commit=False mantiene usables los objetos cacheados por el reconocedor.
+        Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.session = scoped_session(Session)
+        self.migrar_embeddings()
+        self._completar_resumenes()
+    
+    def crear_indices(self):
+        """Crea los índices que falten en tablas ya existentes (create_all no los agrega)"""
+        for tabla in Base.metadata.sorted_tables:
+            for indice in tabla.indexes:
+                indice.create(self.engine, checkfirst=True)
+    
+    def obtener_version_galeria(self):
+        """Versión de la tabla de personas; cambia con cada alta, baja o migración"""
+        version = self.session.execute(
+            select(MetadatoSistema.valor).where(MetadatoSistema.clave == 'version_galeria')
+        ).scalar_one_or_none()
+        return version or 0
+    
+    def obtener_version_datos(self):
+        """
+        Versión conjunta de personas y resúmenes de emociones, para invalidar cachés
+        
+        Returns:
+            tuple: (versión de la galería, versión de los resúmenes)
+        """
+        versiones = dict(self.session.execute(
+            select(MetadatoSistema.clave, MetadatoSistema.valor)
+            .where(MetadatoSistema.clave.in_(['version_galeria', 'version_resumenes']))
+        ).all())
+        return versiones.get('version_galeria', 0), versiones.get('version_resumenes', 0)
+    
+    def _incrementar_version_galeria(self):
+        """Incrementa la versión de la galería dentro de la transacción en curso"""
+        metadato = self.session.get(MetadatoSistema, 'version_galeria')
+        if metadato is None:
+            self.session.add(MetadatoSistema(clave='version_galeria', valor=1))
+        else:
+            metadato.valor += 1
+    
+    def migrar_embeddings(self):
+        """Convierte al formato binario los embeddings guardados con pickle (versiones anteriores)"""
+        try:
+            heredados = self.session.execute(
+                select(Persona.id, Persona.embedding_facial)
+                .where(func.substr(Persona.embedding_facial, 1, len(FIRMA_EMBEDDING)) != FIRMA_EMBEDDING)
+            ).all()
+            if not heredados:
+                return 0
+            
+            # Única deserialización con pickle: datos escritos por la propia aplicación
+            for persona_id, datos in heredados:
+                self.session.execute(
+                    db.update(Persona)
+                    .where(Persona.id == persona_id)
+                    .values(embedding_facial=serializar_embedding(pickle.loads(datos)))
+                )
+            self._incrementar_version_galeria()
+            self.session.commit()
+            logger.info(f"{len(heredados)} embeddings migrados al formato binario")
+            return len(heredados)
+            
+        except Exception as e:
+            self.session.rollback()
+            logger.error(f"Error al migrar embeddings: {str(e)}")
+            return 0
     
     def registrar_persona(self, nombre, apellido, email, embedding):
         """Registra una nueva persona en la base de datos"""
@@ -43,7 +369,7 @@ class DatabaseManager:
                 return False, "El email ya está registrado"
             
             # Serializar el embedding (array numpy) a bytes
-            embedding_bytes = pickle.dumps(embedding)
+            embedding_bytes = serializar_embedding(embedding)
             
             nueva_persona = Persona(
                 nombre=nombre,
@@ -53,6 +379,7 @@ class DatabaseManager:
             )
             
             self.session.add(nueva_persona)
+            self._incrementar_version_galeria()
             self.session.commit()
             return True, "Persona registrada exitosamente"
             
@@ -74,20 +401,86 @@ class DatabaseManager:
     
     def obtener_embedding_persona(self, persona_id):
         """Obtiene y deserializa el embedding de una persona"""
-        persona = self.session.query(Persona).filter_by(id=persona_id).first()
-        if persona and persona.embedding_facial:
-            return pickle.loads(persona.embedding_facial)
+        datos = self.session.execute(
+            select(Persona.embedding_facial).where(Persona.id == persona_id)
+        ).scalar_one_or_none()
+        if datos:
+            return deserializar_embedding(datos)
         return None
     
+    def cargar_galeria(self):
+        """
+        Carga todas las personas con sus embeddings en una sola consulta de columnas
+        
+        Returns:
+            tuple: (lista de PersonaGaleria, array de ids, matriz float32 personas x dimensión)
+        """
+        filas = self.session.execute(
+            select(Persona.id, Persona.nombre, Persona.apellido, Persona.embedding_facial)
+            .order_by(Persona.id)
+        ).all()
+        
+        if not filas:
+            return [], np.zeros(0, dtype=np.int64), np.zeros((0, 128), dtype=np.float32)
+        
+        _, _, dimension = CABECERA_EMBEDDING.unpack_from(filas[0][3])
+        tamano = CABECERA_EMBEDDING.size + 4 * dimension
+        
+        personas = []
+        datos = []
+        for persona_id, nombre, apellido, embedding in filas:
+            if len(embedding) != tamano or not embedding.startswith(FIRMA_EMBEDDING):
+                logger.warning(f"Embedding inválido para la persona {persona_id}: omitido")
+                continue
+            personas.append(PersonaGaleria(persona_id, nombre, apellido))
+            datos.append(embedding)
+        
+        # Todas las filas tienen el mismo tamaño: se decodifican juntas en una matriz
+        bloque = np.frombuffer(b''.join(datos), dtype=np.uint8).reshape(len(datos), tamano)
+        matriz = bloque[:, CABECERA_EMBEDDING.size:].copy().view('<f4')
+        ids = np.fromiter((persona.id for persona in personas), dtype=np.int64, count=len(personas))
+        
+        return personas, ids, matriz
+    
+    def eliminar_persona(self, persona_id):
+        """Elimina una persona y su historial de detecciones"""
+        try:
+            persona = self.session.query(Persona).filter_by(id=persona_id).first()
+            if not persona:
+                return False, "Persona no encontrada"
+            
+            self.session.query(DeteccionEmocion).filter_by(persona_id=persona_id).delete()
+            self.session.query(ResumenEmocion).filter_by(persona_id=persona_id).delete()
+            self.session.delete(persona)
+            self._incrementar_version_galeria()
+            self.session.commit()
+            return True, "Persona eliminada exitosamente"
+            
+        except Exception as e:
+            self.session.rollback()
+            return False, f"Error al eliminar persona: {str(e)}"
+    
+    def crear_escritor_detecciones(self, **kwargs):
+        """Crea un escritor asíncrono de detecciones sobre esta base de datos"""
+        return EscritorDetecciones(self.engine, **kwargs)
+    
+    @cronometrado('registro_deteccion_segundos', 'Registro síncrono de una detección')
     def registrar_deteccion(self, persona_id, emocion, confianza):
         """Registra una detección de emoción en el historial"""
         try:
             nueva_deteccion = DeteccionEmocion(
                 persona_id=persona_id,
                 emocion=emocion,
-                confianza=confianza
+                confianza=confianza,
+                fecha_deteccion=datetime.now()
             )
             self.session.add(nueva_deteccion)
+            acumular_resumenes(self.session, [{
+                'persona_id': persona_id,
+                'emocion': emocion,
+                'confianza': confianza,
+                'fecha_deteccion': nueva_deteccion.fecha_deteccion
+            }])
             self.session.commit()
             return True
         except Exception as e:
@@ -95,29 +488,280 @@ class DatabaseManager:
             print(f"Error al registrar detección: {e}")
             return False
     
+    def _filtrar_detecciones(self, query, persona_id=None, dias=None):
+        """Aplica los filtros comunes por persona y por antigüedad en días"""
+        if persona_id:
+            query = query.where(DeteccionEmocion.persona_id == persona_id)
+        
+        if dias is not None:
+            fecha_limite = datetime.now() - timedelta(days=dias)
+            query = query.where(DeteccionEmocion.fecha_deteccion >= fecha_limite)
+        
+        return query
+    
     def obtener_historial_emociones(self, persona_id=None, dias=30):
-        """Obtiene el historial de emociones, filtrado por persona y días"""
-        query = self.session.query(DeteccionEmocion)
+        """
+        Obtiene el historial de emociones en orden cronológico, filtrado por persona y días.
+        Carga todo el resultado: para rangos grandes usar iterar_historial_emociones.
+        """
+        query = self._filtrar_detecciones(select(DeteccionEmocion), persona_id, dias)
+        query = query.order_by(DeteccionEmocion.fecha_deteccion, DeteccionEmocion.id)
         
-        if persona_id:
-            query = query.filter_by(persona_id=persona_id)
+        return self.session.scalars(query).all()
+    
+    def iterar_historial_emociones(self, persona_id=None, dias=30, tamano_pagina=1000):
+        """
+        Recorre el historial en orden cronológico con memoria constante, por páginas
+        con paginación por clave (fecha_deteccion, id) en lugar de OFFSET.
+        
+        Yields:
+            tuple: (id, persona_id, fecha, emoción, confianza)
+        """
+        columnas = (
+            DeteccionEmocion.id,
+            DeteccionEmocion.persona_id,
+            DeteccionEmocion.fecha_deteccion,
+            DeteccionEmocion.emocion,
+            DeteccionEmocion.confianza
+        )
+        base = self._filtrar_detecciones(select(*columnas), persona_id, dias)
+        base = base.order_by(DeteccionEmocion.fecha_deteccion, DeteccionEmocion.id).limit(tamano_pagina)
+        
+        ultima = None
+        while True:
+            query = base
+            if ultima is not None:
+                query = query.where(
+                    db.tuple_(DeteccionEmocion.fecha_deteccion, DeteccionEmocion.id) > db.tuple_(*ultima)
+                )
+            pagina = self.session.execute(query).all()
+            
+            for fila in pagina:
+                yield tuple(fila)
+            if len(pagina) < tamano_pagina:
+                return
+            ultima = (pagina[-1].fecha_deteccion, pagina[-1].id)
+    
+    def obtener_ultimas_detecciones(self, persona_id=None, limite=10, dias=None):
+        """
+        Últimas `limite` detecciones (orden descendente con LIMIT sobre el índice)
+        
+        Returns:
+            list: tuplas (fecha, emoción, confianza) en orden cronológico
+        """
+        query = select(DeteccionEmocion.fecha_deteccion, DeteccionEmocion.emocion, DeteccionEmocion.confianza)
+        query = self._filtrar_detecciones(query, persona_id, dias)
+        query = query.order_by(DeteccionEmocion.fecha_deteccion.desc(), DeteccionEmocion.id.desc()).limit(limite)
+        
+        return [tuple(fila) for fila in reversed(self.session.execute(query).all())]
+    
+    def _tramos_resumen(self, dias=None):
+        """
+        Divide el rango [ahora - dias, ahora] en las fuentes que lo cubren exactamente:
+        resumen diario para los días completos, resumen por hora para las horas completas
+        del primer día y detecciones crudas para la fracción de la primera hora.
+        
+        Returns:
+            list: tuplas (fuente, desde, hasta) con fuente 'dia', 'hora' o 'detecciones'
+        """
+        if dias is None:
+            return [('dia', None, None)]
         
         fecha_limite = datetime.now() - timedelta(days=dias)
-        query = query.filter(DeteccionEmocion.fecha_deteccion >= fecha_limite)
+        inicio_hora = GRANULARIDADES_RESUMEN['hora'](fecha_limite)
+        if inicio_hora < fecha_limite:
+            inicio_hora += timedelta(hours=1)
+        inicio_dia = GRANULARIDADES_RESUMEN['dia'](fecha_limite)
+        if inicio_dia < fecha_limite:
+            inicio_dia += timedelta(days=1)
         
-        return query.all()
+        return [
+            ('detecciones', fecha_limite, inicio_hora),
+            ('hora', inicio_hora, inicio_dia),
+            ('dia', inicio_dia, None),
+        ]
     
-    def obtener_estadisticas_emociones(self, persona_id=None):
-        """Obtiene estadísticas de emociones por persona o generales"""
-        if persona_id:
-            detecciones = self.session.query(DeteccionEmocion).filter_by(persona_id=persona_id).all()
-        else:
-            detecciones = self.session.query(DeteccionEmocion).all()
+    def _agregar_resumenes(self, claves, persona_id=None, dias=None):
+        """
+        Suma conteos y confianzas agrupados por `claves` ('persona_id', 'emocion', 'dia')
+        leyendo de los resúmenes, de modo que el costo depende del rango y no del número
+        de detecciones.
+        
+        Returns:
+            dict: tupla de claves -> [conteo, suma de confianza]
+        """
+        resultado = {}
+        for fuente, desde, hasta in self._tramos_resumen(dias):
+            if fuente == 'detecciones':
+                tabla = DeteccionEmocion
+                fecha = DeteccionEmocion.fecha_deteccion
+                conteo = func.count(DeteccionEmocion.id)
+                suma_confianza = func.sum(DeteccionEmocion.confianza)
+            else:
+                tabla = ResumenEmocion
+                fecha = ResumenEmocion.periodo
+                conteo = func.sum(ResumenEmocion.conteo)
+                suma_confianza = func.sum(ResumenEmocion.suma_confianza)
+            
+            columnas = {
+                # En los resúmenes las detecciones sin persona llevan PERSONA_DESCONOCIDA
+                'persona_id': (tabla.persona_id if tabla is DeteccionEmocion
+                               else func.nullif(tabla.persona_id, PERSONA_DESCONOCIDA)),
+                'emocion': tabla.emocion,
+                'dia': func.date(fecha),
+            }
+            agrupacion = [columnas[clave] for clave in claves]
+            query = select(*agrupacion, conteo, suma_confianza)
+            if tabla is ResumenEmocion:
+                query = query.where(ResumenEmocion.granularidad == fuente)
+            if persona_id:
+                query = query.where(tabla.persona_id == persona_id)
+            if desde is not None:
+                query = query.where(fecha >= desde)
+            if hasta is not None:
+                query = query.where(fecha < hasta)
+            if agrupacion:
+                query = query.group_by(*agrupacion)
+            
+            for fila in self.session.execute(query):
+                if fila[-2] is None:
+                    continue
+                acumulado = resultado.setdefault(tuple(fila[:-2]), [0, 0.0])
+                acumulado[0] += fila[-2]
+                acumulado[1] += fila[-1] or 0.0
+        
+        return resultado
+    
+    def obtener_estadisticas_emociones(self, persona_id=None, dias=None):
+        """Obtiene estadísticas de emociones (conteo por emoción) por persona o generales"""
+        agregados = self._agregar_resumenes(('emocion',), persona_id, dias)
+        
+        return {emocion: conteo for (emocion,), (conteo, _) in agregados.items()}
+    
+    def obtener_conteo_detecciones(self, persona_id=None, dias=30):
+        """Cuenta las detecciones de los últimos días, por persona o generales"""
+        agregados = self._agregar_resumenes((), persona_id, dias)
+        
+        return sum(conteo for conteo, _ in agregados.values())
+    
+    def obtener_conteos_por_persona(self, dias=30):
+        """Cuenta las detecciones de los últimos días de todas las personas (sin las de desconocidos)"""
+        agregados = self._agregar_resumenes(('persona_id',), dias=dias)
+        
+        return {persona_id: conteo for (persona_id,), (conteo, _) in agregados.items() if persona_id is not None}
+    
+    def obtener_historial_diario(self, persona_id=None, dias=30):
+        """
+        Conteo de detecciones por día y emoción
         
-        estadisticas = {}
-        for deteccion in detecciones:
-            if deteccion.emocion not in estadisticas:
-                estadisticas[deteccion.emocion] = 0
-            estadisticas[deteccion.emocion] += 1
+        Returns:
+            list: tuplas (día 'YYYY-MM-DD', emoción, conteo, confianza promedio) en orden cronológico
+        """
+        agregados = self._agregar_resumenes(('dia', 'emocion'), persona_id, dias)
         
-        return estadisticas
\ No newline at end of file
+        return sorted(
+            (dia, emocion, conteo, suma_confianza / conteo)
+            for (dia, emocion), (conteo, suma_confianza) in agregados.items()
+        )
+    
+    def reconstruir_resumenes(self):
+        """Recalcula todos los resúmenes desde las detecciones (backfill o reparación)"""
+        tabla = ResumenEmocion.__table__
+        formatos = {'hora': '%Y-%m-%d %H:00:00.000000', 'dia': '%Y-%m-%d 00:00:00.000000'}
+        
+        with self.engine.begin() as conexion:
+            conexion.execute(tabla.delete())
+            for granularidad, formato in formatos.items():
+                # Mismo formato de texto con el que SQLAlchemy guarda DateTime en SQLite
+                periodo = func.strftime(formato, DeteccionEmocion.fecha_deteccion)
+                persona_id = func.coalesce(DeteccionEmocion.persona_id, PERSONA_DESCONOCIDA)
+                seleccion = (
+                    select(
+                        db.literal(granularidad),
+                        periodo,
+                        persona_id,
+                        DeteccionEmocion.emocion,
+                        func.count(DeteccionEmocion.id),
+                        func.sum(DeteccionEmocion.confianza),
+                        func.min(DeteccionEmocion.fecha_deteccion),
+                        func.max(DeteccionEmocion.fecha_deteccion)
+                    )
+                    .group_by(periodo, persona_id, DeteccionEmocion.emocion)
+                )
+                conexion.execute(tabla.insert().from_select(
+                    ['granularidad', 'periodo', 'persona_id', 'emocion', 'conteo',
+                     'suma_confianza', 'primera_deteccion', 'ultima_deteccion'],
+                    seleccion
+                ))
+            incrementar_version_resumenes(conexion)
+            filas = conexion.execute(select(func.count()).select_from(tabla)).scalar_one()
+        
+        logger.info(f"Resúmenes de emociones reconstruidos: {filas} filas")
+        return filas
+    
+    def _completar_resumenes(self):
+        """
+        Genera los resúmenes de una base existente que aún no los tiene, o que los
+        tiene de una versión que no resumía las detecciones sin persona
+        """
+        hay_resumenes = self.session.execute(select(ResumenEmocion.conteo).limit(1)).first()
+        hay_detecciones = self.session.execute(select(DeteccionEmocion.id).limit(1)).first()
+        faltan_desconocidas = hay_resumenes and self.session.execute(
+            select(DeteccionEmocion.id).where(DeteccionEmocion.persona_id.is_(None)).limit(1)
+        ).first() and not self.session.execute(
+            select(ResumenEmocion.conteo).where(ResumenEmocion.persona_id == PERSONA_DESCONOCIDA).limit(1)
+        ).first()
+        self.session.commit()
+        if hay_detecciones and (not hay_resumenes or faltan_desconocidas):
+            logger.info("Generando resúmenes de emociones para las detecciones existentes...")
+            self.reconstruir_resumenes()
+    
+    def obtener_ultimas_detecciones_por_persona(self, limite=10, dias=30):
+        """
+        Últimas detecciones de cada persona con una consulta de ventana (ROW_NUMBER)
+        
+        Returns:
+            dict: persona_id -> lista de tuplas (fecha, emoción, confianza) en orden cronológico
+        """
+        numero = func.row_number().over(
+            partition_by=DeteccionEmocion.persona_id,
+            order_by=(DeteccionEmocion.fecha_deteccion.desc(), DeteccionEmocion.id.desc())
+        ).label('numero')
+        subconsulta = self._filtrar_detecciones(
+            select(
+                DeteccionEmocion.persona_id,
+                DeteccionEmocion.fecha_deteccion,
+                DeteccionEmocion.emocion,
+                DeteccionEmocion.confianza,
+                numero
+            ),
+            dias=dias
+        ).subquery()
+        
+        query = (
+            select(subconsulta.c.persona_id, subconsulta.c.fecha_deteccion,
+                   subconsulta.c.emocion, subconsulta.c.confianza)
+            .where(subconsulta.c.numero <= limite)
+            .order_by(subconsulta.c.persona_id, subconsulta.c.fecha_deteccion)
+        )
+        
+        ultimas = {}
+        for persona_id, fecha, emocion, confianza in self.session.execute(query):
+            ultimas.setdefault(persona_id, []).append((fecha, emocion, confianza))
+        return ultimas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos del sistema")
+    parser.add_argument('comando', choices=['reconstruir-resumenes'])
+    parser.add_argument('--db', default='facial_emotion_system.db', help='Ruta de la base de datos')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db_manager = DatabaseManager(args.db)
+    if args.comando == 'reconstruir-resumenes':
+        filas = db_manager.reconstruir_resumenes()
+        print(f"Resúmenes reconstruidos: {filas} filas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Descarga a `modelos/` los modelos de detección que OpenCV no incluye en su paquete
+de pip: la cascada LBP (`--detector lbp`) y la red SSD res10 (`--detector dnn`).
+
+Las URL apuntan a versiones fijas (tag o rama de datos de OpenCV) y los archivos
+con suma SHA-1 conocida se verifican antes de moverlos a su lugar; si no coincide
+se descartan. Los archivos ya presentes y válidos no se vuelven a descargar.
+
+Uso (desde la carpeta del proyecto):
+    python descargar_modelos.py            # todos
+    python descargar_modelos.py dnn        # solo los de un detector
+"""
+import argparse
+import hashlib
+import os
+import sys
+import urllib.request
+from collections import namedtuple
+
+from detectores import DIRECTORIO_MODELOS
+
+Modelo = namedtuple('Modelo', ['detector', 'archivo', 'url', 'sha1'])
+
+# La suma de la red res10 es la del manifiesto de OpenCV (samples/dnn/face_detector/
+# download_weights.py); OpenCV no publica sumas de la cascada ni del prototxt, que
+# quedan fijados por el tag de la URL (sha1 None: se informa la suma calculada)
+MODELOS = [
+    Modelo('lbp', 'lbpcascade_frontalface_improved.xml',
+           'https://raw.githubusercontent.com/opencv/opencv/4.10.0/data/lbpcascades/'
+           'lbpcascade_frontalface_improved.xml',
+           None),
+    Modelo('dnn', 'deploy.prototxt',
+           'https://raw.githubusercontent.com/opencv/opencv/4.10.0/samples/dnn/face_detector/deploy.prototxt',
+           None),
+    Modelo('dnn', 'res10_300x300_ssd_iter_140000.caffemodel',
+           'https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20170830/'
+           'res10_300x300_ssd_iter_140000.caffemodel',
+           '15aa726b4d46d9f023526d85537db81cbc8dd566'),
+]
+
+
+def suma_sha1(ruta):
+    sha1 = hashlib.sha1()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(bloque)
+    return sha1.hexdigest()
+
+
+def descargar(modelo, directorio=DIRECTORIO_MODELOS):
+    """
+    Descarga y verifica un modelo
+
+    Returns:
+        tuple: (exito, mensaje)
+    """
+    destino = os.path.join(directorio, modelo.archivo)
+    if os.path.exists(destino) and (modelo.sha1 is None or suma_sha1(destino) == modelo.sha1):
+        return True, f"{modelo.archivo}: ya descargado"
+
+    os.makedirs(directorio, exist_ok=True)
+    temporal = f"{destino}.descarga"
+    try:
+        urllib.request.urlretrieve(modelo.url, temporal)
+        suma = suma_sha1(temporal)
+        if modelo.sha1 is not None and suma != modelo.sha1:
+            os.remove(temporal)
+            return False, f"{modelo.archivo}: suma SHA-1 inesperada ({suma}), archivo descartado"
+        os.replace(temporal, destino)
+        return True, f"{modelo.archivo}: descargado (sha1 {suma})"
+    except OSError as e:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return False, f"{modelo.archivo}: error al descargar: {str(e)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('detectores', nargs='*', choices=sorted({m.detector for m in MODELOS}),
+                        help='Detectores cuyos modelos descargar (por defecto, todos)')
+    args = parser.parse_args()
+
+    fallidos = 0
+    for modelo in MODELOS:
+        if args.detectores and modelo.detector not in args.detectores:
+            continue
+        exito, mensaje = descargar(modelo)
+        print(mensaje)
+        fallidos += not exito
+    return 1 if fallidos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
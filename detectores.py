@@ -0,0 +1,283 @@
+"""
+Detectores de rostros intercambiables.
+
+Todos reciben un frame BGR y retornan ubicaciones (top, right, bottom, left) en
+píxeles del frame recibido, el mismo formato de face_recognition, de modo que
+las cajas de una sola detección sirven tanto para los embeddings como para el
+clasificador de emociones.
+
+    hog    dlib HOG (face_recognition); el de referencia, preciso y lento en CPU
+    haar   cascada Haar de OpenCV; muy rápido, más falsos positivos y de perfil
+    lbp    cascada LBP de OpenCV; aún más rápido que Haar, algo menos sensible
+    dnn    SSD res10 300x300 de OpenCV DNN (Caffe); buen balance en CPU
+    mtcnn  MTCNN de FER; el más sensible a rostros pequeños, el más lento
+
+Los modelos que OpenCV no incluye (cascada LBP y red res10) se buscan en la
+carpeta `modelos/` (`python descargar_modelos.py` los descarga) o en la ruta
+indicada al crear el detector. crear_detector() comprueba que estén al crearlo,
+para fallar al arrancar y no en cada frame.
+"""
+import os
+import threading
+import logging
+
+import cv2
+import numpy as np
+
+from metricas import marcas_arranque
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_MODELOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelos')
+
+# face_recognition carga los modelos de dlib al importarse: se difiere hasta el primer uso
+_face_recognition = None
+_lock_carga = threading.Lock()
+
+
+def cargar_face_recognition():
+    """Importa face_recognition (y sus modelos dlib) una sola vez, de forma segura entre hilos"""
+    global _face_recognition
+    if _face_recognition is None:
+        with _lock_carga:
+            if _face_recognition is None:
+                import face_recognition
+                _face_recognition = face_recognition
+                marcas_arranque.marcar("modelo_rostros_cargado")
+    return _face_recognition
+
+
+def _caja_a_ubicacion(x, y, ancho, alto, forma):
+    """Convierte (x, y, ancho, alto) a (top, right, bottom, left) recortado a la imagen"""
+    alto_imagen, ancho_imagen = forma[:2]
+    top = max(0, int(y))
+    left = max(0, int(x))
+    bottom = min(alto_imagen, int(y + alto))
+    right = min(ancho_imagen, int(x + ancho))
+    return (top, right, bottom, left)
+
+
+def _verificar_archivos(detector, rutas):
+    faltantes = [ruta for ruta in rutas if not os.path.exists(ruta)]
+    if faltantes:
+        raise FileNotFoundError(
+            f"Faltan los modelos del detector '{detector}': {', '.join(faltantes)}. "
+            f"Descárguelos con: python descargar_modelos.py {detector}"
+        )
+
+
+class DetectorRostros:
+    """
+    Interfaz común de los detectores.
+
+    Las subclases implementan detectar_en(imagen), que detecta sobre la imagen tal
+    como llega; detectar(frame, escala) reduce antes el frame y lleva las cajas de
+    vuelta a la escala original. Los modelos se cargan de forma perezosa.
+    """
+
+    nombre = None
+
+    def __init__(self):
+        self._modelo = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        raise NotImplementedError
+
+    @property
+    def modelo(self):
+        if self._modelo is None:
+            with self._lock:
+                if self._modelo is None:
+                    self._modelo = self._cargar()
+                    logger.info(f"Detector de rostros '{self.nombre}' cargado")
+        return self._modelo
+
+    def verificar(self):
+        """Comprueba, sin cargarlo, que el modelo esté disponible; lanza una excepción si no"""
+
+    def precargar(self):
+        """Carga el modelo y ejecuta una detección de prueba para calentarlo"""
+        self.detectar_en(np.zeros((64, 64, 3), dtype=np.uint8))
+
+    def detectar_en(self, imagen):
+        """Detecta rostros en una imagen BGR sin reescalarla"""
+        raise NotImplementedError
+
+    def detectar(self, frame, escala=1.0):
+        """Detecta rostros en el frame reducido a `escala`; cajas en coordenadas del frame"""
+        if escala == 1.0:
+            return self.detectar_en(frame)
+        reducido = cv2.resize(frame, (0, 0), fx=escala, fy=escala)
+        return [
+            tuple(int(round(v / escala)) for v in ubicacion)
+            for ubicacion in self.detectar_en(reducido)
+        ]
+
+
+class DetectorHOG(DetectorRostros):
+    """HOG + SVM lineal de dlib, a través de face_recognition"""
+
+    nombre = 'hog'
+
+    def __init__(self, muestreo=1):
+        super().__init__()
+        # Veces que dlib amplía la imagen antes de detectar (encuentra rostros más pequeños)
+        self.muestreo = muestreo
+
+    def _cargar(self):
+        return cargar_face_recognition()
+
+    def detectar_en(self, imagen):
+        rgb = cv2.cvtColor(imagen, cv2.COLOR_BGR2RGB)
+        return list(self.modelo.face_locations(rgb, number_of_times_to_upsample=self.muestreo, model="hog"))
+
+
+class DetectorCascada(DetectorRostros):
+    """Cascada de OpenCV (Haar o LBP) sobre la imagen en escala de grises ecualizada"""
+
+    RUTAS = {
+        'haar': os.path.join(getattr(getattr(cv2, 'data', None), 'haarcascades', ''),
+                             'haarcascade_frontalface_default.xml'),
+        'lbp': os.path.join(DIRECTORIO_MODELOS, 'lbpcascade_frontalface_improved.xml'),
+    }
+
+    def __init__(self, tipo='haar', ruta=None, factor_escala=1.1, vecinos_minimos=5, tamano_minimo=(24, 24)):
+        super().__init__()
+        self.nombre = tipo
+        self.ruta = ruta or self.RUTAS[tipo]
+        self.factor_escala = factor_escala
+        self.vecinos_minimos = vecinos_minimos
+        self.tamano_minimo = tamano_minimo
+        # Cada hilo usa su propio clasificador: detectMultiScale no es seguro entre hilos
+        self._locales = threading.local()
+
+    def verificar(self):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise RuntimeError("Esta versión de OpenCV no incluye CascadeClassifier (instale opencv-python)")
+        _verificar_archivos(self.nombre, [self.ruta])
+
+    def _cargar(self):
+        self.verificar()
+        return self.ruta
+
+    def _clasificador(self):
+        clasificador = getattr(self._locales, 'clasificador', None)
+        if clasificador is None:
+            clasificador = cv2.CascadeClassifier(self.modelo)
+            if clasificador.empty():
+                raise ValueError(f"No se pudo cargar la cascada {self.ruta}")
+            self._locales.clasificador = clasificador
+        return clasificador
+
+    def detectar_en(self, imagen):
+        gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY) if imagen.ndim == 3 else imagen
+        gris = cv2.equalizeHist(gris)
+        cajas = self._clasificador().detectMultiScale(
+            gris,
+            scaleFactor=self.factor_escala,
+            minNeighbors=self.vecinos_minimos,
+            minSize=self.tamano_minimo
+        )
+        return [_caja_a_ubicacion(x, y, w, h, imagen.shape) for (x, y, w, h) in cajas]
+
+
+class DetectorDNN(DetectorRostros):
+    """
+    SSD con base ResNet-10 (res10_300x300) de OpenCV DNN, en CPU.
+
+    La red trabaja siempre a 300x300, así que reducir el frame antes apenas
+    cambia su costo; conviene usarlo con escala 1.0.
+    """
+
+    nombre = 'dnn'
+    TAMANO_ENTRADA = (300, 300)
+    MEDIAS = (104.0, 177.0, 123.0)
+
+    def __init__(self, prototxt=None, pesos=None, umbral=0.5):
+        super().__init__()
+        self.prototxt = prototxt or os.path.join(DIRECTORIO_MODELOS, 'deploy.prototxt')
+        self.pesos = pesos or os.path.join(DIRECTORIO_MODELOS, 'res10_300x300_ssd_iter_140000.caffemodel')
+        self.umbral = umbral
+        self._locales = threading.local()
+
+    def verificar(self):
+        if not hasattr(getattr(cv2, 'dnn', None), 'readNetFromCaffe'):
+            raise RuntimeError("Esta versión de OpenCV no incluye el módulo dnn con soporte Caffe")
+        _verificar_archivos(self.nombre, [self.prototxt, self.pesos])
+
+    def _cargar(self):
+        self.verificar()
+        return self.prototxt, self.pesos
+
+    def _red(self):
+        # Una red por hilo: forward() no es seguro entre hilos
+        red = getattr(self._locales, 'red', None)
+        if red is None:
+            red = cv2.dnn.readNetFromCaffe(*self.modelo)
+            red.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            red.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            self._locales.red = red
+        return red
+
+    def detectar_en(self, imagen):
+        alto, ancho = imagen.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(imagen, self.TAMANO_ENTRADA), 1.0,
+                                     self.TAMANO_ENTRADA, self.MEDIAS)
+        red = self._red()
+        red.setInput(blob)
+        detecciones = red.forward()[0, 0]
+
+        ubicaciones = []
+        for _, _, confianza, x0, y0, x1, y1 in detecciones:
+            if confianza < self.umbral:
+                continue
+            ubicacion = _caja_a_ubicacion(x0 * ancho, y0 * alto, (x1 - x0) * ancho, (y1 - y0) * alto,
+                                          imagen.shape)
+            if ubicacion[2] > ubicacion[0] and ubicacion[1] > ubicacion[3]:
+                ubicaciones.append(ubicacion)
+        return ubicaciones
+
+
+class DetectorMTCNN(DetectorRostros):
+    """MTCNN incluido en FER (requiere tensorflow)"""
+
+    nombre = 'mtcnn'
+
+    def __init__(self):
+        super().__init__()
+        self._lock_deteccion = threading.Lock()
+
+    def _cargar(self):
+        from fer.fer import FER
+        return FER(mtcnn=True)
+
+    def detectar_en(self, imagen):
+        modelo = self.modelo
+        with self._lock_deteccion:
+            cajas = modelo.find_faces(imagen, bgr=imagen.ndim == 3)
+        return [_caja_a_ubicacion(x, y, w, h, imagen.shape) for (x, y, w, h) in cajas]
+
+
+DETECTORES = {
+    'hog': DetectorHOG,
+    'haar': lambda **kwargs: DetectorCascada('haar', **kwargs),
+    'lbp': lambda **kwargs: DetectorCascada('lbp', **kwargs),
+    'dnn': DetectorDNN,
+    'mtcnn': DetectorMTCNN,
+}
+
+
+def crear_detector(nombre="hog", **kwargs):
+    """
+    Crea un detector por nombre ('hog', 'haar', 'lbp', 'dnn' o 'mtcnn') y comprueba que
+    sus modelos estén disponibles
+
+    Raises:
+        FileNotFoundError, RuntimeError: si faltan los modelos o el soporte de OpenCV
+    """
+    if nombre not in DETECTORES:
+        raise ValueError(f"Detector desconocido: {nombre} (opciones: {', '.join(DETECTORES)})")
+    detector = DETECTORES[nombre](**kwargs)
+    detector.verificar()
+    return detector
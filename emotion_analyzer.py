@@ -1,15 +1,14 @@
 import logging
+import threading
 import cv2
 import numpy as np
-from fer.fer import FER
 import os
+from metricas import marcas_arranque, cronometrado
+from detectores import DetectorMTCNN
 
 # Configurar logging
 logger = logging.getLogger("app.emotions")
 
-# Inicializar el detector de emociones (usa MTCNN para detección de rostros)
-detector = FER(mtcnn=True)
-
 # Mapeo de emociones en inglés a español
 MAPEO_EMOCIONES = {
     'angry': 'Enojo',
@@ -21,15 +20,107 @@ MAPEO_EMOCIONES = {
     'neutral': 'Neutral'
 }
 
+# Orden de las salidas del clasificador de FER (coincide con MAPEO_EMOCIONES)
+ETIQUETAS_FER = list(MAPEO_EMOCIONES.keys())
+
+# Margen alrededor de la caja del rostro, igual al que usa FER al recortar
+MARGEN_ROSTRO = 10
+
+
+def limitar_hilos_tensorflow(hilos=1):
+    """
+    Fija los hilos intra e inter operación de TensorFlow; debe llamarse antes de
+    cargar cualquier modelo (FER, MTCNN), cuando TensorFlow crea su contexto
+    """
+    # Las variables de entorno cubren también a TensorFlow importado desde otro módulo
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(hilos)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(hilos)
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(hilos)
+        tf.config.threading.set_inter_op_parallelism_threads(hilos)
+    except RuntimeError as e:
+        logger.warning(f"TensorFlow ya estaba inicializado; no se limitaron sus hilos: {str(e)}")
+
+def cargar_clasificador_emociones():
+    """Carga el modelo de clasificación de emociones incluido en el paquete FER"""
+    # TensorFlow y FER se importan aquí para que importar este módulo sea barato
+    import fer
+    from tensorflow.keras.models import load_model
+    
+    ruta_modelo = os.path.join(os.path.dirname(fer.__file__), "data", "emotion_model.hdf5")
+    return load_model(ruta_modelo, compile=False)
+
 class AnalizadorEmocionesFER:
     def __init__(self):
-        self.detector = detector
+        # El clasificador (TensorFlow) se carga en el primer uso o con precargar()
+        self._clasificador = None
+        self._lock_carga = threading.Lock()
+        self.detector = None
         self.emociones = list(MAPEO_EMOCIONES.values())
-        logger.info("✅ Analizador FER inicializado correctamente")
+    
+    @property
+    def clasificador(self):
+        """Clasificador de emociones, cargado de forma perezosa y segura entre hilos"""
+        if self._clasificador is None:
+            with self._lock_carga:
+                if self._clasificador is None:
+                    self._clasificador = cargar_clasificador_emociones()
+                    marcas_arranque.marcar("modelo_emociones_cargado")
+                    logger.info("✅ Analizador FER inicializado correctamente")
+        return self._clasificador
+    
+    @property
+    def tamano_entrada(self):
+        """(alto, ancho) de la entrada del clasificador"""
+        return tuple(self.clasificador.input_shape[1:3])
+    
+    def precargar(self):
+        """Carga el clasificador y ejecuta una inferencia de prueba para calentarlo"""
+        alto, ancho = self.tamano_entrada
+        self._clasificar(np.zeros((1, alto, ancho, 1), dtype=np.float32))
+    
+    def _preprocesar_rostro(self, rostro_bgr):
+        """Convierte un recorte BGR (o gris) a la entrada del clasificador (alto, ancho, 1)"""
+        if len(rostro_bgr.shape) == 3:
+            gris = cv2.cvtColor(rostro_bgr, cv2.COLOR_BGR2GRAY)
+        else:
+            gris = rostro_bgr
+        
+        alto, ancho = self.tamano_entrada
+        gris = cv2.resize(gris, (ancho, alto)).astype(np.float32)
+        
+        # Misma normalización que FER: [0, 255] -> [-1, 1]
+        gris = (gris / 255.0 - 0.5) * 2.0
+        return gris[..., np.newaxis]
+    
+    def _recortar_rostro(self, frame, ubicacion_rostro):
+        """Recorta el rostro con un pequeño margen; retorna None si la caja es inválida"""
+        top, right, bottom, left = ubicacion_rostro
+        
+        # Asegurar coordenadas válidas
+        top = max(0, top - MARGEN_ROSTRO)
+        left = max(0, left - MARGEN_ROSTRO)
+        bottom = min(frame.shape[0], bottom + MARGEN_ROSTRO)
+        right = min(frame.shape[1], right + MARGEN_ROSTRO)
+        
+        if top >= bottom or left >= right:
+            return None
+        
+        return frame[top:bottom, left:right]
+    
+    def _clasificar(self, lote):
+        """Ejecuta el clasificador sobre un lote (n, alto, ancho, 1) y retorna las probabilidades"""
+        return np.asarray(self.clasificador(lote, training=False))
+    
+    @staticmethod
+    def _emocion_principal(probabilidades):
+        indice = int(np.argmax(probabilidades))
+        return MAPEO_EMOCIONES[ETIQUETAS_FER[indice]], float(probabilidades[indice])
     
     def detect_emotions_for_face(self, face_image):
         """
-        Detecta la emoción predominante en una cara usando FER.
+        Clasifica la emoción predominante de una imagen que ya contiene solo el rostro.
         Retorna (emotion_name, confidence) o ("Neutral", 0.0) si falla.
         """
         try:
@@ -37,41 +128,12 @@ class AnalizadorEmocionesFER:
             if face_image is None or face_image.size == 0:
                 return "Neutral", 0.0
             
-            # Asegurar que la imagen tiene el tamaño mínimo requerido
-            if face_image.shape[0] < 20 or face_image.shape[1] < 20:
-                # Redimensionar a tamaño mínimo
-                face_image = cv2.resize(face_image, (48, 48))
-            
-            # Convertir BGR a RGB si es necesario (FER espera RGB)
-            if len(face_image.shape) == 3:
-                # Verificar el orden de canales
-                if face_image.shape[2] == 3:
-                    face_image_rgb = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-                else:
-                    face_image_rgb = face_image
-            else:
-                # Convertir escala de grises a RGB
-                face_image_rgb = cv2.cvtColor(face_image, cv2.COLOR_GRAY2RGB)
-            
-            # Detectar emoción principal
-            emotion_data = self.detector.detect_emotions(face_image_rgb)
-            
-            if not emotion_data:
-                return "Neutral", 0.0
-            
-            # Tomar el primer rostro detectado
-            emotions = emotion_data[0]['emotions']
-            
-            # Encontrar la emoción con mayor confianza
-            emotion_english = max(emotions.items(), key=lambda x: x[1])[0]
-            confidence = emotions[emotion_english]
+            lote = self._preprocesar_rostro(face_image)[np.newaxis]
+            emocion, confianza = self._emocion_principal(self._clasificar(lote)[0])
             
-            # Traducir al español
-            emotion_spanish = MAPEO_EMOCIONES.get(emotion_english, "Neutral")
-            
-            logger.debug(f"Emoción detectada: {emotion_english} -> {emotion_spanish} ({confidence:.3f})")
-            return emotion_spanish, float(confidence)
-
+            logger.debug(f"Emoción detectada: {emocion} ({confianza:.3f})")
+            return emocion, confianza
+        
         except Exception as e:
             logger.error(f"Error detectando emoción con FER: {e}", exc_info=True)
             return "Neutral", 0.0
@@ -87,62 +149,96 @@ class AnalizadorEmocionesFER:
         Returns:
             tuple: (emoción, confianza)
         """
+        return self.predecir_emociones(frame, [ubicacion_rostro])[0]
+    
+    def predecir_emociones(self, frame, ubicaciones_rostros):
+        """
+        Predice la emoción de todos los rostros de un frame en una sola pasada del clasificador.
+        
+        Las cajas vienen del detector de ReconocedorFacial, así que no se vuelve a
+        detectar: cada recorte se lleva a la entrada del modelo y se clasifica.
+        
+        Args:
+            frame: Frame completo de la cámara (BGR)
+            ubicaciones_rostros: Lista de tuplas (top, right, bottom, left)
+        
+        Returns:
+            list: tuplas (emoción, confianza) en el mismo orden que las ubicaciones
+        """
+        distribuciones = self.predecir_emociones_lote([frame], [ubicaciones_rostros])[0]
+        
+        resultados = []
+        for distribucion in distribuciones:
+            if distribucion is None:
+                resultados.append(("Neutral", 0.0))
+            else:
+                emocion = max(distribucion, key=distribucion.get)
+                resultados.append((emocion, distribucion[emocion]))
+        
+        return resultados
+    
+    @cronometrado('emociones_segundos', 'Clasificación de emociones de un lote de rostros')
+    def predecir_emociones_lote(self, frames, ubicaciones, tamano_lote=64):
+        """
+        Clasifica los rostros de uno o más frames apilando todos los recortes en un
+        único tensor, con una pasada del modelo por cada `tamano_lote` rostros.
+        
+        Args:
+            frames: Lista de frames (BGR)
+            ubicaciones: Lista, por frame, de tuplas (top, right, bottom, left)
+            tamano_lote: Máximo de rostros por pasada (acota la memoria en videos largos)
+        
+        Returns:
+            list: por frame, una lista con un dict {emoción: probabilidad} de las 7
+                  clases por rostro (None si la caja del rostro no es válida)
+        """
+        resultados = [[None] * len(ubicaciones_frame) for ubicaciones_frame in ubicaciones]
+        
         try:
-            # Extraer región del rostro
-            top, right, bottom, left = ubicacion_rostro
-            
-            # Asegurar coordenadas válidas
-            top = max(0, top)
-            left = max(0, left)
-            bottom = min(frame.shape[0], bottom)
-            right = min(frame.shape[1], right)
-            
-            if top >= bottom or left >= right:
-                return "Neutral", 0.0
-                
-            rostro_region = frame[top:bottom, left:right]
-            
-            if rostro_region.size == 0:
-                return "Neutral", 0.0
-            
-            # Usar FER para detectar emociones
-            return self.detect_emotions_for_face(rostro_region)
-            
+            rostros = []
+            posiciones = []
+            for i, (frame, ubicaciones_frame) in enumerate(zip(frames, ubicaciones)):
+                for j, ubicacion in enumerate(ubicaciones_frame):
+                    rostro_region = self._recortar_rostro(frame, ubicacion)
+                    if rostro_region is not None and rostro_region.size > 0:
+                        rostros.append(self._preprocesar_rostro(rostro_region))
+                        posiciones.append((i, j))
+            
+            if not rostros:
+                return resultados
+            
+            lote = np.stack(rostros)
+            for inicio in range(0, len(lote), tamano_lote):
+                probabilidades = self._clasificar(lote[inicio:inicio + tamano_lote])
+                for (i, j), fila in zip(posiciones[inicio:inicio + tamano_lote], probabilidades):
+                    resultados[i][j] = {
+                        MAPEO_EMOCIONES[etiqueta]: float(probabilidad)
+                        for etiqueta, probabilidad in zip(ETIQUETAS_FER, fila)
+                    }
+            
+            return resultados
+        
         except Exception as e:
-            logger.error(f"Error en predicción de emoción: {e}")
-            return "Neutral", 0.0
+            logger.error(f"Error en predicción de emociones por lote: {e}")
+            return resultados
     
     def detectar_rostros(self, frame):
         """
-        Detecta rostros en el frame usando el detector interno de FER.
-        Esto puede ser útil como alternativa al detector de face_recognition.
+        Detecta rostros en el frame usando el detector MTCNN de FER.
+        
+        Se conserva por compatibilidad: el sistema detecta una sola vez con el
+        detector de ReconocedorFacial (que también puede ser MTCNN, ver detectores.py)
+        y entrega esas cajas a predecir_emociones.
         """
         try:
-            # Convertir a RGB para FER
-            if len(frame.shape) == 3:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            else:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
-            
-            # Detectar rostros con FER
-            emotion_data = self.detector.detect_emotions(frame_rgb)
-            
-            ubicaciones = []
-            for detection in emotion_data:
-                box = detection['box']  # [x, y, width, height]
-                x, y, w, h = box
-                # Convertir a formato (top, right, bottom, left)
-                top = y
-                right = x + w
-                bottom = y + h
-                left = x
-                ubicaciones.append((top, right, bottom, left))
-            
-            return ubicaciones
-            
+            # El detector MTCNN solo se carga si se usa esta alternativa
+            if self.detector is None:
+                self.detector = DetectorMTCNN()
+            return self.detector.detectar_en(frame)
+        
         except Exception as e:
             logger.error(f"Error detectando rostros con FER: {e}")
             return []
 
-# Instancia global para usar en el sistema
-analizador_emociones = AnalizadorEmocionesFER()
\ No newline at end of file
+# Instancia global para usar en el sistema (no carga modelos hasta su primer uso)
+analizador_emociones = AnalizadorEmocionesFER()
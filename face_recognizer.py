@@ -1,64 +1,149 @@
-import face_recognition
 import cv2
 import numpy as np
-from database import DatabaseManager
+from database import DatabaseManager, PersonaGaleria
+from galeria import (IndiceGaleria, IndiceIVF, guardar_instantanea, cargar_instantanea,
+                     ruta_instantanea_predeterminada)
+from detectores import cargar_face_recognition, crear_detector
+from metricas import cronometrado
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ReconocedorFacial:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, modo_busqueda="exacto", ruta_instantanea=None, detector="hog"):
+        """
+        Args:
+            db_manager: DatabaseManager con las personas registradas
+            modo_busqueda: "exacto" (búsqueda lineal) o "ivf" (aproximada, para
+                galerías de cientos de miles de personas)
+            ruta_instantanea: ruta base (sin extensión) de la instantánea mapeada de la
+                galería; por defecto junto a la base de datos. False la desactiva.
+            detector: nombre del detector de rostros ("hog", "haar", "lbp", "dnn",
+                "mtcnn"; ver detectores.py) o una instancia de DetectorRostros
+        """
         self.db = db_manager
         self.tolerancia_reconocimiento = 0.6
+        self.escala_deteccion = 0.5
         self.capturas_por_registro = 3
         self.capturas_realizadas = 0
         self.embeddings_registro = []
-        self.cache_personas = None
-        self.cache_embeddings = None
+        self.cache_personas = {}
+        self.modo_busqueda = modo_busqueda
+        self.detector = crear_detector(detector) if isinstance(detector, str) else detector
+        self.galeria = IndiceIVF() if modo_busqueda == "ivf" else IndiceGaleria()
+        if ruta_instantanea is None:
+            ruta_instantanea = ruta_instantanea_predeterminada(db_manager.db_path)
+        self.ruta_instantanea = ruta_instantanea
         self.actualizar_cache()
     
-    def extraer_embedding_rostro(self, frame):
-        """Extrae el embedding facial de un frame - OPTIMIZADO"""
+    def precargar(self):
+        """Carga los modelos de dlib y del detector y ejecuta una detección de prueba para calentarlos"""
+        cargar_face_recognition()
+        self.detector.precargar()
+    
+    def _preparar_frame(self, frame, escala):
+        """Reduce el frame a la escala de detección y lo convierte a RGB"""
+        # Reducir tamaño del frame para mayor velocidad
+        if escala != 1.0:
+            frame = cv2.resize(frame, (0, 0), fx=escala, fy=escala)
+        
+        # Convertir BGR a RGB
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    
+    def _a_escala_reducida(self, ubicaciones, escala):
+        return [
+            tuple(int(round(v * escala)) for v in ubicacion)
+            for ubicacion in ubicaciones
+        ]
+    
+    def _a_escala_original(self, ubicaciones, escala):
+        return [
+            tuple(int(round(v / escala)) for v in ubicacion)
+            for ubicacion in ubicaciones
+        ]
+    
+    @cronometrado('deteccion_segundos', 'Detección de rostros en un frame')
+    def detectar_rostros(self, frame, escala=None):
+        """
+        Detecta las ubicaciones (top, right, bottom, left) de todos los rostros del frame
+        
+        Args:
+            escala: reducción aplicada antes de detectar; por defecto escala_deteccion.
+                Cada cámara puede usar la suya (ver pipeline.ControladorLatencia).
+        """
         try:
-            # Reducir tamaño del frame para mayor velocidad
-            small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-            
-            # Convertir BGR a RGB
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            return self.detector.detectar(frame, escala or self.escala_deteccion)
+        except Exception as e:
+            logger.error(f"Error al detectar rostros: {str(e)}")
+            return []
+    
+    @cronometrado('embedding_segundos', 'Cálculo de embeddings de rostros ya localizados')
+    def codificar_rostros(self, frame, ubicaciones):
+        """Calcula los embeddings de rostros ya localizados, sin volver a detectar"""
+        if not ubicaciones:
+            return []
+        
+        escala = self.escala_deteccion
+        try:
+            rgb_small_frame = self._preparar_frame(frame, escala)
+            return list(cargar_face_recognition().face_encodings(rgb_small_frame, self._a_escala_reducida(ubicaciones, escala)))
+        except Exception as e:
+            logger.error(f"Error al codificar rostros: {str(e)}")
+            return []
+    
+    @cronometrado('deteccion_embedding_segundos', 'Detección y cálculo de embeddings de un frame')
+    def extraer_embeddings_rostros(self, frame):
+        """
+        Extrae los embeddings de todos los rostros de un frame - OPTIMIZADO
+        
+        Returns:
+            tuple: (lista de embeddings, lista de ubicaciones (top, right, bottom, left))
+        """
+        escala = self.escala_deteccion
+        try:
+            small_frame = cv2.resize(frame, (0, 0), fx=escala, fy=escala) if escala != 1.0 else frame
             
-            # Detectar ubicaciones de rostros
-            face_locations = face_recognition.face_locations(rgb_small_frame, model="hog")
+            # Detectar ubicaciones de rostros una sola vez, sobre el frame reducido
+            face_locations = self.detector.detectar_en(small_frame)
             
             if not face_locations:
-                return None, None
-            
-            # Extraer embeddings
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+                return [], []
             
-            if not face_encodings:
-                return None, None
+            # Extraer embeddings de todos los rostros en una sola llamada, con las mismas cajas
+            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            face_encodings = cargar_face_recognition().face_encodings(rgb_small_frame, face_locations)
             
             # Escalar ubicaciones de vuelta al tamaño original
-            top, right, bottom, left = face_locations[0]
-            top *= 2; right *= 2; bottom *= 2; left *= 2
-            
-            return face_encodings[0], (top, right, bottom, left)
+            return list(face_encodings), self._a_escala_original(face_locations, escala)
             
         except Exception as e:
-            logger.error(f"Error al extraer embedding: {str(e)}")
+            logger.error(f"Error al extraer embeddings: {str(e)}")
+            return [], []
+    
+    def extraer_embedding_rostro(self, frame):
+        """Extrae el embedding facial del primer rostro de un frame"""
+        embeddings, ubicaciones = self.extraer_embeddings_rostros(frame)
+        
+        if not embeddings:
             return None, None
+        
+        return embeddings[0], ubicaciones[0]
     
     def capturar_para_registro(self, frame):
         """Captura múltiples imágenes para registro"""
         embedding, ubicacion = self.extraer_embedding_rostro(frame)
         
         if embedding is not None:
-            self.embeddings_registro.append(embedding)
-            self.capturas_realizadas += 1
+            self.registrar_muestra(embedding)
             return True, ubicacion
         else:
             return False, None
     
+    def registrar_muestra(self, embedding):
+        """Agrega un embedding ya validado a las capturas del registro en curso"""
+        self.embeddings_registro.append(embedding)
+        self.capturas_realizadas += 1
+    
     def finalizar_registro(self):
         """Finaliza el registro promediando los embeddings capturados"""
         if len(self.embeddings_registro) < self.capturas_por_registro:
@@ -71,9 +156,7 @@ class ReconocedorFacial:
         self.capturas_realizadas = 0
         self.embeddings_registro = []
         
-        # Actualizar cache después de nuevo registro
-        self.actualizar_cache()
-        
+        # La persona se añade a la galería con agregar_persona una vez registrada en la BD
         return embedding_promedio
     
     def reiniciar_registro(self):
@@ -81,40 +164,113 @@ class ReconocedorFacial:
         self.capturas_realizadas = 0
         self.embeddings_registro = []
     
-    def reconocer_persona(self, frame):
-        """Reconoce una persona en el frame - OPTIMIZADO CON CACHE"""
-        embedding, ubicacion = self.extraer_embedding_rostro(frame)
+    @cronometrado('galeria_busqueda_segundos', 'Búsqueda de embeddings en la galería')
+    def identificar(self, embeddings, ubicaciones):
+        """
+        Identifica embeddings ya calculados contra la galería
         
-        if embedding is None:
-            return None, None, ubicacion
+        Returns:
+            list: tuplas (persona, confianza, distancia, ubicacion) por rostro;
+                  persona y confianza son None si el rostro no coincide con la galería
+        """
+        resultados = [(None, None, None, ubicacion) for ubicacion in ubicaciones]
         
-        # Usar cache para reconocimiento más rápido
-        if self.cache_embeddings and self.cache_personas:
-            face_distances = face_recognition.face_distance(self.cache_embeddings, embedding)
-            best_match_index = np.argmin(face_distances)
-            
-            if face_distances[best_match_index] < self.tolerancia_reconocimiento:
-                mejor_coincidencia = self.cache_personas[best_match_index]
-                mejor_distancia = face_distances[best_match_index]
-                
+        if not embeddings:
+            return resultados
+        
+        # Comparar todos los rostros contra la galería en una sola operación
+        ids, distancias = self.galeria.buscar(embeddings)
+        
+        for i, (persona_id, distancia) in enumerate(zip(ids, distancias)):
+            distancia = float(distancia)
+            persona = self.cache_personas.get(int(persona_id))
+            if persona is not None and distancia < self.tolerancia_reconocimiento:
                 # Convertir distancia a confianza (0-100%)
-                confianza = max(0, min(100, (1 - mejor_distancia) * 100))
-                return mejor_coincidencia, confianza, ubicacion
+                confianza = max(0, min(100, (1 - distancia) * 100))
+                resultados[i] = (persona, confianza, distancia, ubicaciones[i])
+            else:
+                resultados[i] = (None, None, distancia, ubicaciones[i])
+        
+        return resultados
+    
+    def reconocer_personas(self, frame):
+        """
+        Reconoce todas las personas presentes en el frame
+        
+        Returns:
+            list: tuplas (persona, confianza, distancia, ubicacion) por rostro
+        """
+        embeddings, ubicaciones = self.extraer_embeddings_rostros(frame)
+        
+        if not embeddings:
+            return []
         
-        return None, None, ubicacion
+        return self.identificar(embeddings, ubicaciones)
+    
+    def reconocer_persona(self, frame):
+        """Reconoce la persona del primer rostro detectado en el frame"""
+        resultados = self.reconocer_personas(frame)
+        
+        if not resultados:
+            return None, None, None
+        
+        persona, confianza, _, ubicacion = resultados[0]
+        return persona, confianza, ubicacion
+    
+    def agregar_persona(self, persona, embedding):
+        """Agrega una persona recién registrada a la galería sin reconstruirla"""
+        self.cache_personas[persona.id] = PersonaGaleria(persona.id, persona.nombre, persona.apellido)
+        self.galeria.agregar(persona.id, embedding)
+        logger.info(f"Persona {persona.id} agregada a la galería ({len(self.galeria)} personas)")
+    
+    def eliminar_persona(self, persona_id):
+        """Quita una persona de la galería sin reconstruirla"""
+        self.galeria.eliminar(persona_id)
+        self.cache_personas.pop(persona_id, None)
     
     def actualizar_cache(self):
-        """Actualiza la cache de personas y embeddings para reconocimiento más rápido"""
+        """
+        Reconstruye la galería de personas y embeddings. Si la instantánea en disco
+        corresponde a la versión actual de la tabla de personas se mapea en memoria
+        sin consultar los embeddings; si no, se carga desde la base de datos y se
+        reescribe la instantánea.
+        """
         try:
-            personas = self.db.obtener_todas_personas()
-            self.cache_personas = personas
-            self.cache_embeddings = []
+            if self.ruta_instantanea and self._cargar_desde_instantanea():
+                return
             
-            for persona in personas:
-                embedding = self.db.obtener_embedding_persona(persona.id)
-                if embedding is not None:
-                    self.cache_embeddings.append(embedding)
+            # Una sola consulta: personas y matriz de embeddings ya decodificada
+            version = self.db.obtener_version_galeria()
+            personas, ids, embeddings = self.db.cargar_galeria()
             
-            logger.info(f"Cache actualizado: {len(personas)} personas cargadas")
+            # Publicar primero las personas para que toda fila del índice tenga su persona
+            self.cache_personas = {persona.id: persona for persona in personas}
+            self.galeria.reconstruir(ids, embeddings)
+            
+            if self.ruta_instantanea:
+                guardar_instantanea(self.ruta_instantanea, version, personas, ids, embeddings)
+            
+            logger.info(f"Cache actualizado: {len(ids)} personas cargadas")
         except Exception as e:
-            logger.error(f"Error al actualizar cache: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error al actualizar cache: {str(e)}")
+    
+    def _cargar_desde_instantanea(self):
+        """Mapea la instantánea de la galería si está al día; retorna False si no se pudo"""
+        instantanea = cargar_instantanea(self.ruta_instantanea, self.db.obtener_version_galeria())
+        if instantanea is None:
+            return False
+        
+        indice, ids, matriz = instantanea
+        personas = [
+            PersonaGaleria(int(persona_id), nombre, apellido)
+            for persona_id, nombre, apellido in zip(ids, indice['nombres'], indice['apellidos'])
+        ]
+        self.cache_personas = {persona.id: persona for persona in personas}
+        if isinstance(self.galeria, IndiceGaleria):
+            # Las páginas del archivo se comparten entre procesos hasta la primera modificación
+            self.galeria.cargar_compartida(ids, matriz)
+        else:
+            self.galeria.reconstruir(ids, np.asarray(matriz))
+        
+        logger.info(f"Galería mapeada desde instantánea: {len(ids)} personas")
+        return True
@@ -0,0 +1,422 @@
+import os
+import json
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceGaleria:
+    """
+    Índice contiguo de embeddings faciales para el reconocimiento.
+
+    Mantiene una matriz float32 preasignada (una fila por persona), las normas
+    cuadradas precalculadas y un mapa id -> fila. Las altas y bajas son O(1)
+    amortizado: la capacidad crece por duplicación y una baja mueve la última
+    fila al hueco. La búsqueda de todos los rostros de un frame se resuelve con
+    un único producto matricial (BLAS).
+    """
+
+    def __init__(self, dimension=128, capacidad_inicial=256):
+        self.dimension = dimension
+        self._matriz = np.zeros((capacidad_inicial, dimension), dtype=np.float32)
+        self._normas = np.zeros(capacidad_inicial, dtype=np.float32)
+        self._ids = np.zeros(capacidad_inicial, dtype=np.int64)
+        self._filas = {}
+        self._n = 0
+        self._compartida = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, persona_id):
+        return persona_id in self._filas
+
+    @property
+    def capacidad(self):
+        return self._matriz.shape[0]
+
+    def _asegurar_capacidad(self, requerida):
+        # Una matriz compartida (mapeada de disco) es de solo lectura: copiarla antes de escribir
+        if requerida <= self.capacidad and not self._compartida:
+            return
+
+        nueva_capacidad = max(requerida, self.capacidad * 2)
+        matriz = np.zeros((nueva_capacidad, self.dimension), dtype=np.float32)
+        normas = np.zeros(nueva_capacidad, dtype=np.float32)
+        ids = np.zeros(nueva_capacidad, dtype=np.int64)
+
+        matriz[:self._n] = self._matriz[:self._n]
+        normas[:self._n] = self._normas[:self._n]
+        ids[:self._n] = self._ids[:self._n]
+
+        self._matriz, self._normas, self._ids = matriz, normas, ids
+        self._compartida = False
+
+    def agregar(self, persona_id, embedding):
+        """Agrega (o reemplaza) el embedding de una persona"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(self.dimension)
+
+        with self._lock:
+            fila = self._filas.get(persona_id)
+            self._asegurar_capacidad(self._n + (1 if fila is None else 0))
+            if fila is None:
+                fila = self._n
+                self._n += 1
+                self._filas[persona_id] = fila
+                self._ids[fila] = persona_id
+
+            self._matriz[fila] = vector
+            self._normas[fila] = np.dot(vector, vector)
+
+    def eliminar(self, persona_id):
+        """Elimina a una persona del índice; retorna False si no estaba"""
+        with self._lock:
+            fila = self._filas.pop(persona_id, None)
+            if fila is None:
+                return False
+
+            self._asegurar_capacidad(self._n)
+            ultima = self._n - 1
+            if fila != ultima:
+                # Mover la última fila al hueco para mantener la matriz contigua
+                id_ultima = int(self._ids[ultima])
+                self._matriz[fila] = self._matriz[ultima]
+                self._normas[fila] = self._normas[ultima]
+                self._ids[fila] = id_ultima
+                self._filas[id_ultima] = fila
+
+            self._n -= 1
+            return True
+
+    def reconstruir(self, ids, embeddings):
+        """Reemplaza el contenido del índice por completo"""
+        matriz = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        with self._lock:
+            self._n = 0
+            self._filas = {}
+            self._asegurar_capacidad(len(ids))
+            self._matriz[:len(ids)] = matriz
+            self._normas[:len(ids)] = np.einsum('ij,ij->i', matriz, matriz)
+            self._ids[:len(ids)] = ids
+            self._filas = {int(persona_id): fila for fila, persona_id in enumerate(ids)}
+            self._n = len(ids)
+
+    def cargar_compartida(self, ids, matriz):
+        """
+        Usa directamente una matriz externa (p. ej. un memmap de solo lectura) sin copiarla,
+        de modo que varios procesos compartan las mismas páginas. La primera alta o baja
+        posterior crea una copia privada.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+
+        with self._lock:
+            self._matriz = matriz
+            self._normas = np.einsum('ij,ij->i', matriz, matriz).astype(np.float32)
+            self._ids = ids.copy()
+            self._filas = {int(persona_id): fila for fila, persona_id in enumerate(ids)}
+            self._n = len(ids)
+            self._compartida = True
+
+    def distancias(self, embeddings):
+        """
+        Distancias euclidianas de cada embedding de prueba contra toda la galería
+
+        Returns:
+            tuple: (matriz de distancias (rostros x personas), ids de las columnas)
+        """
+        probes = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+
+        with self._lock:
+            n = self._n
+            galeria = self._matriz[:n]
+            normas = self._normas[:n]
+            ids = self._ids[:n].copy()
+
+            # ||p - g||^2 = ||p||^2 + ||g||^2 - 2 p·g
+            distancias_cuadradas = probes @ galeria.T
+            distancias_cuadradas *= -2.0
+            distancias_cuadradas += normas[None, :]
+
+        distancias_cuadradas += np.einsum('ij,ij->i', probes, probes)[:, None]
+        np.maximum(distancias_cuadradas, 0.0, out=distancias_cuadradas)
+        return np.sqrt(distancias_cuadradas), ids
+
+    def buscar(self, embeddings):
+        """
+        Busca la persona más cercana para cada embedding de prueba
+
+        Returns:
+            tuple: (ids de la mejor coincidencia, distancias correspondientes);
+                   arrays vacíos si la galería está vacía
+        """
+        if self._n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        distancias, ids = self.distancias(embeddings)
+        if distancias.shape[1] == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        mejores = np.argmin(distancias, axis=1)
+        return ids[mejores], distancias[np.arange(len(mejores)), mejores]
+
+
+def ruta_instantanea_predeterminada(db_path):
+    """Ruta base de la instantánea de la galería de una base de datos: junto a ella"""
+    return os.path.splitext(db_path)[0] + "_galeria"
+
+
+def guardar_instantanea(ruta_base, version, personas, ids, matriz):
+    """
+    Guarda la galería en disco: `<ruta_base>.npy` con la matriz float32 y
+    `<ruta_base>.json` con la versión de la tabla de personas, los ids y los nombres.
+    Cada archivo se escribe en uno temporal y se reemplaza de forma atómica.
+    """
+    ruta_matriz = f"{ruta_base}.npy"
+    ruta_indice = f"{ruta_base}.json"
+    try:
+        temporal = f"{ruta_matriz}.tmp"
+        with open(temporal, 'wb') as f:
+            np.save(f, np.ascontiguousarray(matriz, dtype=np.float32))
+        os.replace(temporal, ruta_matriz)
+
+        indice = {
+            'version': version,
+            'filas': int(len(ids)),
+            'dimension': int(matriz.shape[1]),
+            'ids': [int(persona_id) for persona_id in ids],
+            'nombres': [persona.nombre for persona in personas],
+            'apellidos': [persona.apellido for persona in personas]
+        }
+        temporal = f"{ruta_indice}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(indice, f, ensure_ascii=False)
+        os.replace(temporal, ruta_indice)
+
+        logger.info(f"Instantánea de galería guardada: {len(ids)} personas (versión {version})")
+        return True
+    except OSError as e:
+        # En Windows no se puede reemplazar un archivo que otro proceso tiene mapeado
+        logger.warning(f"No se pudo guardar la instantánea de galería: {str(e)}")
+        return False
+
+
+def cargar_instantanea(ruta_base, version):
+    """
+    Mapea en memoria (solo lectura) la instantánea si coincide con la versión indicada.
+
+    Returns:
+        tuple: (índice del sidecar, ids, matriz memmap) o None si no existe o está desactualizada
+    """
+    ruta_matriz = f"{ruta_base}.npy"
+    ruta_indice = f"{ruta_base}.json"
+    if not os.path.exists(ruta_matriz) or not os.path.exists(ruta_indice):
+        return None
+
+    try:
+        with open(ruta_indice, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        if indice.get('version') != version:
+            return None
+
+        matriz = np.load(ruta_matriz, mmap_mode='r')
+        if matriz.shape != (indice['filas'], indice['dimension']):
+            return None
+
+        return indice, np.asarray(indice['ids'], dtype=np.int64), matriz
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Instantánea de galería inválida: {str(e)}")
+        return None
+
+
+class IndiceIVF:
+    """
+    Índice aproximado (IVF) para galerías muy grandes.
+
+    Los embeddings se agrupan con k-means en listas invertidas; cada búsqueda
+    solo examina las `num_sondeos` listas cuyos centroides están más cerca del
+    rostro y re-ordena esos candidatos con la distancia euclidiana exacta, de
+    modo que la distancia reportada es comparable con la tolerancia de
+    reconocimiento. Expone la misma interfaz que IndiceGaleria.
+    """
+
+    def __init__(self, dimension=128, num_listas=None, num_sondeos=8,
+                 min_entrenamiento=2048, iteraciones=10, semilla=0):
+        self.dimension = dimension
+        self.num_listas = num_listas
+        self.num_sondeos = num_sondeos
+        self.min_entrenamiento = min_entrenamiento
+        self.iteraciones = iteraciones
+        self.semilla = semilla
+        self._centroides = None
+        self._normas_centroides = None
+        self._ids_listas = [np.zeros(0, dtype=np.int64)]
+        self._vectores_listas = [np.zeros((0, dimension), dtype=np.float32)]
+        self._lista_de_id = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._lista_de_id)
+
+    def __contains__(self, persona_id):
+        return persona_id in self._lista_de_id
+
+    @property
+    def entrenado(self):
+        return self._centroides is not None
+
+    def _kmeans(self, matriz, num_listas):
+        rng = np.random.default_rng(self.semilla)
+
+        # Entrenar sobre una muestra para acotar el costo en galerías enormes
+        muestra = matriz
+        if len(matriz) > num_listas * 64:
+            muestra = matriz[rng.choice(len(matriz), num_listas * 64, replace=False)]
+
+        centroides = muestra[rng.choice(len(muestra), num_listas, replace=False)].copy()
+        for _ in range(self.iteraciones):
+            asignacion = self._mas_cercanos(muestra, centroides)
+            conteos = np.bincount(asignacion, minlength=num_listas)
+            vacias = conteos == 0
+
+            # Sumar los puntos de cada grupo ordenándolos por asignación
+            orden = np.argsort(asignacion, kind='stable')
+            inicios = np.concatenate([[0], np.cumsum(conteos)[:-1]])[~vacias]
+            sumas = np.zeros_like(centroides)
+            sumas[~vacias] = np.add.reduceat(muestra[orden], inicios, axis=0)
+
+            conteos[vacias] = 1
+            centroides = sumas / conteos[:, None]
+            # Reubicar centroides vacíos en puntos aleatorios de la muestra
+            if vacias.any():
+                centroides[vacias] = muestra[rng.choice(len(muestra), int(vacias.sum()))]
+
+        return centroides.astype(np.float32)
+
+    @staticmethod
+    def _mas_cercanos(matriz, centroides):
+        normas = np.einsum('ij,ij->i', centroides, centroides)
+        return np.argmin(normas[None, :] - 2.0 * (matriz @ centroides.T), axis=1)
+
+    def reconstruir(self, ids, embeddings):
+        """Reemplaza el contenido del índice, reentrenando los centroides si hay datos suficientes"""
+        matriz = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        with self._lock:
+            if len(ids) >= self.min_entrenamiento:
+                num_listas = self.num_listas or max(1, int(round(4 * np.sqrt(len(ids)))))
+                # k-means elige los centroides iniciales entre los embeddings sin repetir
+                num_listas = min(num_listas, len(ids))
+                self._centroides = self._kmeans(matriz, num_listas)
+                self._normas_centroides = np.einsum('ij,ij->i', self._centroides, self._centroides)
+                asignacion = self._mas_cercanos(matriz, self._centroides)
+            else:
+                # Pocas personas: una única lista, equivalente a la búsqueda exacta
+                num_listas = 1
+                self._centroides = None
+                self._normas_centroides = None
+                asignacion = np.zeros(len(ids), dtype=np.int64)
+
+            orden = np.argsort(asignacion, kind='stable')
+            limites = np.searchsorted(asignacion[orden], np.arange(num_listas + 1))
+            self._ids_listas = []
+            self._vectores_listas = []
+            for lista in range(num_listas):
+                filas = orden[limites[lista]:limites[lista + 1]]
+                self._ids_listas.append(ids[filas])
+                self._vectores_listas.append(matriz[filas])
+
+            self._lista_de_id = {int(persona_id): int(lista) for persona_id, lista in zip(ids, asignacion)}
+
+        logger.info(f"Índice IVF reconstruido: {len(ids)} personas en {num_listas} listas")
+
+    def _todos(self):
+        ids = np.concatenate(self._ids_listas)
+        vectores = np.concatenate(self._vectores_listas)
+        return ids, vectores
+
+    def agregar(self, persona_id, embedding):
+        """Agrega (o reemplaza) el embedding de una persona en su lista más cercana"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, self.dimension)
+
+        with self._lock:
+            self.eliminar(persona_id)
+
+            lista = 0
+            if self.entrenado:
+                lista = int(self._mas_cercanos(vector, self._centroides)[0])
+
+            self._ids_listas[lista] = np.append(self._ids_listas[lista], persona_id)
+            self._vectores_listas[lista] = np.vstack([self._vectores_listas[lista], vector])
+            self._lista_de_id[persona_id] = lista
+
+            # Entrenar en cuanto la galería alcanza el tamaño mínimo
+            if not self.entrenado and len(self) >= self.min_entrenamiento:
+                self.reconstruir(*self._todos())
+
+    def eliminar(self, persona_id):
+        """Elimina a una persona del índice; retorna False si no estaba"""
+        with self._lock:
+            lista = self._lista_de_id.pop(persona_id, None)
+            if lista is None:
+                return False
+
+            conservar = self._ids_listas[lista] != persona_id
+            self._ids_listas[lista] = self._ids_listas[lista][conservar]
+            self._vectores_listas[lista] = self._vectores_listas[lista][conservar]
+            return True
+
+    def buscar_k(self, embeddings, k=1):
+        """
+        Busca los k candidatos más cercanos de cada embedding con distancia exacta
+
+        Returns:
+            tuple: (ids (rostros x k), distancias (rostros x k)); los huecos se
+                   rellenan con id -1 y distancia infinita
+        """
+        probes = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        ids_resultado = np.full((len(probes), k), -1, dtype=np.int64)
+        distancias_resultado = np.full((len(probes), k), np.inf, dtype=np.float32)
+
+        with self._lock:
+            if self.entrenado:
+                # Listas a sondear para todos los rostros en un solo producto matricial
+                cercania = self._normas_centroides[None, :] - 2.0 * (probes @ self._centroides.T)
+                num_sondeos = min(self.num_sondeos, len(self._centroides))
+                sondeos = np.argpartition(cercania, num_sondeos - 1, axis=1)[:, :num_sondeos]
+            else:
+                sondeos = np.zeros((len(probes), 1), dtype=np.int64)
+
+            for i, probe in enumerate(probes):
+                listas = sondeos[i]
+                ids = np.concatenate([self._ids_listas[lista] for lista in listas])
+                if len(ids) == 0:
+                    continue
+                vectores = np.concatenate([self._vectores_listas[lista] for lista in listas])
+
+                # Re-ordenar los candidatos con la distancia exacta
+                diferencias = vectores - probe
+                distancias = np.sqrt(np.einsum('ij,ij->i', diferencias, diferencias))
+
+                top = min(k, len(ids))
+                mejores = np.argpartition(distancias, top - 1)[:top]
+                mejores = mejores[np.argsort(distancias[mejores])]
+                ids_resultado[i, :top] = ids[mejores]
+                distancias_resultado[i, :top] = distancias[mejores]
+
+        return ids_resultado, distancias_resultado
+
+    def buscar(self, embeddings):
+        """
+        Busca la persona más cercana para cada embedding de prueba
+
+        Returns:
+            tuple: (ids de la mejor coincidencia, distancias correspondientes)
+        """
+        ids, distancias = self.buscar_k(embeddings, k=1)
+        return ids[:, 0], distancias[:, 0]
@@ -1,67 +1,168 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import cv2
-from PIL import Image, ImageTk
 import threading
 import time
 import logging
+import os
+from functools import partial
 from database import DatabaseManager, Persona
 from face_recognizer import ReconocedorFacial
 from emotion_analyzer import analizador_emociones
 from report_generator import GeneradorReportes
+from cache_reportes import CacheReportes
+from pipeline import HiloCaptura, PlanificadorInferencia, ControladorLatencia, abrir_fuente
+from seguimiento import SeguidorRostros
+from registro_rostros import TrabajadorRegistro
+from presentacion import RenderizadorVista
+from metricas import marcas_arranque, registro_metricas
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+# Relleno interno de los marcos con vista de cámara y ancho de su borde, en píxeles
+RELLENO_VISTA = 10
+BORDE_MARCO = 2
+
 class SistemaReconocimientoFacial:
-    def __init__(self, root):
+    def __init__(self, root, fuentes=None, mostrar_overlay=False, fps_objetivo=15.0, latencia_objetivo=0.2,
+                 detector="hog"):
+        """
+        Args:
+            root: ventana principal de Tk
+            fuentes: cámaras a usar (índices de dispositivo, archivos de video o URLs RTSP);
+                la primera se usa también para el registro. Por defecto, la cámara 0.
+            mostrar_overlay: dibujar FPS y latencias sobre la vista de detección
+            fps_objetivo, latencia_objetivo: metas por cámara (FPS y segundos) que el
+                controlador de latencia sostiene ajustando la calidad de la detección
+            detector: detector de rostros (ver detectores.py)
+        """
         self.root = root
         self.root.title("Sistema de Reconocimiento Facial con FER - Análisis de Emociones")
         self.root.geometry("1200x700")
         
         # Inicializar componentes del sistema
         self.db = DatabaseManager()
-        self.reconocedor = ReconocedorFacial(self.db)
+        self.escritor_detecciones = self.db.crear_escritor_detecciones()
+        self.reconocedor = ReconocedorFacial(self.db, detector=detector)
         self.analizador = analizador_emociones  # Usar FER en lugar del analizador anterior
-        self.generador_reportes = GeneradorReportes(self.db)
+        # Las páginas ya dibujadas se reutilizan mientras no cambien sus datos
+        self.generador_reportes = GeneradorReportes(self.db, CacheReportes())
+        self.fuentes = list(fuentes) if fuentes else [0]
+        # Un seguidor por cámara; la galería y el escritor son compartidos
+        self.seguidores = [SeguidorRostros(self.reconocedor) for _ in self.fuentes]
         
         # Variables de estado optimizadas
         self.capturando = False
+        self.trabajador_registro = None
         self.detectando = False
         self.cap = None
+        self.captura = None
+        self.capturas = []
+        self.pipeline = None
+        # Planificador detenido cuyos trabajadores aún no terminaban su último frame
+        self.pipeline_anterior = None
+        self.num_trabajadores_inferencia = 1
         self.procesamiento_activo = False
         self.ultimo_frame = None
         self.frame_count = 0
-        
-        # Historial para suavizado de emociones
-        self.historial_emociones = []
+        self.ultima_actualizacion_metricas = 0.0
+        self.intervalo_vista_ms = 15
+        self.lineas_overlay = []
+        
+        # Calidad adaptativa: el controlador de cada cámara fija el intervalo y la
+        # escala de detección de su seguidor y cada cuántos frames se clasifican emociones
+        self.fps_objetivo = fps_objetivo
+        self.latencia_objetivo = latencia_objetivo
+        self.intervalos_emociones = {}
+        self.frames_camara = {}
+        self.ultimas_emociones = {}
+        self.var_overlay = tk.BooleanVar(value=mostrar_overlay)
+        
+        # Registro en base de datos como máximo cada 0.5 s (~15 frames a 30 FPS) por persona
+        self.intervalo_registro = 0.5
+        self.ultimo_registro = {}
+        
+        # Historial para suavizado de emociones, uno por persona reconocida
+        self.historial_emociones = {}
         self.max_historial = 5
+        self.lock_historial = threading.Lock()
+        
+        self.registrar_metricas()
         
         # Configurar interfaz
         self.configurar_interfaz()
+        self.root.protocol("WM_DELETE_WINDOW", self.cerrar)
+        
+        # Precargar los modelos en segundo plano una vez que la ventana sea visible
+        self.modelos_listos = False
+        self.root.after(0, self.iniciar_precarga_modelos)
         
         # Inicializar cámara en hilo separado
         self.inicializar_camara_async()
     
+    def registrar_metricas(self):
+        """
+        Expone las colas y contadores que ya llevan el escritor y las cámaras; se
+        leen solo al exportar, sin costo en los hilos de captura e inferencia
+        """
+        escritor = self.escritor_detecciones
+        registro_metricas.medidor_funcion(
+            'cola_detecciones', escritor.pendientes, "Detecciones en cola sin escribir")
+        registro_metricas.medidor_funcion(
+            'detecciones_escritas_total', lambda: escritor.escritas, "Detecciones escritas", 'counter')
+        registro_metricas.medidor_funcion(
+            'detecciones_descartadas_total', lambda: escritor.descartadas, "Detecciones descartadas", 'counter')
+        registro_metricas.medidor_funcion(
+            'frames_capturados_total',
+            lambda: [({'camara': c.nombre}, c.frames_capturados) for c in self.capturas],
+            "Frames leídos por cámara", 'counter')
+        
+        def por_flujo(funcion):
+            pipeline = self.pipeline
+            if pipeline is None:
+                return []
+            return [({'camara': flujo.nombre}, funcion(flujo)) for flujo in pipeline.flujos
+                    if flujo.entrada is not None]
+        
+        registro_metricas.medidor_funcion(
+            'frames_descartados_total', lambda: por_flujo(lambda f: f.entrada.descartados),
+            "Frames reemplazados antes de procesarse", 'counter')
+        registro_metricas.medidor_funcion(
+            'frames_procesados_total', lambda: por_flujo(lambda f: f.frames_procesados),
+            "Frames procesados por cámara", 'counter')
+        registro_metricas.medidor_funcion(
+            'cola_camara', lambda: por_flujo(lambda f: len(f.entrada)), "Frames en espera por cámara")
+        registro_metricas.medidor_funcion(
+            'fps_camara', lambda: por_flujo(lambda f: f.metricas()['fps']), "FPS procesados por cámara")
+        registro_metricas.medidor_funcion(
+            'nivel_calidad', lambda: por_flujo(lambda f: f.controlador.indice if f.controlador else 0),
+            "Nivel del controlador de latencia (0 = máxima calidad)")
+        registro_metricas.medidor_funcion(
+            'latencia_camara_segundos', lambda: por_flujo(lambda f: f.metricas()['latencia_ms'] / 1000),
+            "Latencia media captura -> resultado por cámara")
+    
     def inicializar_camara_async(self):
-        """Inicializa la cámara en un hilo separado"""
+        """Inicializa las cámaras en un hilo separado"""
         def init_camera():
             try:
-                self.cap = cv2.VideoCapture(0)
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)  # Reducir resolución para mejor rendimiento
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                self.cap.set(cv2.CAP_PROP_FPS, 30)
-                
-                if not self.cap.isOpened():
-                    self.root.after(0, lambda: messagebox.showerror("Error", "No se pudo acceder a la cámara"))
-                    return
+                for indice, fuente in enumerate(self.fuentes):
+                    captura = self.abrir_captura(indice, fuente)
+                    if captura is None:
+                        if indice == 0:
+                            self.root.after(0, lambda: messagebox.showerror("Error", "No se pudo acceder a la cámara"))
+                            return
+                        continue
+                    
+                    self.capturas.append(captura)
+                    if indice == 0:
+                        # La primera cámara alimenta también el registro y la vista general
+                        self.cap = captura.cap
+                        self.captura = captura
+                        self.procesamiento_activo = True
+                        self.root.after(0, self.actualizar_vista_general)
                 
-                logger.info("Cámara inicializada exitosamente")
-                # Probar la cámara
-                ret, frame = self.cap.read()
-                if ret:
-                    self.procesamiento_activo = True
-                    self.actualizar_vista_general()
+                self.root.after(0, self.actualizar_lista_camaras)
                 
             except Exception as e:
                 self.root.after(0, lambda: messagebox.showerror("Error", f"Error al inicializar cámara: {str(e)}"))
@@ -70,8 +171,58 @@ class SistemaReconocimientoFacial:
         camera_thread = threading.Thread(target=init_camera, daemon=True)
         camera_thread.start()
     
+    def abrir_captura(self, indice, fuente):
+        """Abre una fuente y lanza su hilo de captura; retorna None si no está disponible"""
+        cap, es_dispositivo = abrir_fuente(fuente)
+        if not cap.isOpened():
+            logger.error(f"No se pudo abrir la fuente {fuente}")
+            return None
+        
+        # Probar la cámara
+        ret, _ = cap.read()
+        if not ret:
+            logger.error(f"La fuente {fuente} no entrega frames")
+            cap.release()
+            return None
+        
+        # Los archivos de video simulan una cámara en vivo: a su ritmo y en bucle
+        fps_archivo = None if es_dispositivo else (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+        captura = HiloCaptura(cap, nombre=f"{indice}: {fuente}", fps_objetivo=fps_archivo,
+                              repetir=not es_dispositivo)
+        # La lectura continua de la cámara ocurre en su propio hilo
+        captura.start()
+        logger.info(f"Cámara {fuente} inicializada exitosamente")
+        return captura
+    
+    def iniciar_precarga_modelos(self):
+        """Carga y calienta los modelos de rostros y emociones en un hilo separado"""
+        marcas_arranque.marcar("ventana_visible")
+        
+        def precargar():
+            try:
+                self.reconocedor.precargar()
+                self.analizador.precargar()
+                segundos = marcas_arranque.marcar("modelos_listos")
+                self.root.after(0, lambda: self.marcar_modelos_listos(segundos))
+            except Exception as e:
+                logger.error(f"Error al precargar modelos: {str(e)}")
+                self.root.after(0, lambda: self.label_estado_modelos.config(
+                    text="Modelos: error al cargar (se reintentará al usarlos)"
+                ))
+        
+        threading.Thread(target=precargar, daemon=True).start()
+    
+    def marcar_modelos_listos(self, segundos):
+        """Informa en la interfaz que los modelos ya están cargados"""
+        self.modelos_listos = True
+        self.label_estado_modelos.config(text=f"Modelos listos ({segundos:.1f} s desde el inicio)")
+    
     def configurar_interfaz(self):
         """Configura la interfaz gráfica principal"""
+        # Barra de estado de carga de modelos
+        self.label_estado_modelos = ttk.Label(self.root, text="Modelos: cargando en segundo plano...")
+        self.label_estado_modelos.pack(side='bottom', fill='x', padx=10, pady=(0, 5))
+        
         # Notebook (pestañas)
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -131,11 +282,13 @@ class SistemaReconocimientoFacial:
         self.btn_registrar.pack(side='left', padx=5)
         
         # Vista previa de cámara
-        frame_camara = ttk.LabelFrame(self.frame_registro, text="Vista Previa", padding=10)
+        frame_camara = ttk.LabelFrame(self.frame_registro, text="Vista Previa", padding=RELLENO_VISTA)
         frame_camara.grid(row=0, column=1, rowspan=2, padx=10, pady=10, sticky='nsew')
         
         self.label_camara = ttk.Label(frame_camara)
         self.label_camara.pack()
+        self.render_registro = RenderizadorVista(self.label_camara, 'registro',
+                                                 relleno=2 * (RELLENO_VISTA + BORDE_MARCO))
         
         # Indicador de progreso
         self.progress_registro = ttk.Progressbar(
@@ -164,11 +317,14 @@ class SistemaReconocimientoFacial:
         self.notebook.add(self.frame_deteccion, text="Detección en Tiempo Real")
         
         # Vista de cámara
-        frame_camara_deteccion = ttk.LabelFrame(self.frame_deteccion, text="Detección en Tiempo Real", padding=10)
+        frame_camara_deteccion = ttk.LabelFrame(self.frame_deteccion, text="Detección en Tiempo Real",
+                                                padding=RELLENO_VISTA)
         frame_camara_deteccion.pack(fill='both', expand=True, padx=10, pady=10)
         
         self.label_camara_deteccion = ttk.Label(frame_camara_deteccion)
         self.label_camara_deteccion.pack()
+        self.render_deteccion = RenderizadorVista(self.label_camara_deteccion, 'deteccion',
+                                                  relleno=2 * (RELLENO_VISTA + BORDE_MARCO))
         
         # Información de detección
         frame_info = ttk.Frame(frame_camara_deteccion)
@@ -183,6 +339,10 @@ class SistemaReconocimientoFacial:
         self.label_info_confianza = ttk.Label(frame_info, text="Confianza: -", font=('Arial', 12))
         self.label_info_confianza.pack()
         
+        # FPS y latencia de cada cámara
+        self.label_metricas_camaras = ttk.Label(frame_info, text="", font=('Arial', 9))
+        self.label_metricas_camaras.pack()
+        
         # Controles
         frame_controles = ttk.Frame(frame_camara_deteccion)
         frame_controles.pack(fill='x', pady=10)
@@ -208,6 +368,16 @@ class SistemaReconocimientoFacial:
             command=self.actualizar_cache_sistema
         )
         self.btn_actualizar_cache.pack(side='left', padx=5)
+        
+        ttk.Label(frame_controles, text="Cámara:").pack(side='left', padx=(15, 5))
+        self.combo_camaras = ttk.Combobox(frame_controles, state="readonly", width=30)
+        self.combo_camaras.pack(side='left', padx=5)
+        
+        ttk.Checkbutton(
+            frame_controles,
+            text="Mostrar FPS/latencia",
+            variable=self.var_overlay
+        ).pack(side='left', padx=5)
     
     def crear_pestana_reportes(self):
         """Crea la pestaña de reportes y estadísticas"""
@@ -248,6 +418,27 @@ class SistemaReconocimientoFacial:
         )
         self.btn_reporte_general.pack(side='left', padx=5)
         
+        self.btn_reportes_todos = ttk.Button(
+            frame_botones_reporte,
+            text="Reportes de Todas las Personas",
+            command=self.generar_reportes_todas_personas
+        )
+        self.btn_reportes_todos.pack(side='left', padx=5)
+        
+        self.btn_exportar_csv = ttk.Button(
+            frame_botones_reporte,
+            text="Exportar Historial CSV",
+            command=self.exportar_historial_csv
+        )
+        self.btn_exportar_csv.pack(side='left', padx=5)
+        
+        self.btn_eliminar_persona = ttk.Button(
+            frame_botones_reporte,
+            text="Eliminar Persona",
+            command=self.eliminar_persona
+        )
+        self.btn_eliminar_persona.pack(side='left', padx=5)
+        
         # Área de visualización
         frame_visualizacion = ttk.LabelFrame(self.frame_reportes, text="Vista Previa", padding=10)
         frame_visualizacion.pack(fill='both', expand=True, padx=10, pady=10)
@@ -264,33 +455,36 @@ class SistemaReconocimientoFacial:
     
     def actualizar_vista_general(self):
         """Actualiza la vista de cámara general cuando no hay procesos activos"""
-        if not self.procesamiento_activo or not self.cap:
+        if not self.procesamiento_activo or not self.captura:
             return
         
         try:
-            ret, frame = self.cap.read()
-            if ret:
+            # Vistas de cámara que no tienen un proceso propio activo; cada renderizador
+            # omite el dibujo si su pestaña está oculta o si el frame no cambió
+            renderizadores = []
+            if not self.capturando:
+                renderizadores.append(self.render_registro)
+            if not self.detectando:
+                renderizadores.append(self.render_deteccion)
+            
+            ultimo = self.captura.ultimo_frame()
+            if ultimo is not None:
                 # Mostrar vista simple sin procesamiento
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame_rgb)
-                img_tk = ImageTk.PhotoImage(image=img)
-                
-                # Actualizar todas las vistas de cámara
-                for label in [self.label_camara, self.label_camara_deteccion]:
-                    if hasattr(label, 'img_tk'):
-                        label.img_tk = img_tk
-                        label.config(image=img_tk)
-                
-            # Continuar actualización
+                for renderizador in renderizadores:
+                    if renderizador.mostrar(ultimo.imagen, clave=ultimo.numero):
+                        marcas_arranque.marcar("primer_frame")
+            
+            # Continuar actualización: al ritmo de la cámara si hay alguna vista libre,
+            # y solo comprobando de vez en cuando mientras registro y detección dibujan por su cuenta
             if self.procesamiento_activo:
-                self.root.after(50, self.actualizar_vista_general)
+                self.root.after(33 if renderizadores else 250, self.actualizar_vista_general)
                 
         except Exception as e:
             logger.error(f"Error en actualización general: {str(e)}")
     
     def iniciar_captura_registro(self):
         """Inicia el proceso de captura para registro"""
-        if not self.cap or not self.cap.isOpened():
+        if not self.captura or not self.cap.isOpened():
             messagebox.showerror("Error", "Cámara no disponible")
             return
         
@@ -302,6 +496,13 @@ class SistemaReconocimientoFacial:
         self.capturando = True
         self.reconocedor.reiniciar_registro()
         
+        # La detección, los filtros de calidad y los embeddings corren en un hilo aparte;
+        # el hilo de Tk solo dibuja la vista previa
+        self.trabajador_registro = TrabajadorRegistro(
+            self.reconocedor, self.captura, muestras=self.reconocedor.capturas_por_registro
+        )
+        self.trabajador_registro.start()
+        
         self.btn_iniciar_captura.config(state='disabled')
         self.btn_detener_captura.config(state='normal')
         self.btn_registrar.config(state='disabled')
@@ -312,6 +513,13 @@ class SistemaReconocimientoFacial:
     def detener_captura_registro(self):
         """Detiene el proceso de captura para registro"""
         self.capturando = False
+        trabajador = self.trabajador_registro
+        if trabajador is not None:
+            self.trabajador_registro = None
+            # Las muestras pasan al reconocedor solo con el trabajador ya detenido
+            self.reconocedor.reiniciar_registro()
+            for embedding in trabajador.entregar():
+                self.reconocedor.registrar_muestra(embedding)
         self.btn_iniciar_captura.config(state='normal')
         self.btn_detener_captura.config(state='disabled')
         
@@ -322,41 +530,38 @@ class SistemaReconocimientoFacial:
             self.label_estado_registro.config(text="Captura detenida. Capturas insuficientes.")
     
     def actualizar_vista_registro(self):
-        """Actualiza la vista de cámara en la pestaña de registro"""
-        if not self.capturando or not self.cap:
+        """Dibuja la vista previa del registro con el último estado del trabajador de captura"""
+        trabajador = self.trabajador_registro
+        if not self.capturando or not self.captura or trabajador is None:
             return
         
-        ret, frame = self.cap.read()
-        if ret:
-            # Procesar frame para captura
-            captura_exitosa, ubicacion = self.reconocedor.capturar_para_registro(frame)
-            
-            # Dibujar rectángulo alrededor del rostro
-            if ubicacion:
-                top, right, bottom, left = ubicacion
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                cv2.putText(frame, f"Captura {self.reconocedor.capturas_realizadas}/3", 
-                           (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            # Convertir para mostrar en Tkinter
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            img_tk = ImageTk.PhotoImage(image=img)
-            
-            self.label_camara.img_tk = img_tk
-            self.label_camara.config(image=img_tk)
-            
-            # Actualizar progreso
-            self.progress_registro['value'] = self.reconocedor.capturas_realizadas
-            self.label_progreso.config(
-                text=f"Capturas: {self.reconocedor.capturas_realizadas}/{self.reconocedor.capturas_por_registro}"
-            )
-            
-            # Continuar captura si es necesario
-            if self.reconocedor.capturas_realizadas < self.reconocedor.capturas_por_registro:
-                self.root.after(100, self.actualizar_vista_registro)  # Más lento para mejor captura
-            else:
-                self.detener_captura_registro()
+        ultimo = self.captura.ultimo_frame()
+        if ultimo is None:
+            self.root.after(100, self.actualizar_vista_registro)
+            return
+        
+        ubicacion, mensaje = trabajador.estado
+        frame = ultimo.imagen.copy() if ubicacion else ultimo.imagen
+        
+        # Dibujar rectángulo alrededor del rostro (posición de la última evaluación)
+        if ubicacion:
+            top, right, bottom, left = ubicacion
+            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+            cv2.putText(frame, f"Captura {trabajador.aceptadas}/{trabajador.muestras}", 
+                       (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        self.label_estado_registro.config(text=mensaje)
+        
+        self.render_registro.mostrar(frame, clave=(ultimo.numero, ubicacion, mensaje))
+        
+        # Actualizar progreso
+        self.progress_registro['value'] = trabajador.aceptadas
+        self.label_progreso.config(text=f"Capturas: {trabajador.aceptadas}/{trabajador.muestras}")
+        
+        # La captura termina sola al reunir suficientes muestras de calidad
+        if not trabajador.terminado:
+            self.root.after(33, self.actualizar_vista_registro)
+        else:
+            self.detener_captura_registro()
     
     def registrar_persona(self):
         """Registra una nueva persona en el sistema"""
@@ -374,6 +579,11 @@ class SistemaReconocimientoFacial:
         exito, mensaje = self.db.registrar_persona(nombre, apellido, email, embedding)
         
         if exito:
+            # Agregar a la galería de forma incremental, sin recargar todas las personas
+            persona = self.db.buscar_persona_por_email(email)
+            if persona:
+                self.reconocedor.agregar_persona(persona, embedding)
+            
             messagebox.showinfo("Éxito", mensaje)
             self.limpiar_formulario_registro()
             self.actualizar_lista_personas()
@@ -389,24 +599,78 @@ class SistemaReconocimientoFacial:
         self.label_progreso.config(text="Capturas: 0/3")
         self.label_estado_registro.config(text="Listo para capturar")
     
+    def actualizar_lista_camaras(self):
+        """Actualiza el selector de cámara de la pestaña de detección"""
+        self.combo_camaras['values'] = [captura.nombre for captura in self.capturas]
+        if self.capturas:
+            self.combo_camaras.current(0)
+    
     def iniciar_deteccion(self):
         """Inicia el proceso de detección en tiempo real"""
-        if not self.cap or not self.cap.isOpened():
+        if not self.captura or not self.cap.isOpened():
             messagebox.showerror("Error", "Cámara no disponible")
             return
         
+        # El estado compartido con los trabajadores solo se reinicia cuando los del
+        # planificador anterior terminaron de verdad
+        if self.pipeline_anterior is not None:
+            if not self.pipeline_anterior.esperar(timeout=2.0):
+                messagebox.showwarning("Detección", "La detección anterior aún está terminando. "
+                                                    "Intente de nuevo en unos segundos.")
+                return
+            self.pipeline_anterior = None
+        
         self.detectando = True
         self.btn_iniciar_deteccion.config(state='disabled')
         self.btn_detener_deteccion.config(state='normal')
         
-        # Reiniciar contador de frames
+        # Reiniciar contador de frames y pistas de seguimiento
         self.frame_count = 0
+        self.ultima_actualizacion_metricas = 0.0
+        
+        # La captura, la inferencia y el registro ocurren fuera del hilo de Tk.
+        # Con varias cámaras se agregan trabajadores (hasta uno por núcleo) que el
+        # planificador reparte por turnos, para que cada cámara no frene a las demás.
+        num_trabajadores = max(self.num_trabajadores_inferencia,
+                               min(len(self.capturas), os.cpu_count() or 1))
+        self.pipeline = PlanificadorInferencia(num_trabajadores=num_trabajadores)
+        self.frames_camara = {}
+        self.ultimas_emociones = {}
+        for indice, captura in enumerate(self.capturas):
+            seguidor = self.seguidores[indice]
+            seguidor.reiniciar()
+            # Cada cámara dispone de su parte de los trabajadores para cumplir el objetivo
+            controlador = ControladorLatencia(
+                fps_objetivo=self.fps_objetivo,
+                latencia_objetivo=self.latencia_objetivo,
+                trabajadores_por_fuente=num_trabajadores / len(self.capturas),
+                al_cambiar=partial(self.aplicar_nivel_calidad, indice)
+            )
+            self.pipeline.agregar_fuente(
+                captura.nombre,
+                captura,
+                partial(self.procesar_frame_deteccion, seguidor=seguidor, camara=indice),
+                controlador
+            )
+        self.pipeline.iniciar()
         
         self.actualizar_vista_deteccion()
     
+    def aplicar_nivel_calidad(self, camara, nivel):
+        """Aplica un NivelCalidad del controlador de latencia a una cámara"""
+        seguidor = self.seguidores[camara]
+        seguidor.intervalo_deteccion = nivel.intervalo_deteccion
+        seguidor.escala_deteccion = nivel.escala_deteccion
+        self.intervalos_emociones[camara] = nivel.intervalo_emociones
+    
     def detener_deteccion(self):
         """Detiene el proceso de detección"""
         self.detectando = False
+        if self.pipeline:
+            if not self.pipeline.detener():
+                self.pipeline_anterior = self.pipeline
+            self.pipeline = None
+        
         self.btn_iniciar_deteccion.config(state='normal')
         self.btn_detener_deteccion.config(state='disabled')
         
@@ -414,91 +678,196 @@ class SistemaReconocimientoFacial:
         self.label_info_persona.config(text="Persona: No detectada")
         self.label_info_emocion.config(text="Emoción: -")
         self.label_info_confianza.config(text="Confianza: -")
+        self.label_metricas_camaras.config(text="")
+    
+    def procesar_frame_deteccion(self, frame, seguidor=None, camara=0):
+        """
+        Reconoce, analiza la emoción y anota todos los rostros de un frame. Se ejecuta
+        en un trabajador del pipeline, por lo que no debe tocar widgets de Tk.
+        
+        Args:
+            frame: Frame capturado
+            seguidor: SeguidorRostros de la cámara del frame (por defecto, el de la primera)
+            camara: índice de la cámara, para suavizar las emociones por cámara y persona
+        
+        Returns:
+            dict: frame anotado y textos para los labels de información
+        """
+        frame_procesado = frame.imagen.copy()
+        resultado = {
+            'frame': frame_procesado,
+            'numero': frame.numero,
+            'persona': "Persona: No detectada",
+            'emocion': "Emoción: -",
+            'confianza': "Confianza: -"
+        }
+        
+        # Reconocimiento de todos los rostros; el seguidor evita detectar y codificar en cada frame
+        rostros = (seguidor or self.seguidores[0]).procesar(frame.imagen)
+        reconocidos = [(p, c, u) for p, c, _, u in rostros if p is not None]
+        
+        # Las emociones se clasifican cada `intervalo` frames (según el controlador de
+        # latencia); entre medias se reutiliza la última de cada persona
+        intervalo = self.intervalos_emociones.get(camara, 1)
+        numero = self.frames_camara[camara] = self.frames_camara.get(camara, 0) + 1
+        pendientes = [
+            (persona, ubicacion) for persona, _, ubicacion in reconocidos
+            if numero % intervalo == 0 or (camara, persona.id) not in self.ultimas_emociones
+        ]
+        
+        # Predecir emociones de todos los rostros pendientes en una sola pasada
+        emociones = self.analizador.predecir_emociones(frame.imagen, [u for _, u in pendientes])
+        nuevas = {persona.id: emocion for (persona, _), emocion in zip(pendientes, emociones)}
+        
+        textos_persona = []
+        textos_emocion = []
+        textos_confianza = []
+        ahora = time.monotonic()
+        
+        for persona, confianza, ubicacion in reconocidos:
+            # Dibujar rectángulo alrededor del rostro
+            top, right, bottom, left = ubicacion
+            cv2.rectangle(frame_procesado, (left, top), (right, bottom), (0, 255, 0), 2)
+            
+            clave = (camara, persona.id)
+            anterior = None if persona.id in nuevas else self.ultimas_emociones.get(clave)
+            if anterior is not None:
+                emocion_suavizada, confianza_suavizada = anterior
+            else:
+                if persona.id not in nuevas:
+                    # Sin emoción previa (p. ej. el estado se reinició durante este frame): clasificar ahora
+                    nuevas[persona.id] = (self.analizador.predecir_emociones(frame.imagen, [ubicacion])
+                                          or [("Neutral", 0.0)])[0]
+                # Aplicar suavizado al historial de emociones de esta persona
+                emocion_suavizada, confianza_suavizada = self.suavizar_emocion(*nuevas[persona.id], clave=clave)
+                self.ultimas_emociones[clave] = (emocion_suavizada, confianza_suavizada)
+            
+            # Registrar detección (escritura diferida en lote, limitada en el tiempo por persona)
+            if persona.id in nuevas and ahora - self.ultimo_registro.get(persona.id, 0.0) >= self.intervalo_registro:
+                self.ultimo_registro[persona.id] = ahora
+                self.escritor_detecciones.registrar(persona.id, emocion_suavizada, confianza_suavizada)
+            
+            textos_persona.append(f"{persona.nombre} {persona.apellido}")
+            textos_emocion.append(emocion_suavizada)
+            textos_confianza.append(f"{confianza:.1f}% / {confianza_suavizada:.1%}")
+            
+            # Añadir texto al frame
+            cv2.putText(frame_procesado, f"{persona.nombre}", 
+                       (left, top-30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            cv2.putText(frame_procesado, f"{emocion_suavizada} ({confianza_suavizada:.1%})", 
+                       (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        
+        # Rostros no reconocidos
+        for persona, _, _, ubicacion in rostros:
+            if persona is None:
+                top, right, bottom, left = ubicacion
+                cv2.rectangle(frame_procesado, (left, top), (right, bottom), (0, 0, 255), 2)
+                cv2.putText(frame_procesado, "Desconocido", 
+                           (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        
+        resultado['reconocidos'] = len(textos_persona)
+        if textos_persona:
+            resultado['persona'] = "Persona: " + ", ".join(textos_persona)
+            resultado['emocion'] = "Emoción: " + ", ".join(textos_emocion)
+            resultado['confianza'] = "Reconocimiento / Emoción: " + ", ".join(textos_confianza)
+        
+        return resultado
     
     def actualizar_vista_deteccion(self):
-        """Actualiza la vista de detección en tiempo real - OPTIMIZADO CON FER"""
-        if not self.detectando or not self.cap:
+        """Dibuja el resultado anotado más reciente del pipeline de detección"""
+        if not self.detectando or not self.pipeline:
             return
         
-        ret, frame = self.cap.read()
-        if ret:
+        # Solo se dibuja la cámara seleccionada; las demás siguen registrando detecciones
+        indice = max(self.combo_camaras.current(), 0)
+        flujos = self.pipeline.flujos
+        resultado = flujos[indice].resultados.obtener_ultimo() if indice < len(flujos) else None
+        self.actualizar_metricas_camaras()
+        # Con la pestaña oculta los resultados se descartan sin tocar los widgets
+        if resultado is not None and self.render_deteccion.visible():
             self.frame_count += 1
             
-            # Procesar cada 2 frames para mejor rendimiento (FER puede ser más lento)
-            procesar_este_frame = (self.frame_count % 2 == 0)
-            
-            frame_procesado = frame.copy()
-            
-            if procesar_este_frame:
-                # Realizar reconocimiento facial
-                persona, confianza, ubicacion = self.reconocedor.reconocer_persona(frame)
-                
-                if persona and ubicacion:
-                    # Dibujar rectángulo alrededor del rostro
-                    top, right, bottom, left = ubicacion
-                    cv2.rectangle(frame_procesado, (left, top), (right, bottom), (0, 255, 0), 2)
-                    
-                    # Predecir emoción usando FER
-                    emocion, confianza_emocion = self.analizador.predecir_emocion(frame, ubicacion)
-                    
-                    # Aplicar suavizado al historial de emociones
-                    emocion_suavizada, confianza_suavizada = self.suavizar_emocion(emocion, confianza_emocion)
-                    
-                    # Registrar detección en base de datos (solo cada 15 frames para no saturar)
-                    if self.frame_count % 15 == 0:
-                        self.db.registrar_deteccion(persona.id, emocion_suavizada, confianza_suavizada)
-                    
-                    # Actualizar información en interfaz
-                    self.label_info_persona.config(text=f"Persona: {persona.nombre} {persona.apellido}")
-                    self.label_info_emocion.config(text=f"Emoción: {emocion_suavizada}")
-                    self.label_info_confianza.config(
-                        text=f"Reconocimiento: {confianza:.1f}% - Emoción: {confianza_suavizada:.1%}"
-                    )
-                    
-                    # Añadir texto al frame
-                    cv2.putText(frame_procesado, f"{persona.nombre}", 
-                               (left, top-30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    cv2.putText(frame_procesado, f"{emocion_suavizada} ({confianza_suavizada:.1%})", 
-                               (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                else:
-                    self.label_info_persona.config(text="Persona: No detectada")
-                    self.label_info_emocion.config(text="Emoción: -")
-                    self.label_info_confianza.config(text="Confianza: -")
-                    
-                    if ubicacion:
-                        top, right, bottom, left = ubicacion
-                        cv2.rectangle(frame_procesado, (left, top), (right, bottom), (0, 0, 255), 2)
-                        cv2.putText(frame_procesado, "Desconocido", 
-                                   (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            
-            # Convertir para mostrar en Tkinter
-            frame_rgb = cv2.cvtColor(frame_procesado, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            img_tk = ImageTk.PhotoImage(image=img)
+            # Actualizar información en interfaz
+            self.label_info_persona.config(text=resultado['persona'])
+            self.label_info_emocion.config(text=resultado['emocion'])
+            self.label_info_confianza.config(text=resultado['confianza'])
             
-            self.label_camara_deteccion.img_tk = img_tk
-            self.label_camara_deteccion.config(image=img_tk)
+            if self.var_overlay.get():
+                self.dibujar_overlay(resultado['frame'])
             
-            # Continuar detección con delay ajustado para FER
-            self.root.after(30, self.actualizar_vista_deteccion)
+            # Mostrar en Tkinter reutilizando la imagen del label; el renderizador limita
+            # los redibujados a su fps_maximo aunque la consulta sea más frecuente
+            self.render_deteccion.mostrar(resultado['frame'], clave=(indice, resultado['numero']))
+            marcas_arranque.marcar("primer_frame")
+            if resultado['reconocidos']:
+                marcas_arranque.marcar("primer_reconocimiento")
+        
+        # El hilo de Tk solo consulta resultados; la inferencia no bloquea la interfaz.
+        # Se consulta al doble del ritmo de procesamiento de la cámara mostrada.
+        self.root.after(self.intervalo_vista_ms, self.actualizar_vista_deteccion)
+    
+    def actualizar_metricas_camaras(self):
+        """Muestra FPS y latencia de cada cámara, como máximo una vez por segundo"""
+        ahora = time.monotonic()
+        if ahora - self.ultima_actualizacion_metricas < 1.0:
+            return
+        self.ultima_actualizacion_metricas = ahora
+        
+        textos = []
+        indice = max(self.combo_camaras.current(), 0)
+        for i, flujo in enumerate(self.pipeline.flujos):
+            metricas = flujo.metricas()
+            nivel = flujo.controlador.indice if flujo.controlador else 0
+            textos.append(
+                f"{flujo.nombre}: {metricas['fps']:.1f} FPS, "
+                f"latencia {metricas['latencia_ms']:.0f} ms (p95 {metricas['latencia_p95_ms']:.0f} ms), "
+                f"nivel {nivel}"
+            )
+            if i == indice:
+                if metricas['fps'] > 0:
+                    # Consultar más rápido de lo que el renderizador puede dibujar no sirve
+                    minimo = max(10, 1000 * self.render_deteccion.periodo)
+                    self.intervalo_vista_ms = int(min(50, max(minimo, 500 / metricas['fps'])))
+                self.lineas_overlay = [
+                    f"{metricas['fps']:.1f} FPS  latencia {metricas['latencia_ms']:.0f} ms",
+                    f"descartados {metricas['descartados']}  nivel {nivel}",
+                    f"UI {self.render_deteccion.cpu_ms_medio:.1f} ms CPU/frame"
+                ]
+        self.label_metricas_camaras.config(text="  |  ".join(textos))
+        
+        # Tiempos por etapa, si la instrumentación está activa
+        for nombre, ms in sorted(registro_metricas.latencias_recientes_ms().items()):
+            self.lineas_overlay.append(f"{nombre.replace('_segundos', '')}: {ms:.1f} ms")
+    
+    def dibujar_overlay(self, frame):
+        """Escribe FPS, latencia y tiempos por etapa (actualizados cada segundo) sobre el frame"""
+        for i, linea in enumerate(self.lineas_overlay):
+            posicion = (10, 20 + 18 * i)
+            cv2.putText(frame, linea, posicion, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 3)
+            cv2.putText(frame, linea, posicion, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    
+    def suavizar_emocion(self, emocion_actual, confianza_actual, clave=None):
+        """Suaviza las emociones usando un historial (por persona) para evitar cambios bruscos"""
+        with self.lock_historial:
+            historial = self.historial_emociones.setdefault(clave, [])
+            return self._suavizar_emocion(historial, emocion_actual, confianza_actual)
     
-    def suavizar_emocion(self, emocion_actual, confianza_actual):
-        """Suaviza las emociones usando un historial para evitar cambios bruscos"""
+    def _suavizar_emocion(self, historial, emocion_actual, confianza_actual):
         # Agregar al historial
-        self.historial_emociones.append((emocion_actual, confianza_actual))
+        historial.append((emocion_actual, confianza_actual))
         
         # Mantener solo los últimos N elementos
-        if len(self.historial_emociones) > self.max_historial:
-            self.historial_emociones.pop(0)
+        if len(historial) > self.max_historial:
+            historial.pop(0)
         
-        if not self.historial_emociones:
+        if not historial:
             return emocion_actual, confianza_actual
         
         # Contar frecuencias de emociones en el historial
         conteo_emociones = {}
         suma_confianzas = {}
         
-        for emocion, confianza in self.historial_emociones:
+        for emocion, confianza in historial:
             if emocion not in conteo_emociones:
                 conteo_emociones[emocion] = 0
                 suma_confianzas[emocion] = 0.0
@@ -530,18 +899,41 @@ class SistemaReconocimientoFacial:
         else:
             self.combo_personas.set('')
     
-    def generar_reporte_persona(self):
-        """Genera un reporte PDF para la persona seleccionada"""
+    def obtener_id_persona_seleccionada(self):
+        """Extrae el ID de la persona seleccionada en el combobox (o None)"""
         seleccion = self.combo_personas.get()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione una persona")
-            return
+            return None
         
-        # Extraer ID de la persona
         try:
-            persona_id = int(seleccion.split("ID: ")[1].rstrip(')'))
+            return int(seleccion.split("ID: ")[1].rstrip(')'))
         except:
             messagebox.showerror("Error", "Formato de selección inválido")
+            return None
+    
+    def eliminar_persona(self):
+        """Elimina la persona seleccionada de la base de datos y de la galería"""
+        persona_id = self.obtener_id_persona_seleccionada()
+        if persona_id is None:
+            return
+        
+        if not messagebox.askyesno("Confirmar", "¿Eliminar la persona seleccionada y su historial?"):
+            return
+        
+        exito, mensaje = self.db.eliminar_persona(persona_id)
+        if exito:
+            self.reconocedor.eliminar_persona(persona_id)
+            messagebox.showinfo("Éxito", mensaje)
+            self.actualizar_lista_personas()
+        else:
+            messagebox.showerror("Error", mensaje)
+    
+    def generar_reporte_persona(self):
+        """Genera un reporte PDF para la persona seleccionada"""
+        # Extraer ID de la persona
+        persona_id = self.obtener_id_persona_seleccionada()
+        if persona_id is None:
             return
         
         # Seleccionar ubicación para guardar
@@ -575,6 +967,55 @@ class SistemaReconocimientoFacial:
             else:
                 messagebox.showerror("Error", mensaje)
     
+    def generar_reportes_todas_personas(self):
+        """Genera un reporte PDF por persona en una carpeta, en segundo plano"""
+        directorio = filedialog.askdirectory(title="Carpeta para los reportes")
+        if not directorio:
+            return
+        
+        self.btn_reportes_todos.config(state='disabled')
+        
+        def generar():
+            exito, mensaje = self.generador_reportes.generar_reportes_todas_personas(directorio)
+            self.root.after(0, lambda: finalizar(exito, mensaje))
+        
+        def finalizar(exito, mensaje):
+            self.btn_reportes_todos.config(state='normal')
+            if exito:
+                messagebox.showinfo("Éxito", mensaje)
+            else:
+                messagebox.showerror("Error", mensaje)
+        
+        threading.Thread(target=generar, daemon=True).start()
+    
+    def exportar_historial_csv(self):
+        """Exporta el historial de la persona seleccionada (o de todas) a CSV"""
+        persona_id = None
+        if self.combo_personas.get():
+            solo_seleccionada = messagebox.askyesnocancel(
+                "Exportar historial",
+                "¿Exportar solo la persona seleccionada?\n(No = todas las personas)"
+            )
+            if solo_seleccionada is None:
+                return
+            if solo_seleccionada:
+                persona_id = self.obtener_id_persona_seleccionada()
+                if persona_id is None:
+                    return
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            title="Exportar historial"
+        )
+        
+        if file_path:
+            exito, mensaje = self.generador_reportes.exportar_historial_csv(file_path, persona_id)
+            if exito:
+                messagebox.showinfo("Éxito", mensaje)
+            else:
+                messagebox.showerror("Error", mensaje)
+    
     def mostrar_resumen_reporte(self, persona_id):
         """Muestra un resumen del reporte en el área de texto"""
         persona = self.db.obtener_persona_por_id(persona_id)
@@ -615,9 +1056,27 @@ class SistemaReconocimientoFacial:
         self.texto_reportes.delete(1.0, tk.END)
         self.texto_reportes.insert(1.0, resumen)
     
+    def cerrar(self):
+        """Detiene los hilos de captura e inferencia y cierra la ventana"""
+        self.capturando = False
+        if self.trabajador_registro is not None:
+            self.trabajador_registro.entregar()
+        if self.detectando:
+            self.detener_deteccion()
+        self.procesamiento_activo = False
+        for captura in self.capturas:
+            captura.detener()
+        for captura in self.capturas:
+            captura.join(timeout=1.0)
+        # Escribir las detecciones pendientes antes de salir
+        self.escritor_detecciones.cerrar()
+        logger.info(f"Tiempos de arranque: {marcas_arranque.resumen()}")
+        self.root.destroy()
+    
     def __del__(self):
         """Liberar recursos al cerrar la aplicación"""
         self.procesamiento_activo = False
-        if hasattr(self, 'cap') and self.cap:
-            self.cap.release()
+        for captura in getattr(self, 'capturas', []):
+            captura.detener()
+            captura.cap.release()
         cv2.destroyAllWindows()
\ No newline at end of file
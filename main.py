@@ -1,6 +1,9 @@
+from metricas import marcas_arranque, registro_metricas, ExportadorMetricas
 import cv2
 import tkinter as tk
 from gui import SistemaReconocimientoFacial
+import argparse
+from detectores import DETECTORES, crear_detector
 import logging
 import sys
 
@@ -21,16 +24,54 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 logging.getLogger('fer').setLevel(logging.INFO)
 
 def main():
+    parser = argparse.ArgumentParser(description="Sistema de Reconocimiento Facial con FER")
+    parser.add_argument('--fuente', action='append', default=None,
+                        help='Cámara a usar: índice de dispositivo, archivo de video o URL RTSP. '
+                             'Repetir para varias cámaras (por defecto, 0)')
+    parser.add_argument('--metricas-archivo',
+                        help='Archivo de texto (formato Prometheus) que se reescribe con las métricas cada pocos segundos')
+    parser.add_argument('--metricas-puerto', type=int,
+                        help='Puerto local donde servir las métricas en /metrics')
+    parser.add_argument('--detector', choices=list(DETECTORES), default='hog',
+                        help='Detector de rostros (por defecto, hog)')
+    parser.add_argument('--fps-objetivo', type=float, default=15.0,
+                        help='FPS por cámara que el control de latencia intenta sostener (por defecto, 15)')
+    parser.add_argument('--latencia-objetivo', type=float, default=200,
+                        help='Latencia máxima captura -> resultado en ms (por defecto, 200)')
+    parser.add_argument('--overlay', action='store_true',
+                        help='Mostrar FPS y latencias por etapa sobre la vista de detección')
+    args = parser.parse_args()
+    try:
+        # Modelos del detector ausentes: fallar ahora y no en cada frame
+        crear_detector(args.detector)
+    except (FileNotFoundError, RuntimeError) as e:
+        parser.error(str(e))
+    
+    # La instrumentación solo se activa si alguien va a leerla
+    exportador = None
+    if args.metricas_archivo or args.metricas_puerto is not None or args.overlay:
+        registro_metricas.habilitado = True
+    if args.metricas_archivo or args.metricas_puerto is not None:
+        exportador = ExportadorMetricas(ruta=args.metricas_archivo, puerto=args.metricas_puerto)
+        exportador.iniciar()
+    
     try:
         print("Iniciando Sistema de Reconocimiento Facial con FER...")
         root = tk.Tk()
-        app = SistemaReconocimientoFacial(root)       
+        app = SistemaReconocimientoFacial(root, fuentes=args.fuente, mostrar_overlay=args.overlay,
+                                          fps_objetivo=args.fps_objetivo,
+                                          latencia_objetivo=args.latencia_objetivo / 1000,
+                                          detector=args.detector)
+        marcas_arranque.marcar("ventana_creada")
         print("Sistema FER listo. Iniciando interfaz...")
         root.mainloop()
         
     except Exception as e:
         logging.error(f"Error en la aplicación: {str(e)}")
         print(f"Error crítico: {e}")
+    finally:
+        if exportador is not None:
+            exportador.detener()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
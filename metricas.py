@@ -0,0 +1,354 @@
+import os
+import time
+import bisect
+import functools
+import threading
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Referencia de tiempo del proceso: main.py importa este módulo antes que el resto
+INICIO_PROCESO = time.perf_counter()
+
+
+class MarcasArranque:
+    """
+    Registra una sola vez el instante en que ocurre cada hito del arranque
+    (ventana visible, modelos listos, primer frame, primer reconocimiento),
+    medido en segundos desde el inicio del proceso.
+    """
+
+    def __init__(self, inicio=None):
+        self.inicio = INICIO_PROCESO if inicio is None else inicio
+        self.marcas = {}
+        self._lock = threading.Lock()
+
+    def marcar(self, nombre):
+        """Registra el hito si es la primera vez; retorna los segundos desde el inicio"""
+        with self._lock:
+            if nombre in self.marcas:
+                return self.marcas[nombre]
+            segundos = time.perf_counter() - self.inicio
+            self.marcas[nombre] = segundos
+
+        logger.info(f"Arranque: {nombre} a los {segundos:.2f} s")
+        return segundos
+
+    def obtener(self, nombre):
+        return self.marcas.get(nombre)
+
+    def resumen(self):
+        """Texto con todos los hitos registrados, en orden de ocurrencia"""
+        with self._lock:
+            marcas = sorted(self.marcas.items(), key=lambda item: item[1])
+        return ", ".join(f"{nombre}={segundos:.2f}s" for nombre, segundos in marcas)
+
+
+# Instancia global compartida por la interfaz y los modelos
+marcas_arranque = MarcasArranque()
+
+
+# Límites (en segundos) de las cubetas de los histogramas de latencia
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _etiquetas_texto(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{valor}"' for clave, valor in pares) + "}"
+
+
+class Contador:
+    """Valor que solo crece (eventos, frames descartados...), por combinación de etiquetas"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self):
+        with self._lock:
+            return [(self.nombre, clave, valor) for clave, valor in self._valores.items()]
+
+
+class Medidor(Contador):
+    """Valor instantáneo (profundidad de una cola, FPS...)"""
+
+    tipo = 'gauge'
+
+    def fijar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = valor
+
+
+class MedidorFuncion:
+    """
+    Métrica cuyo valor se lee al exportar llamando a una función, para exponer
+    contadores que el código ya lleva (cola del escritor, descartes de cámara)
+    sin añadir trabajo en el camino caliente. La función retorna un número o
+    una lista de pares (dict de etiquetas, valor).
+    """
+
+    def __init__(self, nombre, ayuda, funcion, tipo='gauge'):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def muestras(self):
+        try:
+            valor = self.funcion()
+        except Exception as e:
+            logger.error(f"Error al leer la métrica {self.nombre}: {str(e)}")
+            return []
+        if isinstance(valor, (int, float)):
+            return [(self.nombre, (), valor)]
+        return [(self.nombre, tuple(sorted(etiquetas.items())), v) for etiquetas, v in valor]
+
+
+class Histograma:
+    """Distribución de duraciones en cubetas acumulativas, con una ventana de las más recientes"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, limites=LIMITES_LATENCIA, ventana=200):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.limites = tuple(limites)
+        self._series = {}
+        self._recientes = deque(maxlen=ventana)
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # Conteo por cubeta (la última es +Inf), suma y total
+                serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+            self._recientes.append(valor)
+
+    def media_reciente(self):
+        """Media de las observaciones más recientes, o None si aún no hay ninguna"""
+        with self._lock:
+            recientes = list(self._recientes)
+        return sum(recientes) / len(recientes) if recientes else None
+
+    def muestras(self):
+        resultado = []
+        with self._lock:
+            series = [(clave, list(cubetas), suma, total) for clave, (cubetas, suma, total) in self._series.items()]
+        for clave, cubetas, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.limites + ('+Inf',), cubetas):
+                acumulado += conteo
+                resultado.append((f"{self.nombre}_bucket", clave + (('le', limite),), acumulado))
+            resultado.append((f"{self.nombre}_sum", clave, suma))
+            resultado.append((f"{self.nombre}_count", clave, total))
+        return resultado
+
+
+class _CronometroNulo:
+    """Cronómetro que no hace nada, usado cuando la instrumentación está desactivada"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        return False
+
+
+_CRONOMETRO_NULO = _CronometroNulo()
+
+
+class _Cronometro:
+    def __init__(self, histograma, etiquetas):
+        self.histograma = histograma
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        self.histograma.observar(time.perf_counter() - self.inicio, **self.etiquetas)
+        return False
+
+
+class RegistroMetricas:
+    """
+    Registro de las métricas del camino caliente (temporizadores, contadores,
+    medidores) exportable en el formato de texto de Prometheus.
+
+    Desactivado, cronometrar() retorna un cronómetro vacío compartido y las
+    funciones decoradas con cronometrado() solo pagan la consulta del indicador.
+    """
+
+    def __init__(self, prefijo="sistema", habilitado=False):
+        self.prefijo = prefijo
+        self.habilitado = habilitado
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, ayuda, **kwargs):
+        metrica = self._metricas.get(nombre)
+        if metrica is None:
+            with self._lock:
+                metrica = self._metricas.get(nombre)
+                if metrica is None:
+                    metrica = self._metricas[nombre] = clase(f"{self.prefijo}_{nombre}", ayuda, **kwargs)
+        return metrica
+
+    def contador(self, nombre, ayuda=""):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda=""):
+        return self._obtener(Medidor, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda="", limites=LIMITES_LATENCIA):
+        return self._obtener(Histograma, nombre, ayuda, limites=limites)
+
+    def medidor_funcion(self, nombre, funcion, ayuda="", tipo='gauge'):
+        """Registra (o reemplaza) una métrica leída de `funcion` al exportar"""
+        with self._lock:
+            self._metricas[nombre] = MedidorFuncion(f"{self.prefijo}_{nombre}", ayuda, funcion, tipo)
+
+    def cronometrar(self, nombre, ayuda="", **etiquetas):
+        """Context manager que registra la duración del bloque en el histograma `nombre`"""
+        if not self.habilitado:
+            return _CRONOMETRO_NULO
+        return _Cronometro(self.histograma(nombre, ayuda), etiquetas)
+
+    def latencias_recientes_ms(self):
+        """Media reciente en ms de cada histograma con observaciones, para mostrar en pantalla"""
+        with self._lock:
+            metricas = list(self._metricas.items())
+        resultado = {}
+        for nombre, metrica in metricas:
+            if isinstance(metrica, Histograma):
+                media = metrica.media_reciente()
+                if media is not None:
+                    resultado[nombre] = 1000 * media
+        return resultado
+
+    def exportar(self):
+        """Texto en el formato de exposición de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            metricas = sorted(self._metricas.values(), key=lambda m: m.nombre)
+        lineas = []
+        for metrica in metricas:
+            muestras = metrica.muestras()
+            if not muestras:
+                continue
+            if metrica.ayuda:
+                lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            for nombre, etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_etiquetas_texto(etiquetas)} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    def escribir(self, ruta):
+        """Escribe la exportación en `ruta` de forma atómica (para el textfile collector)"""
+        temporal = f"{ruta}.tmp"
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                f.write(self.exportar())
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.error(f"Error al escribir métricas en {ruta}: {str(e)}")
+
+
+# Instancia global; se activa con SISTEMA_METRICAS=1 o con las opciones de main.py
+registro_metricas = RegistroMetricas(habilitado=os.environ.get('SISTEMA_METRICAS') == '1')
+
+
+def cronometrado(nombre, ayuda=""):
+    """Decorador que registra la duración de cada llamada en el histograma `nombre`"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not registro_metricas.habilitado:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                registro_metricas.histograma(nombre, ayuda).observar(time.perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+
+class ExportadorMetricas:
+    """
+    Publica un registro de métricas: reescribe periódicamente un archivo de texto
+    y/o lo sirve por HTTP en localhost (GET /metrics), en hilos en segundo plano.
+    """
+
+    def __init__(self, registro=None, ruta=None, puerto=None, host='127.0.0.1', intervalo=5.0):
+        self.registro = registro or registro_metricas
+        self.ruta = ruta
+        self.puerto = puerto
+        self.host = host
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo = None
+        self._servidor = None
+
+    def iniciar(self):
+        if self.ruta:
+            self._hilo = threading.Thread(target=self._escribir_periodicamente, name="metricas-archivo", daemon=True)
+            self._hilo.start()
+        if self.puerto is not None:
+            registro = self.registro
+
+            class Manejador(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?', 1)[0] not in ('/metrics', '/metricas'):
+                        self.send_error(404)
+                        return
+                    cuerpo = registro.exportar().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(cuerpo)))
+                    self.end_headers()
+                    self.wfile.write(cuerpo)
+
+                def log_message(self, formato, *args):
+                    pass
+
+            try:
+                self._servidor = ThreadingHTTPServer((self.host, self.puerto), Manejador)
+            except OSError as e:
+                logger.error(f"No se pudo abrir el puerto de métricas {self.puerto}: {str(e)}")
+                return
+            self.puerto = self._servidor.server_address[1]
+            threading.Thread(target=self._servidor.serve_forever, name="metricas-http", daemon=True).start()
+            logger.info(f"Métricas disponibles en http://{self.host}:{self.puerto}/metrics")
+
+    def _escribir_periodicamente(self):
+        while not self._detener.wait(self.intervalo):
+            self.registro.escribir(self.ruta)
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=1.0)
+            self.registro.escribir(self.ruta)
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
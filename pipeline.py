@@ -0,0 +1,407 @@
+import threading
+import queue
+import time
+import logging
+from collections import namedtuple, deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Frame capturado: número secuencial, instante de captura y la imagen BGR
+Frame = namedtuple('Frame', ['numero', 'marca_tiempo', 'imagen'])
+
+
+def abrir_fuente(fuente, ancho=640, alto=480, fps=30):
+    """
+    Abre una fuente de video: índice de dispositivo (entero o texto numérico),
+    archivo de video o URL (RTSP/HTTP)
+
+    Returns:
+        tuple: (cv2.VideoCapture, es_dispositivo)
+    """
+    if isinstance(fuente, str) and fuente.isdigit():
+        fuente = int(fuente)
+
+    cap = cv2.VideoCapture(fuente)
+    es_dispositivo = isinstance(fuente, int)
+    if es_dispositivo:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, ancho)  # Reducir resolución para mejor rendimiento
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, alto)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    return cap, es_dispositivo
+
+
+class ColaUltimoGana:
+    """Cola acotada en la que, si está llena, se descarta el elemento más antiguo"""
+
+    def __init__(self, maxsize=1, al_poner=None):
+        self._cola = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._al_poner = al_poner
+        self.descartados = 0
+
+    def poner(self, item):
+        """Inserta un elemento sin bloquear, descartando el más antiguo si no hay espacio"""
+        with self._lock:
+            while True:
+                try:
+                    self._cola.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self._cola.get_nowait()
+                        self.descartados += 1
+                    except queue.Empty:
+                        pass
+
+        if self._al_poner is not None:
+            self._al_poner()
+
+    def obtener(self, timeout=None):
+        """Espera un elemento; retorna None si se agota el tiempo"""
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def obtener_ultimo(self):
+        """Retorna el elemento más reciente sin bloquear (o None si la cola está vacía)"""
+        item = None
+        while True:
+            try:
+                item = self._cola.get_nowait()
+            except queue.Empty:
+                return item
+
+    def __len__(self):
+        return self._cola.qsize()
+
+
+class HiloCaptura(threading.Thread):
+    """
+    Lee frames de la cámara de forma continua y los publica a sus suscriptores.
+
+    Con `fps_objetivo` la lectura se limita a ese ritmo (archivos de video que
+    simulan una cámara en vivo) y con `repetir` el archivo vuelve a empezar al terminar.
+    """
+
+    def __init__(self, cap, nombre="camara", fps_objetivo=None, repetir=False):
+        super().__init__(daemon=True, name=f"captura-{nombre}")
+        self.cap = cap
+        self.nombre = nombre
+        self.fps_objetivo = fps_objetivo
+        self.repetir = repetir
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._suscriptores = []
+        self._ultimo = None
+        self.frames_capturados = 0
+
+    def suscribir(self, maxsize=1, al_poner=None):
+        """Crea una cola 'último frame gana' que recibirá cada frame capturado"""
+        cola = ColaUltimoGana(maxsize, al_poner)
+        with self._lock:
+            self._suscriptores.append(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            if cola in self._suscriptores:
+                self._suscriptores.remove(cola)
+
+    def ultimo_frame(self):
+        """Retorna el último frame capturado (o None si aún no hay ninguno)"""
+        return self._ultimo
+
+    def run(self):
+        periodo = 1.0 / self.fps_objetivo if self.fps_objetivo else 0.0
+        siguiente = time.monotonic()
+
+        while not self._detener.is_set():
+            if periodo:
+                espera = siguiente - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+                siguiente = max(siguiente + periodo, time.monotonic() - periodo)
+
+            ret, imagen = self.cap.read()
+            if not ret:
+                if self.repetir:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(0.01)
+                continue
+
+            self.frames_capturados += 1
+            frame = Frame(self.frames_capturados, time.monotonic(), imagen)
+            self._ultimo = frame
+
+            with self._lock:
+                suscriptores = list(self._suscriptores)
+            for cola in suscriptores:
+                cola.poner(frame)
+
+    def detener(self):
+        self._detener.set()
+
+
+# Parámetro de calidad de un nivel del controlador: cada cuántos frames se detecta,
+# a qué escala y cada cuántos frames se clasifican las emociones
+NivelCalidad = namedtuple('NivelCalidad', ['intervalo_deteccion', 'escala_deteccion', 'intervalo_emociones'])
+
+# Del más preciso al más barato; el nivel 3 equivale a la configuración fija anterior
+NIVELES_CALIDAD = (
+    NivelCalidad(1, 1.0, 1),
+    NivelCalidad(3, 0.75, 1),
+    NivelCalidad(5, 0.5, 1),
+    NivelCalidad(10, 0.5, 1),
+    NivelCalidad(10, 0.5, 2),
+    NivelCalidad(15, 0.35, 3),
+    NivelCalidad(20, 0.25, 5),
+    NivelCalidad(30, 0.25, 10),
+)
+
+
+class ControladorLatencia:
+    """
+    Ajusta el nivel de calidad de una cámara para sostener un FPS y una latencia objetivo.
+
+    Cada `periodo` segundos compara el tiempo medio de procesamiento por frame con el
+    presupuesto (`trabajadores_por_fuente / fps_objetivo`) y la latencia media
+    captura -> resultado con `latencia_objetivo`. Si se excede alguno, baja un nivel
+    de inmediato; si sobra margen (carga menor que `margen_subida`) durante
+    `periodos_subida` periodos seguidos, sube un nivel. Cada vez que un nivel no se
+    sostiene, los periodos exigidos para volver a subir a él se duplican (hasta
+    `max_periodos_subida`), de modo que no oscile entre dos niveles y aun así
+    reintente cuando cambie la escena. `al_cambiar(nivel)` aplica el nuevo NivelCalidad.
+    """
+
+    def __init__(self, fps_objetivo=15.0, latencia_objetivo=0.2, trabajadores_por_fuente=1.0,
+                 niveles=NIVELES_CALIDAD, nivel_inicial=3, periodo=1.0, margen_subida=0.6,
+                 periodos_subida=3, max_periodos_subida=120, al_cambiar=None):
+        self.fps_objetivo = fps_objetivo
+        self.latencia_objetivo = latencia_objetivo
+        self.trabajadores_por_fuente = trabajadores_por_fuente
+        self.niveles = niveles
+        self.indice = min(nivel_inicial, len(niveles) - 1)
+        self.periodo = periodo
+        self.margen_subida = margen_subida
+        self.max_periodos_subida = max_periodos_subida
+        self._periodos_requeridos = [periodos_subida] * len(niveles)
+        self.al_cambiar = al_cambiar
+        self.carga = 0.0
+        self._holgados = 0
+        self._reiniciar_ventana(time.monotonic())
+
+    @property
+    def nivel(self):
+        return self.niveles[self.indice]
+
+    @property
+    def presupuesto(self):
+        """Segundos de procesamiento disponibles por frame de esta cámara"""
+        return self.trabajadores_por_fuente / self.fps_objetivo
+
+    def _reiniciar_ventana(self, ahora):
+        self._inicio_ventana = ahora
+        self._frames = 0
+        self._suma_procesamiento = 0.0
+        self._suma_latencia = 0.0
+
+    def aplicar(self):
+        """Aplica el nivel actual (al iniciar, antes del primer frame)"""
+        if self.al_cambiar is not None:
+            self.al_cambiar(self.nivel)
+
+    def registrar(self, procesamiento, latencia):
+        """Registra el tiempo de procesamiento y la latencia (en segundos) de un frame"""
+        ahora = time.monotonic()
+        self._frames += 1
+        self._suma_procesamiento += procesamiento
+        self._suma_latencia += latencia
+        if ahora - self._inicio_ventana < self.periodo:
+            return
+
+        procesamiento_medio = self._suma_procesamiento / self._frames
+        latencia_media = self._suma_latencia / self._frames
+        self._reiniciar_ventana(ahora)
+        self.carga = procesamiento_medio / self.presupuesto
+
+        indice = self.indice
+        if self.carga > 1.0 or latencia_media > self.latencia_objetivo:
+            self._holgados = 0
+            self._periodos_requeridos[indice] = min(2 * self._periodos_requeridos[indice],
+                                                    self.max_periodos_subida)
+            indice = min(indice + 1, len(self.niveles) - 1)
+        elif self.carga < self.margen_subida and latencia_media < self.margen_subida * self.latencia_objetivo:
+            self._holgados += 1
+            if indice > 0 and self._holgados >= self._periodos_requeridos[indice - 1]:
+                self._holgados = 0
+                indice -= 1
+        else:
+            self._holgados = 0
+
+        if indice != self.indice:
+            logger.info(
+                f"Calidad {'reducida' if indice > self.indice else 'aumentada'} al nivel {indice} "
+                f"{tuple(self.niveles[indice])}: carga {self.carga:.2f}, latencia {1000 * latencia_media:.0f} ms"
+            )
+            self.indice = indice
+            self.aplicar()
+
+
+class FlujoCamara:
+    """Estado de una fuente dentro del planificador: entrada, resultados y métricas"""
+
+    def __init__(self, nombre, captura, procesador, ventana_metricas=120, controlador=None):
+        self.nombre = nombre
+        self.captura = captura
+        self.procesador = procesador
+        self.controlador = controlador
+        self.entrada = None
+        self.resultados = ColaUltimoGana(maxsize=1)
+        self.ocupado = False
+        self.frames_procesados = 0
+        # Instantes de fin y latencias (captura -> resultado) de los últimos frames
+        self._tiempos = deque(maxlen=ventana_metricas)
+        self._latencias = deque(maxlen=ventana_metricas)
+
+    def registrar(self, frame):
+        ahora = time.monotonic()
+        self.frames_procesados += 1
+        self._tiempos.append(ahora)
+        self._latencias.append(ahora - frame.marca_tiempo)
+
+    def metricas(self):
+        """FPS procesados y latencia media/p95 en ms sobre la ventana reciente"""
+        tiempos = list(self._tiempos)
+        latencias = sorted(self._latencias)
+        fps = (len(tiempos) - 1) / (tiempos[-1] - tiempos[0]) if len(tiempos) > 1 and tiempos[-1] > tiempos[0] else 0.0
+        return {
+            'fps': fps,
+            'latencia_ms': 1000 * sum(latencias) / len(latencias) if latencias else 0.0,
+            'latencia_p95_ms': 1000 * latencias[int(0.95 * (len(latencias) - 1))] if latencias else 0.0,
+            'procesados': self.frames_procesados,
+            'capturados': self.captura.frames_capturados,
+            'descartados': self.entrada.descartados if self.entrada else 0
+        }
+
+
+class PlanificadorInferencia:
+    """
+    Reparte un grupo fijo de trabajadores de inferencia entre varias cámaras.
+
+    Cada cámara tiene una entrada 'último frame gana'; los trabajadores toman la
+    siguiente cámara con frame pendiente en orden circular (round-robin), y una
+    cámara nunca es procesada por dos trabajadores a la vez, de modo que su
+    seguidor y el orden de sus resultados se conservan. Con más cámaras que
+    capacidad, cada una recibe una parte igual y se descartan frames viejos en
+    lugar de acumular latencia.
+    """
+
+    def __init__(self, num_trabajadores=1):
+        self.num_trabajadores = num_trabajadores
+        self.flujos = []
+        self._condicion = threading.Condition()
+        self._detener = threading.Event()
+        self._hilos = []
+        self._siguiente = 0
+
+    def agregar_fuente(self, nombre, captura, procesador, controlador=None):
+        """
+        Registra una cámara y el procesador (frame -> resultado) de sus frames; el
+        ControladorLatencia opcional recibe el tiempo de cada frame procesado
+        """
+        flujo = FlujoCamara(nombre, captura, procesador, controlador=controlador)
+        if controlador is not None:
+            controlador.aplicar()
+        with self._condicion:
+            self.flujos.append(flujo)
+        if self._hilos:
+            flujo.entrada = captura.suscribir(maxsize=1, al_poner=self._notificar)
+        return flujo
+
+    def _notificar(self):
+        with self._condicion:
+            self._condicion.notify()
+
+    def iniciar(self):
+        self._detener.clear()
+        for flujo in self.flujos:
+            flujo.entrada = flujo.captura.suscribir(maxsize=1, al_poner=self._notificar)
+        for i in range(self.num_trabajadores):
+            hilo = threading.Thread(target=self._trabajador, name=f"inferencia-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        logger.info(
+            f"Planificador iniciado: {len(self.flujos)} cámara(s), {self.num_trabajadores} trabajador(es)"
+        )
+
+    def detener(self, timeout=2.0):
+        """Detiene los trabajadores; retorna False si alguno sigue en curso tras `timeout`"""
+        self._detener.set()
+        with self._condicion:
+            self._condicion.notify_all()
+        for flujo in self.flujos:
+            if flujo.entrada is not None:
+                flujo.captura.desuscribir(flujo.entrada)
+        terminados = self.esperar(timeout)
+        if not terminados:
+            logger.warning(f"{len(self._hilos)} trabajador(es) de inferencia aún procesando un frame")
+        for flujo in self.flujos:
+            metricas = flujo.metricas()
+            logger.info(
+                f"Cámara {flujo.nombre}: {metricas['procesados']} frames procesados, "
+                f"{metricas['descartados']} descartados"
+            )
+        return terminados
+
+    def esperar(self, timeout=None):
+        """Espera a los trabajadores de un planificador detenido; retorna True si terminaron todos"""
+        for hilo in self._hilos:
+            hilo.join(timeout=timeout)
+        self._hilos = [hilo for hilo in self._hilos if hilo.is_alive()]
+        return not self._hilos
+
+    def _tomar_siguiente(self):
+        """Siguiente (flujo, frame) libre en orden circular, o None si no hay ninguno"""
+        total = len(self.flujos)
+        for desplazamiento in range(total):
+            indice = (self._siguiente + desplazamiento) % total
+            flujo = self.flujos[indice]
+            if flujo.ocupado or flujo.entrada is None:
+                continue
+            frame = flujo.entrada.obtener_ultimo()
+            if frame is None:
+                continue
+            flujo.ocupado = True
+            self._siguiente = (indice + 1) % total
+            return flujo, frame
+        return None
+
+    def _trabajador(self):
+        while not self._detener.is_set():
+            with self._condicion:
+                tarea = self._tomar_siguiente()
+                if tarea is None:
+                    self._condicion.wait(timeout=0.1)
+                    continue
+            flujo, frame = tarea
+
+            inicio = time.monotonic()
+            try:
+                resultado = flujo.procesador(frame)
+            except Exception as e:
+                logger.error(f"Error procesando frame {frame.numero} de {flujo.nombre}: {str(e)}")
+                resultado = None
+            fin = time.monotonic()
+            if flujo.controlador is not None and resultado is not None:
+                flujo.controlador.registrar(fin - inicio, fin - frame.marca_tiempo)
+
+            with self._condicion:
+                flujo.ocupado = False
+                if resultado is not None:
+                    flujo.registrar(frame)
+                    flujo.resultados.poner(resultado)
+                # Otra cámara (o esta misma) puede tener un frame esperando
+                self._condicion.notify()
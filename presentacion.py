@@ -0,0 +1,118 @@
+"""
+Presentación eficiente de frames de OpenCV en widgets de Tk.
+
+Crear un ImageTk.PhotoImage por frame a la resolución de captura obliga a Tcl a
+crear y destruir una imagen y a reconfigurar el widget en cada redibujado. El
+renderizador reutiliza una sola PhotoImage por label (paste() copia los píxeles
+en la existente), reduce el frame al tamaño de la vista antes de convertirlo de
+color, no dibuja si el label no está visible (pestaña oculta) ni más seguido que
+la frecuencia de refresco, y mide el tiempo de CPU del hilo de Tk por frame.
+"""
+import time
+import logging
+
+import cv2
+from PIL import Image, ImageTk
+
+from metricas import registro_metricas
+
+logger = logging.getLogger(__name__)
+
+
+class RenderizadorVista:
+    """
+    Muestra frames BGR en un label reutilizando su PhotoImage.
+
+    Args:
+        label: widget (ttk.Label) donde se muestra la imagen
+        nombre: nombre de la vista para las métricas
+        tamano_maximo: (ancho, alto) máximo de la imagen; el ancho también se
+            limita al del contenedor, recalculado solo cuando este cambia de tamaño
+        fps_maximo: redibujados por segundo como máximo (frecuencia de refresco)
+        relleno: píxeles del ancho del contenedor que no son área útil (relleno y
+            borde de ambos lados)
+    """
+
+    def __init__(self, label, nombre, tamano_maximo=(640, 480), fps_maximo=60, relleno=0):
+        self.label = label
+        self.nombre = nombre
+        self.tamano_maximo = tamano_maximo
+        self.relleno = relleno
+        self.periodo = 1.0 / fps_maximo
+        self.frames_mostrados = 0
+        self.cpu_ms_medio = 0.0
+        self._foto = None
+        self._tamano = None
+        self._forma_origen = None
+        self._ancho_contenedor = None
+        self._ultimo_dibujo = 0.0
+        self._ultima_clave = None
+        label.master.bind('<Configure>', self._al_redimensionar, add='+')
+
+    def _al_redimensionar(self, evento):
+        if evento.widget is not self.label.master:
+            return
+        ancho = evento.width - self.relleno
+        if ancho != self._ancho_contenedor:
+            self._ancho_contenedor = ancho
+            self._tamano = None
+
+    def _tamano_destino(self, forma):
+        """Tamaño (ancho, alto) de la imagen mostrada: el frame reducido para caber, sin ampliarlo"""
+        if self._tamano is None or forma != self._forma_origen:
+            alto, ancho = forma[:2]
+            ancho_maximo, alto_maximo = self.tamano_maximo
+            if self._ancho_contenedor and self._ancho_contenedor > 1:
+                ancho_maximo = min(ancho_maximo, self._ancho_contenedor)
+            factor = min(1.0, ancho_maximo / ancho, alto_maximo / alto)
+            self._tamano = (max(1, int(ancho * factor)), max(1, int(alto * factor)))
+            self._forma_origen = forma
+        return self._tamano
+
+    def visible(self):
+        """El label está en pantalla (las pestañas ocultas del notebook no están mapeadas)"""
+        return bool(self.label.winfo_ismapped())
+
+    def mostrar(self, frame, clave=None, forzar=False):
+        """
+        Dibuja el frame si corresponde; retorna True si se dibujó
+
+        Args:
+            frame: imagen BGR
+            clave: identificador del frame (p. ej. su número); el mismo frame no se redibuja
+            forzar: dibujar aunque no haya pasado el periodo mínimo
+        """
+        ahora = time.monotonic()
+        if clave is not None and clave == self._ultima_clave:
+            return False
+        if not forzar and ahora - self._ultimo_dibujo < self.periodo:
+            return False
+        if not self.visible():
+            return False
+
+        inicio_cpu = time.thread_time()
+        with registro_metricas.cronometrar('conversion_frame_segundos', vista=self.nombre):
+            ancho, alto = self._tamano_destino(frame.shape)
+            # Reducir antes de convertir de color: menos píxeles en cada paso siguiente
+            if (ancho, alto) != (frame.shape[1], frame.shape[0]):
+                frame = cv2.resize(frame, (ancho, alto), interpolation=cv2.INTER_AREA)
+            imagen = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+            if self._foto is None or (self._foto.width(), self._foto.height()) != (ancho, alto):
+                self._foto = ImageTk.PhotoImage(image=imagen)
+                self.label.config(image=self._foto)
+            else:
+                self._foto.paste(imagen)
+
+        cpu_ms = 1000 * (time.thread_time() - inicio_cpu)
+        # Media móvil exponencial del CPU del hilo de Tk por frame mostrado
+        self.cpu_ms_medio = cpu_ms if not self.frames_mostrados else 0.9 * self.cpu_ms_medio + 0.1 * cpu_ms
+        if registro_metricas.habilitado:
+            registro_metricas.histograma(
+                'presentacion_cpu_segundos', "CPU del hilo de Tk por frame mostrado"
+            ).observar(cpu_ms / 1000, vista=self.nombre)
+
+        self.frames_mostrados += 1
+        self._ultimo_dibujo = ahora
+        self._ultima_clave = clave
+        return True
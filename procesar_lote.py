@@ -0,0 +1,399 @@
+"""
+Procesamiento sin interfaz de videos grabados y carpetas de imágenes.
+
+Reparte la entrada en tareas (segmentos de video o bloques de imágenes) entre
+un pool de procesos; cada proceso carga su propio reconocedor y analizador de
+emociones, y el proceso principal escribe las detecciones en lote en la base
+de datos o en un archivo CSV/JSONL.
+
+Uso (desde la carpeta del proyecto):
+    python procesar_lote.py grabacion.mp4 fotos/ --procesos 8
+    python procesar_lote.py camaras/ --salida detecciones.csv --intervalo 1.0
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+
+from database import DatabaseManager
+from face_recognizer import ReconocedorFacial
+from detectores import DETECTORES, crear_detector
+from galeria import guardar_instantanea, cargar_instantanea, ruta_instantanea_predeterminada
+from emotion_analyzer import AnalizadorEmocionesFER, limitar_hilos_tensorflow
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_IMAGEN = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+EXTENSIONES_VIDEO = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.m4v', '.mpg', '.mpeg'}
+
+# Unidad de trabajo: un segmento [inicio, fin) de frames de un video o un bloque de imágenes
+Tarea = namedtuple('Tarea', ['tipo', 'ruta', 'inicio', 'fin', 'fps', 'fecha_inicio', 'imagenes'])
+
+# Resultado de una tarea, con los contadores para el rendimiento por proceso
+ResultadoTarea = namedtuple('ResultadoTarea', [
+    'pid', 'detecciones', 'frames_leidos', 'frames_analizados', 'segundos', 'segundos_video'
+])
+
+
+def planificar_tareas(entradas, segundos_por_segmento=120, imagenes_por_bloque=64):
+    """
+    Divide las entradas en tareas independientes: los videos en segmentos de
+    `segundos_por_segmento` segundos y las imágenes en bloques, para repartir
+    el trabajo entre procesos aunque haya un solo video largo.
+    """
+    tareas = []
+    imagenes = []
+
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            for carpeta, _, archivos in os.walk(entrada):
+                for archivo in sorted(archivos):
+                    ruta = os.path.join(carpeta, archivo)
+                    extension = os.path.splitext(archivo)[1].lower()
+                    if extension in EXTENSIONES_IMAGEN:
+                        imagenes.append(ruta)
+                    elif extension in EXTENSIONES_VIDEO:
+                        tareas.extend(_segmentar_video(ruta, segundos_por_segmento))
+        elif os.path.splitext(entrada)[1].lower() in EXTENSIONES_IMAGEN:
+            imagenes.append(entrada)
+        elif os.path.isfile(entrada):
+            tareas.extend(_segmentar_video(entrada, segundos_por_segmento))
+        else:
+            logger.warning(f"Entrada no encontrada: {entrada}")
+
+    for i in range(0, len(imagenes), imagenes_por_bloque):
+        tareas.append(Tarea('imagenes', None, 0, 0, 0.0, None, imagenes[i:i + imagenes_por_bloque]))
+
+    return tareas
+
+
+def _segmentar_video(ruta, segundos_por_segmento):
+    """Segmentos de un video; la fecha de inicio se estima como fecha del archivo - duración"""
+    cap = cv2.VideoCapture(ruta)
+    if not cap.isOpened():
+        logger.warning(f"No se pudo abrir el video: {ruta}")
+        return []
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        logger.warning(f"El video no reporta su número de frames: {ruta}")
+        return []
+
+    fecha_inicio = datetime.fromtimestamp(os.path.getmtime(ruta)) - timedelta(seconds=total / fps)
+    frames_por_segmento = max(1, int(segundos_por_segmento * fps))
+    return [
+        Tarea('video', ruta, inicio, min(inicio + frames_por_segmento, total), fps, fecha_inicio, None)
+        for inicio in range(0, total, frames_por_segmento)
+    ]
+
+
+class ProcesadorLote:
+    """Reconoce personas y emociones en frames sueltos, agrupando la clasificación de emociones"""
+
+    def __init__(self, reconocedor, analizador, intervalo_analisis=0.5, tamano_lote_emociones=32):
+        self.reconocedor = reconocedor
+        self.analizador = analizador
+        self.intervalo_analisis = intervalo_analisis
+        self.tamano_lote_emociones = tamano_lote_emociones
+
+    def procesar(self, tarea):
+        inicio = time.perf_counter()
+        if tarea.tipo == 'video':
+            detecciones, leidos, analizados, segundos_video = self._procesar_video(tarea)
+        else:
+            detecciones, leidos, analizados, segundos_video = self._procesar_imagenes(tarea)
+
+        return ResultadoTarea(os.getpid(), detecciones, leidos, analizados,
+                              time.perf_counter() - inicio, segundos_video)
+
+    def _procesar_video(self, tarea):
+        cap = cv2.VideoCapture(tarea.ruta)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, tarea.inicio)
+        paso = max(1, int(round(self.intervalo_analisis * tarea.fps)))
+
+        detecciones = []
+        pendientes = []
+        leidos = 0
+        analizados = 0
+        try:
+            for numero in range(tarea.inicio, tarea.fin):
+                # grab() avanza sin decodificar; solo se decodifican los frames analizados
+                if not cap.grab():
+                    break
+                leidos += 1
+                if (numero - tarea.inicio) % paso:
+                    continue
+
+                ret, frame = cap.retrieve()
+                if not ret:
+                    continue
+                analizados += 1
+                segundo = numero / tarea.fps
+                meta = {
+                    'fuente': tarea.ruta,
+                    'frame': numero,
+                    'segundo': round(segundo, 3),
+                    'fecha_deteccion': tarea.fecha_inicio + timedelta(seconds=segundo)
+                }
+                self._agregar_pendiente(frame, meta, pendientes, detecciones)
+        finally:
+            cap.release()
+
+        self._clasificar_pendientes(pendientes, detecciones)
+        return detecciones, leidos, analizados, leidos / tarea.fps
+
+    def _procesar_imagenes(self, tarea):
+        detecciones = []
+        pendientes = []
+        analizados = 0
+        for ruta in tarea.imagenes:
+            frame = cv2.imread(ruta)
+            if frame is None:
+                logger.warning(f"No se pudo leer la imagen: {ruta}")
+                continue
+            analizados += 1
+            meta = {
+                'fuente': ruta,
+                'frame': 0,
+                'segundo': 0.0,
+                'fecha_deteccion': datetime.fromtimestamp(os.path.getmtime(ruta))
+            }
+            self._agregar_pendiente(frame, meta, pendientes, detecciones)
+
+        self._clasificar_pendientes(pendientes, detecciones)
+        return detecciones, analizados, analizados, 0.0
+
+    def _agregar_pendiente(self, frame, meta, pendientes, detecciones):
+        """Reconoce los rostros del frame y lo deja pendiente de clasificar emociones"""
+        reconocidos = [
+            (persona, ubicacion)
+            for persona, _, _, ubicacion in self.reconocedor.reconocer_personas(frame)
+            if persona is not None
+        ]
+        if not reconocidos:
+            return
+
+        pendientes.append((frame, reconocidos, meta))
+        if sum(len(r) for _, r, _ in pendientes) >= self.tamano_lote_emociones:
+            self._clasificar_pendientes(pendientes, detecciones)
+
+    def _clasificar_pendientes(self, pendientes, detecciones):
+        """Clasifica en una sola pasada los rostros de todos los frames pendientes"""
+        if not pendientes:
+            return
+
+        probabilidades = self.analizador.predecir_emociones_lote(
+            [frame for frame, _, _ in pendientes],
+            [[ubicacion for _, ubicacion in reconocidos] for _, reconocidos, _ in pendientes],
+            tamano_lote=self.tamano_lote_emociones
+        )
+        for (_, reconocidos, meta), probabilidades_frame in zip(pendientes, probabilidades):
+            for (persona, _), probabilidades_rostro in zip(reconocidos, probabilidades_frame):
+                if probabilidades_rostro is None:
+                    continue
+                emocion, confianza = max(probabilidades_rostro.items(), key=lambda item: item[1])
+                detecciones.append({
+                    **meta,
+                    'persona_id': persona.id,
+                    'persona': f"{persona.nombre} {persona.apellido}",
+                    'emocion': emocion,
+                    'confianza': confianza
+                })
+        pendientes.clear()
+
+
+# Procesador propio de cada proceso del pool
+_procesador = None
+
+
+def _inicializar_trabajador(db_path, modo_busqueda, intervalo_analisis, detector="hog"):
+    """Cada proceso carga su reconocedor (la galería mapeada se comparte) y su analizador"""
+    global _procesador
+    # El paralelismo viene de los procesos: evitar que OpenCV y TensorFlow sobresuscriban
+    # los núcleos. TensorFlow solo acepta el límite antes de cargar el primer modelo
+    cv2.setNumThreads(1)
+    limitar_hilos_tensorflow(1)
+    reconocedor = ReconocedorFacial(DatabaseManager(db_path), modo_busqueda, detector=detector)
+    _procesador = ProcesadorLote(reconocedor, AnalizadorEmocionesFER(), intervalo_analisis)
+
+
+def _procesar_tarea(tarea):
+    return _procesador.procesar(tarea)
+
+
+class SalidaBaseDatos:
+    """Escribe las detecciones con el escritor en lote de la base de datos"""
+
+    def __init__(self, db_manager):
+        self.escritor = db_manager.crear_escritor_detecciones(tamano_lote=2000)
+
+    def escribir(self, detecciones):
+        for deteccion in detecciones:
+            # Sin timeout: en modo lote se espera al escritor en lugar de descartar
+            self.escritor.registrar(deteccion['persona_id'], deteccion['emocion'],
+                                    deteccion['confianza'], deteccion['fecha_deteccion'], timeout=None)
+
+    def cerrar(self):
+        self.escritor.cerrar()
+
+
+class SalidaArchivo:
+    """Escribe las detecciones en un archivo CSV o JSONL (según la extensión)"""
+
+    CAMPOS = ['fuente', 'frame', 'segundo', 'fecha_deteccion', 'persona_id', 'persona', 'emocion', 'confianza']
+
+    def __init__(self, ruta):
+        self.jsonl = ruta.lower().endswith(('.jsonl', '.json'))
+        self.archivo = open(ruta, 'w', newline='', encoding='utf-8')
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.archivo, fieldnames=self.CAMPOS)
+            self.csv.writeheader()
+
+    def escribir(self, detecciones):
+        for deteccion in detecciones:
+            fila = {campo: deteccion[campo] for campo in self.CAMPOS}
+            fila['fecha_deteccion'] = fila['fecha_deteccion'].isoformat(sep=' ')
+            if self.jsonl:
+                self.archivo.write(json.dumps(fila, ensure_ascii=False) + '\n')
+            else:
+                self.csv.writerow(fila)
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+def preparar_instantanea(db_manager):
+    """
+    Escribe la instantánea de la galería antes de lanzar los procesos, que la mapean.
+    Solo hace falta la matriz: no se construye un reconocedor (en modo ivf entrenaría
+    el índice para nada).
+    """
+    ruta = ruta_instantanea_predeterminada(db_manager.db_path)
+    version = db_manager.obtener_version_galeria()
+    if cargar_instantanea(ruta, version) is None:
+        personas, ids, embeddings = db_manager.cargar_galeria()
+        guardar_instantanea(ruta, version, personas, ids, embeddings)
+
+
+def procesar(tareas, salida, db_path, procesos, modo_busqueda="exacto", intervalo_analisis=0.5, detector="hog"):
+    """
+    Ejecuta las tareas en el pool y escribe las detecciones a medida que terminan
+
+    Returns:
+        dict: rendimiento global y por proceso
+    """
+    inicio = time.perf_counter()
+    por_proceso = {}
+    total_detecciones = 0
+    segundos_video = 0.0
+
+    # spawn y no fork: el escritor de la salida ya corre en otro hilo y un hijo
+    # heredaría su cola y sus locks en mitad de una operación
+    with ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_inicializar_trabajador,
+        initargs=(db_path, modo_busqueda, intervalo_analisis, detector)
+    ) as pool:
+        futuros = {pool.submit(_procesar_tarea, tarea): tarea for tarea in tareas}
+        for futuro in as_completed(futuros):
+            tarea = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logger.error(f"Error procesando {tarea.ruta or 'bloque de imágenes'}: {str(e)}")
+                continue
+
+            salida.escribir(resultado.detecciones)
+            total_detecciones += len(resultado.detecciones)
+            segundos_video += resultado.segundos_video
+
+            proceso = por_proceso.setdefault(resultado.pid, {
+                'tareas': 0, 'frames_leidos': 0, 'frames_analizados': 0, 'segundos': 0.0
+            })
+            proceso['tareas'] += 1
+            proceso['frames_leidos'] += resultado.frames_leidos
+            proceso['frames_analizados'] += resultado.frames_analizados
+            proceso['segundos'] += resultado.segundos
+
+    transcurrido = time.perf_counter() - inicio
+    for proceso in por_proceso.values():
+        segundos = proceso['segundos'] or 1e-9
+        proceso['fps_leidos'] = proceso['frames_leidos'] / segundos
+        proceso['fps_analizados'] = proceso['frames_analizados'] / segundos
+
+    return {
+        'segundos': transcurrido,
+        'detecciones': total_detecciones,
+        'segundos_video': segundos_video,
+        'velocidad_tiempo_real': segundos_video / transcurrido if transcurrido > 0 else 0.0,
+        'por_proceso': por_proceso
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('entradas', nargs='+', help='Videos, imágenes o carpetas')
+    parser.add_argument('--db', default='facial_emotion_system.db', help='Base de datos con las personas registradas')
+    parser.add_argument('--salida', default=None,
+                        help='Archivo .csv o .jsonl de salida (por defecto, se registran en la base de datos)')
+    parser.add_argument('--procesos', type=int, default=None, help='Procesos del pool (por defecto, uno por núcleo)')
+    parser.add_argument('--intervalo', type=float, default=0.5, help='Segundos de video entre frames analizados')
+    parser.add_argument('--segmento', type=float, default=120.0, help='Segundos de video por tarea')
+    parser.add_argument('--modo-busqueda', choices=['exacto', 'ivf'], default='exacto')
+    parser.add_argument('--detector', choices=list(DETECTORES), default='hog', help='Detector de rostros')
+    parser.add_argument('--json', help='Ruta donde guardar el rendimiento en JSON')
+    args = parser.parse_args()
+    try:
+        # Modelos del detector ausentes: fallar ahora y no en cada frame
+        crear_detector(args.detector)
+    except (FileNotFoundError, RuntimeError) as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('tensorflow').setLevel(logging.ERROR)
+
+    tareas = planificar_tareas(args.entradas, args.segmento)
+    if not tareas:
+        print("No hay videos ni imágenes para procesar")
+        return 1
+
+    db_manager = DatabaseManager(args.db)
+    preparar_instantanea(db_manager)
+
+    procesos = args.procesos or os.cpu_count() or 1
+    print(f"{len(tareas)} tareas en {procesos} procesos...")
+
+    salida = SalidaArchivo(args.salida) if args.salida else SalidaBaseDatos(db_manager)
+    try:
+        rendimiento = procesar(tareas, salida, args.db, procesos, args.modo_busqueda, args.intervalo, args.detector)
+    finally:
+        salida.cerrar()
+
+    for pid, proceso in sorted(rendimiento['por_proceso'].items()):
+        print(f"  proceso {pid}: {proceso['tareas']} tareas, {proceso['fps_leidos']:.1f} fps leídos, "
+              f"{proceso['fps_analizados']:.1f} fps analizados")
+    print(f"{rendimiento['detecciones']} detecciones en {rendimiento['segundos']:.1f} s")
+    if rendimiento['segundos_video']:
+        print(f"{rendimiento['segundos_video']:.0f} s de video, "
+              f"{rendimiento['velocidad_tiempo_real']:.1f}x tiempo real")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rendimiento, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Captura de muestras para el registro de personas, fuera del hilo de la interfaz.
+
+Cada frame pasa primero por filtros baratos (un solo rostro, tamaño, brillo,
+nitidez por varianza del Laplaciano y simetría como aproximación de la pose
+frontal) y solo los que los superan llegan al cálculo del embedding. Las
+muestras aceptadas deben además diferir entre sí (para no promediar tres
+copias del mismo frame) sin dejar de ser la misma persona.
+"""
+import threading
+import time
+import logging
+from collections import namedtuple, Counter
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Resultado de evaluar_calidad; motivo es None si el rostro es aceptable
+EvaluacionCalidad = namedtuple('EvaluacionCalidad', ['motivo', 'tamano', 'brillo', 'nitidez', 'asimetria'])
+
+# Lado al que se lleva el recorte antes de medir, para que los umbrales no dependan del tamaño del rostro
+LADO_EVALUACION = 96
+
+
+def evaluar_calidad(frame, ubicacion, tamano_minimo=80, brillo_minimo=50, brillo_maximo=205,
+                    nitidez_minima=40.0, asimetria_maxima=0.22):
+    """
+    Evalúa si el rostro en `ubicacion` (top, right, bottom, left) sirve como muestra de registro
+
+    Returns:
+        EvaluacionCalidad: con el motivo del rechazo, o motivo None si es aceptable
+    """
+    top, right, bottom, left = ubicacion
+    tamano = min(bottom - top, right - left)
+    if tamano < tamano_minimo:
+        return EvaluacionCalidad("Rostro muy pequeño: acérquese a la cámara", tamano, None, None, None)
+
+    recorte = frame[max(0, top):bottom, max(0, left):right]
+    if recorte.size == 0:
+        return EvaluacionCalidad("Rostro fuera de la imagen", tamano, None, None, None)
+    gris = cv2.cvtColor(recorte, cv2.COLOR_BGR2GRAY) if recorte.ndim == 3 else recorte
+    gris = cv2.resize(gris, (LADO_EVALUACION, LADO_EVALUACION), interpolation=cv2.INTER_AREA)
+
+    brillo = float(gris.mean())
+    if brillo < brillo_minimo:
+        return EvaluacionCalidad("Poca luz sobre el rostro", tamano, brillo, None, None)
+    if brillo > brillo_maximo:
+        return EvaluacionCalidad("Rostro sobreexpuesto", tamano, brillo, None, None)
+
+    nitidez = float(cv2.Laplacian(gris, cv2.CV_64F).var())
+    if nitidez < nitidez_minima:
+        return EvaluacionCalidad("Imagen borrosa: no se mueva", tamano, brillo, nitidez, None)
+
+    # Un rostro de frente es casi simétrico: se compara la mitad izquierda con la derecha reflejada
+    mitad = LADO_EVALUACION // 2
+    izquierda = gris[:, :mitad].astype(np.float32)
+    derecha = cv2.flip(gris[:, mitad:], 1).astype(np.float32)
+    asimetria = float(np.abs(izquierda - derecha).mean() / (brillo + 1e-6))
+    if asimetria > asimetria_maxima:
+        return EvaluacionCalidad("Mire de frente a la cámara", tamano, brillo, nitidez, asimetria)
+
+    return EvaluacionCalidad(None, tamano, brillo, nitidez, asimetria)
+
+
+class TrabajadorRegistro(threading.Thread):
+    """
+    Toma el frame más reciente de la cámara, lo filtra y calcula el embedding
+    solo de los rostros aptos, hasta reunir `muestras` muestras distintas de la
+    misma persona; entonces termina solo. Las muestras quedan en el trabajador
+    hasta que entregar() lo detiene y las retorna, para pasarlas al reconocedor
+    con registrar_muestra() sin que el hilo siga agregando mientras tanto.
+
+    La interfaz consulta `estado` (ubicación del último rostro y mensaje) para
+    dibujar la vista previa sin esperar al trabajador.
+    """
+
+    def __init__(self, reconocedor, captura, muestras=3, intervalo_minimo=0.3,
+                 diversidad_minima=0.03, **criterios):
+        super().__init__(daemon=True, name="registro")
+        self.reconocedor = reconocedor
+        self.captura = captura
+        self.muestras = muestras
+        self.intervalo_minimo = intervalo_minimo
+        self.diversidad_minima = diversidad_minima
+        self.criterios = criterios
+        self.estado = (None, "Mire a la cámara")
+        self.terminado = False
+        self.rechazos = Counter()
+        self._embeddings = []
+        self._ultima_aceptada = 0.0
+        self._detener = threading.Event()
+
+    @property
+    def aceptadas(self):
+        return len(self._embeddings)
+
+    def detener(self):
+        self._detener.set()
+
+    def entregar(self, timeout=1.0):
+        """
+        Detiene al trabajador, espera a que termine el frame en curso y retorna
+        las muestras aceptadas. Si no termina a tiempo se entregan las reunidas
+        hasta ese momento; las que acepte después se descartan.
+        """
+        self.detener()
+        self.join(timeout=timeout)
+        if self.is_alive():
+            logger.warning(f"La captura de registro no terminó en {timeout:.1f} s")
+        return list(self._embeddings)
+
+    def run(self):
+        cola = self.captura.suscribir(maxsize=1)
+        inicio = time.monotonic()
+        try:
+            while not self._detener.is_set() and self.aceptadas < self.muestras:
+                # Espaciar las muestras en el tiempo da variedad sin gastar en frames casi iguales
+                espera = self._ultima_aceptada + self.intervalo_minimo - time.monotonic()
+                if espera > 0:
+                    self._detener.wait(espera)
+                    continue
+
+                frame = cola.obtener(timeout=0.1)
+                if frame is not None:
+                    try:
+                        self._procesar(frame.imagen)
+                    except Exception as e:
+                        logger.error(f"Error en la captura de registro: {str(e)}")
+        finally:
+            self.captura.desuscribir(cola)
+            self.terminado = True
+            logger.info(
+                f"Captura de registro: {self.aceptadas} muestras en {time.monotonic() - inicio:.1f} s, "
+                f"rechazos {dict(self.rechazos)}"
+            )
+
+    def _rechazar(self, ubicacion, motivo):
+        self.rechazos[motivo] += 1
+        self.estado = (ubicacion, motivo)
+
+    def _procesar(self, imagen):
+        ubicaciones = self.reconocedor.detectar_rostros(imagen)
+        if not ubicaciones:
+            self._rechazar(None, "No se detecta ningún rostro")
+            return
+        if len(ubicaciones) > 1:
+            self._rechazar(None, "Solo debe haber una persona frente a la cámara")
+            return
+        ubicacion = ubicaciones[0]
+
+        calidad = evaluar_calidad(imagen, ubicacion, **self.criterios)
+        if calidad.motivo:
+            self._rechazar(ubicacion, calidad.motivo)
+            return
+
+        # Solo los frames aptos pagan el cálculo del embedding
+        embeddings = self.reconocedor.codificar_rostros(imagen, [ubicacion])
+        if not embeddings:
+            self._rechazar(ubicacion, "No se pudo codificar el rostro")
+            return
+        embedding = np.asarray(embeddings[0])
+
+        if self._embeddings:
+            distancias = np.linalg.norm(np.asarray(self._embeddings) - embedding, axis=1)
+            if distancias.max() > self.reconocedor.tolerancia_reconocimiento:
+                self._rechazar(ubicacion, "El rostro no coincide con las capturas anteriores")
+                return
+            if distancias.min() < self.diversidad_minima:
+                self._rechazar(ubicacion, "Muestra repetida: mueva levemente la cabeza")
+                return
+
+        self._embeddings.append(embedding)
+        self._ultima_aceptada = time.monotonic()
+        self.estado = (ubicacion, f"Captura {self.aceptadas}/{self.muestras} aceptada")
@@ -1,29 +1,248 @@
 import matplotlib.pyplot as plt
+import multiprocessing
 from matplotlib.backends.backend_pdf import PdfPages
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from database import DatabaseManager, Persona
+from cache_reportes import CacheReportes
 from datetime import datetime, timedelta
 import numpy as np
+import argparse
+import logging
+import csv
+import time
+import io
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Generador propio de cada proceso del pool de reportes masivos
+_generador_trabajador = None
+
+def _inicializar_trabajador(db_path, config_cache=None):
+    """Cada proceso usa el backend sin interfaz de matplotlib y su propia conexión"""
+    global _generador_trabajador
+    plt.switch_backend('Agg')
+    cache = CacheReportes(*config_cache) if config_cache else None
+    _generador_trabajador = GeneradorReportes(DatabaseManager(db_path), cache)
+
+class PaginasPDF:
+    """Destino con la interfaz savefig de PdfPages que guarda cada página como un PDF propio"""
+    
+    def __init__(self):
+        self.paginas = []
+    
+    def savefig(self, fig, **kwargs):
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='pdf', **kwargs)
+        self.paginas.append(buffer.getvalue())
+
+def _objetos_pdf(pdf):
+    """
+    Objetos de un PDF escrito por matplotlib (PDF 1.4, tabla xref clásica y sin
+    flujos de objetos): retorna ({número: (cabecera, flujo)}, trailer)
+    """
+    inicio_xref = int(re.search(rb'startxref\s+(\d+)', pdf[-64:]).group(1))
+    tabla = re.match(rb'xref\s+0 (\d+)\s+', pdf[inicio_xref:])
+    desplazamientos = {}
+    posicion = inicio_xref + tabla.end()
+    for numero in range(int(tabla.group(1))):
+        entrada = pdf[posicion:posicion + 20]
+        posicion += 20
+        if entrada[17:18] == b'n':
+            desplazamientos[numero] = int(entrada[:10])
+    
+    finales = sorted(desplazamientos.values()) + [inicio_xref]
+    objetos = {}
+    for numero, desplazamiento in desplazamientos.items():
+        cuerpo = pdf[desplazamiento:finales[finales.index(desplazamiento) + 1]]
+        cuerpo = cuerpo[cuerpo.index(b'obj') + 3:cuerpo.rindex(b'endobj')]
+        # El flujo es binario: solo se reescriben referencias en la cabecera
+        flujo = re.search(rb'(?<=[\s>])stream\r?\n', cuerpo)
+        if flujo:
+            objetos[numero] = (cuerpo[:flujo.start()], cuerpo[flujo.start():])
+        else:
+            objetos[numero] = (cuerpo, b'')
+    return objetos, pdf[inicio_xref:]
+
+def unir_pdfs(paginas):
+    """
+    Une PDFs de una página escritos por matplotlib en un solo PDF vectorial,
+    renumerando sus objetos y colgando todas las páginas de un árbol nuevo
+    """
+    salida = io.BytesIO()
+    salida.write(b'%PDF-1.4\n%\xac\xdc \xab\xba\n')
+    desplazamientos = []
+    
+    def escribir(cabecera, flujo=b''):
+        desplazamientos.append(salida.tell())
+        salida.write(b'%d 0 obj\n' % len(desplazamientos) + cabecera + flujo + b'\nendobj\n')
+    
+    # 1: catálogo, 2: árbol de páginas; se escriben al final con las páginas conocidas
+    desplazamientos.extend([None, None])
+    hojas = []
+    for pagina in paginas:
+        objetos, trailer = _objetos_pdf(pagina)
+        raiz = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+        arbol = int(re.search(rb'/Pages (\d+) 0 R', objetos[raiz][0]).group(1))
+        # Se descartan el catálogo, el árbol y la información del documento de cada página
+        omitidos = {raiz, arbol} | {int(n) for n in re.findall(rb'/Info (\d+) 0 R', trailer)}
+        numeros = {viejo: len(desplazamientos) + i + 1
+                   for i, viejo in enumerate(n for n in sorted(objetos) if n not in omitidos)}
+        numeros[arbol] = 2
+        
+        def renumerar(coincidencia):
+            return b'%d 0 R' % numeros[int(coincidencia.group(1))]
+        
+        for viejo in sorted(numeros, key=numeros.get):
+            if viejo == arbol:
+                continue
+            cabecera, flujo = objetos[viejo]
+            cabecera = re.sub(rb'(\d+) 0 R', renumerar, cabecera)
+            if re.search(rb'/Type /Page\b', cabecera):
+                hojas.append(numeros[viejo])
+            escribir(cabecera, flujo)
+    
+    desplazamientos[0] = salida.tell()
+    salida.write(b'1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+    desplazamientos[1] = salida.tell()
+    salida.write(b'2 0 obj\n<< /Type /Pages /Kids [ %s ] /Count %d >>\nendobj\n'
+                 % (b' '.join(b'%d 0 R' % hoja for hoja in hojas), len(hojas)))
+    
+    inicio_xref = salida.tell()
+    salida.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(desplazamientos) + 1))
+    for desplazamiento in desplazamientos:
+        salida.write(b'%010d 00000 n \n' % desplazamiento)
+    salida.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                 % (len(desplazamientos) + 1, inicio_xref))
+    return salida.getvalue()
+
+def _generar_bloque_reportes(persona_ids, directorio):
+    """Genera en el proceso actual los reportes de un bloque de personas"""
+    inicio = time.perf_counter()
+    fallidos = []
+    for persona_id in persona_ids:
+        ruta = os.path.join(directorio, f"reporte_persona_{persona_id}.pdf")
+        exito, mensaje = _generador_trabajador.generar_reporte_persona(persona_id, ruta)
+        if not exito:
+            fallidos.append((persona_id, mensaje))
+    return len(persona_ids) - len(fallidos), fallidos, time.perf_counter() - inicio
 
 class GeneradorReportes:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, cache=None):
+        """
+        Args:
+            db_manager: DatabaseManager con las personas y detecciones
+            cache: CacheReportes opcional; con ella cada página se guarda como PDF
+                vectorial y solo se vuelve a dibujar cuando cambian sus datos
+        """
         self.db = db_manager
+        self.cache = cache
     
-    def generar_reporte_persona(self, persona_id, output_path):
-        """Genera un reporte PDF para una persona específica"""
+    def _marca_datos(self, *partes):
+        """
+        Clave de un reporte completo a partir de la versión de los datos: mientras no
+        cambien personas ni resúmenes (ni pase la hora, por las ventanas de días) el
+        reporte se arma sin consultar la base de datos.
+        """
+        return CacheReportes.clave(*partes, self.db.obtener_version_datos(),
+                                   datetime.now().strftime('%Y-%m-%d %H'))
+    
+    def _pdf_en_cache(self, marca):
+        """PDF ya armado para la misma marca de datos, o None"""
+        clave_pdf = self.cache.obtener(marca)
+        return None if clave_pdf is None else self.cache.obtener(clave_pdf.decode('ascii'))
+    
+    def _renderizar_pagina(self, tipo, entradas, dibujar):
+        """
+        Retorna (clave, PDF de una página); solo llama a dibujar(destino) si no hay
+        una página en caché con las mismas entradas
+        """
+        clave = CacheReportes.clave(tipo, entradas)
+        pagina = self.cache.obtener(clave)
+        if pagina is None:
+            destino = PaginasPDF()
+            dibujar(destino)
+            pagina = destino.paginas[0]
+            self.cache.guardar(clave, pagina)
+        return clave, pagina
+    
+    def _escribir_desde_cache(self, marca, output_path, paginas):
+        """
+        Escribe el PDF con páginas (tipo, entradas, dibujar) reutilizando las de la caché.
+        El PDF armado se guarda también, direccionado por las claves de sus páginas.
+        """
+        claves = []
+        pdfs_paginas = []
+        for tipo, entradas, dibujar in paginas:
+            clave, pagina = self._renderizar_pagina(tipo, entradas, dibujar)
+            claves.append(clave)
+            pdfs_paginas.append(pagina)
+        
+        clave_pdf = CacheReportes.clave('pdf', claves)
+        pdf = self.cache.obtener(clave_pdf)
+        if pdf is None:
+            pdf = unir_pdfs(pdfs_paginas)
+            self.cache.guardar(clave_pdf, pdf)
+        self.cache.guardar(marca, clave_pdf.encode('ascii'))
+        
+        with open(output_path, 'wb') as f:
+            f.write(pdf)
+    
+    def _obtener_datos_persona(self, persona_id):
+        """Todos los datos del reporte de una persona con un número fijo de consultas"""
         persona = self.db.obtener_persona_por_id(persona_id)
         if not persona:
+            return None
+        
+        return {
+            'persona': persona,
+            'estadisticas': self.db.obtener_estadisticas_emociones(persona_id),
+            'ultimas': self.db.obtener_ultimas_detecciones(persona_id, limite=10, dias=30)
+        }
+    
+    def generar_reporte_persona(self, persona_id, output_path):
+        """Genera un reporte PDF para una persona específica"""
+        if self.cache is not None:
+            marca = self._marca_datos('reporte_persona', persona_id)
+            pdf = self._pdf_en_cache(marca)
+            if pdf is not None:
+                try:
+                    with open(output_path, 'wb') as f:
+                        f.write(pdf)
+                    return True, f"Reporte generado: {output_path}"
+                except Exception as e:
+                    return False, f"Error al generar reporte: {str(e)}"
+        
+        datos = self._obtener_datos_persona(persona_id)
+        if not datos:
             return False, "Persona no encontrada"
         
+        persona = datos['persona']
         try:
+            if self.cache is not None:
+                datos_persona = [persona.id, persona.nombre, persona.apellido,
+                                 persona.email, persona.fecha_registro]
+                estadisticas = list(datos['estadisticas'].items())
+                self._escribir_desde_cache(marca, output_path, [
+                    ('resumen', [datos_persona, estadisticas],
+                     lambda destino: self._generar_pagina_resumen(destino, persona, datos['estadisticas'])),
+                    ('grafico', [datos_persona, estadisticas],
+                     lambda destino: self._generar_pagina_grafico(destino, persona, datos['estadisticas'])),
+                    ('historial', [datos_persona, datos['ultimas']],
+                     lambda destino: self._generar_pagina_historial(destino, persona, datos['ultimas'])),
+                ])
+                return True, f"Reporte generado: {output_path}"
+            
             with PdfPages(output_path) as pdf:
                 # Página 1: Resumen y estadísticas
-                self._generar_pagina_resumen(pdf, persona)
+                self._generar_pagina_resumen(pdf, persona, datos['estadisticas'])
                 
                 # Página 2: Gráfico de emociones
-                self._generar_pagina_grafico(pdf, persona)
+                self._generar_pagina_grafico(pdf, persona, datos['estadisticas'])
                 
                 # Página 3: Historial reciente
-                self._generar_pagina_historial(pdf, persona)
+                self._generar_pagina_historial(pdf, persona, datos['ultimas'])
             
             return True, f"Reporte generado: {output_path}"
         except Exception as e:
@@ -32,23 +251,121 @@ class GeneradorReportes:
     def generar_reporte_general(self, output_path, dias=30):
         """Genera un reporte PDF general del sistema"""
         try:
+            if self.cache is not None:
+                marca = self._marca_datos('reporte_general', dias)
+                pdf = self._pdf_en_cache(marca)
+                if pdf is not None:
+                    with open(output_path, 'wb') as f:
+                        f.write(pdf)
+                    return True, f"Reporte general generado: {output_path}"
+            
+            personas = self.db.obtener_todas_personas()
+            conteos = self.db.obtener_conteos_por_persona(dias)
+            estadisticas = self.db.obtener_estadisticas_emociones(dias=dias)
+            
+            if self.cache is not None:
+                lista_personas = [(persona.id, persona.nombre, persona.apellido) for persona in personas]
+                self._escribir_desde_cache(marca, output_path, [
+                    # La fecha del reporte va en la página: se redibuja como máximo una vez por hora
+                    ('estadisticas_generales', [dias, lista_personas, sorted(conteos.items()),
+                                                datetime.now().strftime('%Y-%m-%d %H')],
+                     lambda destino: self._generar_pagina_estadisticas_generales(destino, dias, personas, conteos)),
+                    ('distribucion_emociones', [dias, list(estadisticas.items())],
+                     lambda destino: self._generar_pagina_distribucion_emociones(destino, dias, estadisticas)),
+                ])
+                return True, f"Reporte general generado: {output_path}"
+            
             with PdfPages(output_path) as pdf:
                 # Página 1: Estadísticas generales
-                self._generar_pagina_estadisticas_generales(pdf, dias)
+                self._generar_pagina_estadisticas_generales(pdf, dias, personas, conteos)
                 
                 # Página 2: Distribución de emociones
-                self._generar_pagina_distribucion_emociones(pdf, dias)
+                self._generar_pagina_distribucion_emociones(pdf, dias, estadisticas)
             
             return True, f"Reporte general generado: {output_path}"
         except Exception as e:
             return False, f"Error al generar reporte general: {str(e)}"
     
-    def _generar_pagina_resumen(self, pdf, persona):
+    def exportar_historial_csv(self, output_path, persona_id=None, dias=None):
+        """Exporta el historial de detecciones a CSV leyendo por páginas (memoria constante)"""
+        try:
+            nombres = {
+                persona.id: f"{persona.nombre} {persona.apellido}"
+                for persona in self.db.obtener_todas_personas()
+            }
+            filas = 0
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                escritor = csv.writer(f)
+                escritor.writerow(['id', 'persona_id', 'persona', 'fecha', 'emocion', 'confianza'])
+                for id_deteccion, id_persona, fecha, emocion, confianza in \
+                        self.db.iterar_historial_emociones(persona_id, dias):
+                    escritor.writerow([
+                        id_deteccion, id_persona, nombres.get(id_persona, ''),
+                        fecha.isoformat(sep=' '), emocion, f"{confianza:.4f}"
+                    ])
+                    filas += 1
+            
+            return True, f"Historial exportado: {filas} detecciones en {output_path}"
+        except Exception as e:
+            return False, f"Error al exportar historial: {str(e)}"
+    
+    def generar_reportes_todas_personas(self, directorio, procesos=None, tamano_bloque=None):
+        """
+        Genera un reporte PDF por persona en `directorio` usando un pool de procesos
+        (uno por núcleo por defecto). Las personas se reparten en bloques para que cada
+        proceso reutilice su conexión y su backend de matplotlib.
+        """
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            persona_ids = [persona.id for persona in self.db.obtener_todas_personas()]
+            if not persona_ids:
+                return False, "No hay personas registradas"
+            
+            procesos = procesos or os.cpu_count() or 1
+            tamano_bloque = tamano_bloque or max(1, min(50, len(persona_ids) // (procesos * 4)))
+            bloques = [persona_ids[i:i + tamano_bloque] for i in range(0, len(persona_ids), tamano_bloque)]
+            
+            inicio = time.perf_counter()
+            generados = 0
+            fallidos = []
+            # spawn y no fork: la interfaz llama desde un hilo mientras otros (captura,
+            # inferencia, escritor) pueden tener tomados locks de SQLite, logging o BLAS,
+            # que el hijo heredaría tomados. Cada proceso abre su estado en el inicializador.
+            with ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_inicializar_trabajador,
+                initargs=(
+                    self.db.db_path,
+                    (self.cache.directorio, self.cache.tamano_maximo) if self.cache else None
+                )
+            ) as pool:
+                futuros = [pool.submit(_generar_bloque_reportes, bloque, directorio) for bloque in bloques]
+                for futuro in as_completed(futuros):
+                    generados_bloque, fallidos_bloque, _ = futuro.result()
+                    generados += generados_bloque
+                    fallidos.extend(fallidos_bloque)
+            
+            segundos = time.perf_counter() - inicio
+            for persona_id, mensaje in fallidos:
+                logger.error(f"Reporte de la persona {persona_id}: {mensaje}")
+            logger.info(
+                f"Reportes masivos: {generados} generados, {len(fallidos)} fallidos en "
+                f"{segundos:.1f} s con {procesos} procesos"
+            )
+            
+            mensaje = f"{generados} reportes generados en {directorio} ({segundos:.1f} s)"
+            if fallidos:
+                mensaje += f", {len(fallidos)} fallidos"
+            return not fallidos, mensaje
+        except Exception as e:
+            return False, f"Error al generar reportes: {str(e)}"
+    
+    def _generar_pagina_resumen(self, pdf, persona, estadisticas):
         fig, ax = plt.subplots(figsize=(8, 6))
         fig.suptitle(f'Reporte de Emociones - {persona.nombre} {persona.apellido}', fontsize=16)
         
         # Estadísticas
-        estadisticas = self.db.obtener_estadisticas_emociones(persona.id)
         total_detecciones = sum(estadisticas.values())
         
         ax.axis('off')  # Ocultar ejes
@@ -73,9 +390,7 @@ class GeneradorReportes:
         pdf.savefig(fig, bbox_inches='tight')
         plt.close()
     
-    def _generar_pagina_grafico(self, pdf, persona):
-        estadisticas = self.db.obtener_estadisticas_emociones(persona.id)
-        
+    def _generar_pagina_grafico(self, pdf, persona, estadisticas):
         if not estadisticas:
             fig, ax = plt.subplots(figsize=(10, 6))
             ax.text(0.5, 0.5, "No hay datos de emociones para esta persona", 
@@ -109,9 +424,7 @@ class GeneradorReportes:
         pdf.savefig(fig, bbox_inches='tight')
         plt.close()
     
-    def _generar_pagina_historial(self, pdf, persona):
-        historial = self.db.obtener_historial_emociones(persona.id, dias=30)
-        
+    def _generar_pagina_historial(self, pdf, persona, historial):
         fig, ax = plt.subplots(figsize=(10, 6))
         ax.axis('off')
         ax.set_title(f'Historial Reciente - {persona.nombre} {persona.apellido}')
@@ -120,13 +433,11 @@ class GeneradorReportes:
             ax.text(0.5, 0.5, "No hay datos de detección recientes", 
                    ha='center', va='center', transform=ax.transAxes)
         else:
-            # Mostrar últimas 10 detecciones
-            historial_reciente = historial[-10:] if len(historial) > 10 else historial
-            
+            # Últimas 10 detecciones, ya limitadas por la consulta
             texto_historial = "Últimas Detecciones:\n\n"
-            for deteccion in historial_reciente:
-                fecha = deteccion.fecha_deteccion.strftime('%Y-%m-%d %H:%M')
-                texto_historial += f"{fecha}: {deteccion.emocion} ({deteccion.confianza:.1%})\n"
+            for fecha_deteccion, emocion, confianza in historial:
+                fecha = fecha_deteccion.strftime('%Y-%m-%d %H:%M')
+                texto_historial += f"{fecha}: {emocion} ({confianza:.1%})\n"
             
             ax.text(0.1, 0.9, texto_historial, transform=ax.transAxes, fontsize=10,
                    verticalalignment='top', linespacing=1.5)
@@ -134,9 +445,8 @@ class GeneradorReportes:
         pdf.savefig(fig, bbox_inches='tight')
         plt.close()
     
-    def _generar_pagina_estadisticas_generales(self, pdf, dias):
-        personas = self.db.obtener_todas_personas()
-        total_detecciones = len(self.db.obtener_historial_emociones(dias=dias))
+    def _generar_pagina_estadisticas_generales(self, pdf, dias, personas, conteos):
+        total_detecciones = sum(conteos.values())
         
         fig, ax = plt.subplots(figsize=(8, 6))
         ax.axis('off')
@@ -152,7 +462,7 @@ class GeneradorReportes:
         """
         
         for persona in personas:
-            detecciones_persona = len(self.db.obtener_historial_emociones(persona.id, dias))
+            detecciones_persona = conteos.get(persona.id, 0)
             info_general += f"- {persona.nombre} {persona.apellido} ({detecciones_persona} detecciones)\n"
         
         ax.text(0.1, 0.9, info_general, transform=ax.transAxes, fontsize=10,
@@ -161,9 +471,7 @@ class GeneradorReportes:
         pdf.savefig(fig, bbox_inches='tight')
         plt.close()
     
-    def _generar_pagina_distribucion_emociones(self, pdf, dias):
-        estadisticas = self.db.obtener_estadisticas_emociones()
-        
+    def _generar_pagina_distribucion_emociones(self, pdf, dias, estadisticas):
         if not estadisticas:
             fig, ax = plt.subplots(figsize=(12, 6))
             ax.text(0.5, 0.5, "No hay datos de emociones en el sistema", 
@@ -196,4 +504,38 @@ class GeneradorReportes:
         
         plt.tight_layout()
         pdf.savefig(fig, bbox_inches='tight')
-        plt.close()
\ No newline at end of file
+        plt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generación de reportes PDF")
+    parser.add_argument('--db', default='facial_emotion_system.db', help='Ruta de la base de datos')
+    parser.add_argument('--directorio', default='reportes', help='Carpeta de salida de los reportes por persona')
+    parser.add_argument('--procesos', type=int, default=None, help='Procesos del pool (por defecto, uno por núcleo)')
+    parser.add_argument('--general', action='store_true', help='Generar también el reporte general')
+    parser.add_argument('--dias', type=int, default=30, help='Días del reporte general')
+    parser.add_argument('--cache', default=None, help='Carpeta de la caché de páginas (opcional)')
+    parser.add_argument('--csv', default=None, help='Exportar además el historial completo a este CSV')
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    plt.switch_backend('Agg')
+    cache = CacheReportes(args.cache) if args.cache else None
+    generador = GeneradorReportes(DatabaseManager(args.db), cache)
+    
+    exito, mensaje = generador.generar_reportes_todas_personas(args.directorio, args.procesos)
+    print(mensaje)
+    if args.general:
+        exito_general, mensaje = generador.generar_reporte_general(
+            os.path.join(args.directorio, 'reporte_general.pdf'), args.dias
+        )
+        exito = exito and exito_general
+        print(mensaje)
+    if args.csv:
+        exito_csv, mensaje = generador.exportar_historial_csv(args.csv)
+        exito = exito and exito_csv
+        print(mensaje)
+    return 0 if exito else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
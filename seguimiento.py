@@ -0,0 +1,198 @@
+import threading
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_iou(a, b):
+    """Intersección sobre unión de dos ubicaciones (top, right, bottom, left)"""
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+
+    interseccion = max(0, bottom - top) * max(0, right - left)
+    if interseccion == 0:
+        return 0.0
+
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return interseccion / float(area_a + area_b - interseccion)
+
+
+class Pista:
+    """Rostro seguido entre frames con su identidad y su plantilla de apariencia"""
+
+    def __init__(self, id_pista, ubicacion):
+        self.id = id_pista
+        self.ubicacion = ubicacion
+        self.persona = None
+        self.confianza = None
+        self.distancia = None
+        self.plantilla = None
+        self.frames_desde_verificacion = 0
+        self.verificada = False
+
+    def resultado(self):
+        return self.persona, self.confianza, self.distancia, self.ubicacion
+
+
+class SeguidorRostros:
+    """
+    Seguimiento de rostros entre frames para no detectar ni codificar en cada uno.
+
+    La detección completa (HOG) solo se ejecuta cada `intervalo_deteccion` frames
+    o cuando se pierde alguna pista; entre detecciones, cada caja se desplaza
+    buscando su plantilla en una ventana alrededor de la posición anterior.
+    La identidad se conserva en la pista y se vuelve a verificar con el embedding
+    cada `intervalo_verificacion` frames, codificando la caja ya conocida.
+    `intervalo_deteccion` y `escala_deteccion` (None: la del reconocedor) pueden
+    cambiarse en marcha, p. ej. desde un ControladorLatencia.
+    """
+
+    def __init__(self, reconocedor, intervalo_deteccion=10, intervalo_verificacion=30,
+                 umbral_iou=0.3, umbral_seguimiento=0.5, escala=0.5, escala_deteccion=None):
+        self.reconocedor = reconocedor
+        self.intervalo_deteccion = intervalo_deteccion
+        self.escala_deteccion = escala_deteccion
+        self.intervalo_verificacion = intervalo_verificacion
+        self.umbral_iou = umbral_iou
+        self.umbral_seguimiento = umbral_seguimiento
+        self.escala = escala
+        self.pistas = []
+        # Empieza vencido: el primer frame siempre se detecta
+        self.frames_desde_deteccion = intervalo_deteccion
+        self._siguiente_id = 1
+        self._lock = threading.Lock()
+
+    def reiniciar(self):
+        with self._lock:
+            self.pistas = []
+            self.frames_desde_deteccion = self.intervalo_deteccion
+
+    def procesar(self, frame):
+        """
+        Actualiza las pistas con un nuevo frame
+
+        Returns:
+            list: tuplas (persona, confianza, distancia, ubicacion), igual que
+                  ReconocedorFacial.reconocer_personas
+        """
+        with self._lock:
+            gris = cv2.cvtColor(
+                cv2.resize(frame, (0, 0), fx=self.escala, fy=self.escala),
+                cv2.COLOR_BGR2GRAY
+            )
+
+            # Sin pistas también se respeta el intervalo: una escena vacía no debe
+            # costar una detección por frame. Solo perder una pista obliga a redetectar ya.
+            necesita_deteccion = (
+                self.frames_desde_deteccion >= self.intervalo_deteccion
+                or (self.pistas and not self._seguir(gris))
+            )
+
+            if necesita_deteccion:
+                self._detectar(frame, gris)
+            else:
+                self.frames_desde_deteccion += 1
+
+            for pista in self.pistas:
+                pista.frames_desde_verificacion += 1
+
+            self._verificar(frame)
+            return [pista.resultado() for pista in self.pistas]
+
+    def _detectar(self, frame, gris):
+        """Detección completa y asociación de las cajas nuevas con las pistas por IoU"""
+        ubicaciones = self.reconocedor.detectar_rostros(frame, self.escala_deteccion)
+        self.frames_desde_deteccion = 0
+
+        pares = sorted(
+            ((calcular_iou(pista.ubicacion, ubicacion), i, j)
+             for i, pista in enumerate(self.pistas)
+             for j, ubicacion in enumerate(ubicaciones)),
+            reverse=True
+        )
+
+        pistas_nuevas = [None] * len(ubicaciones)
+        usadas = set()
+        for iou, i, j in pares:
+            if iou < self.umbral_iou:
+                break
+            if i in usadas or pistas_nuevas[j] is not None:
+                continue
+            usadas.add(i)
+            pistas_nuevas[j] = self.pistas[i]
+
+        for j, ubicacion in enumerate(ubicaciones):
+            if pistas_nuevas[j] is None:
+                pistas_nuevas[j] = Pista(self._siguiente_id, ubicacion)
+                self._siguiente_id += 1
+            pistas_nuevas[j].ubicacion = ubicacion
+            pistas_nuevas[j].plantilla = self._recortar(gris, ubicacion)
+
+        self.pistas = pistas_nuevas
+
+    def _seguir(self, gris):
+        """Desplaza cada pista por coincidencia de plantilla; retorna False si alguna se pierde"""
+        for pista in self.pistas:
+            if pista.plantilla is None or pista.plantilla.size == 0:
+                return False
+
+            top, right, bottom, left = [int(v * self.escala) for v in pista.ubicacion]
+            alto, ancho = pista.plantilla.shape
+
+            # Ventana de búsqueda: la caja anterior ampliada media caja por lado
+            margen_y, margen_x = alto // 2, ancho // 2
+            y0 = max(0, top - margen_y)
+            x0 = max(0, left - margen_x)
+            y1 = min(gris.shape[0], bottom + margen_y)
+            x1 = min(gris.shape[1], right + margen_x)
+            ventana = gris[y0:y1, x0:x1]
+
+            if ventana.shape[0] < alto or ventana.shape[1] < ancho:
+                return False
+
+            respuesta = cv2.matchTemplate(ventana, pista.plantilla, cv2.TM_CCOEFF_NORMED)
+            _, puntaje, _, (dx, dy) = cv2.minMaxLoc(respuesta)
+            if puntaje < self.umbral_seguimiento:
+                return False
+
+            nuevo_top = (y0 + dy) / self.escala
+            nuevo_left = (x0 + dx) / self.escala
+            pista.ubicacion = (
+                int(nuevo_top),
+                int(nuevo_left + ancho / self.escala),
+                int(nuevo_top + alto / self.escala),
+                int(nuevo_left)
+            )
+
+        return True
+
+    def _verificar(self, frame):
+        """Codifica e identifica solo las pistas nuevas o con verificación vencida"""
+        pendientes = [
+            pista for pista in self.pistas
+            if not pista.verificada or pista.frames_desde_verificacion >= self.intervalo_verificacion
+        ]
+        if not pendientes:
+            return
+
+        ubicaciones = [pista.ubicacion for pista in pendientes]
+        embeddings = self.reconocedor.codificar_rostros(frame, ubicaciones)
+        if len(embeddings) != len(pendientes):
+            return
+
+        for pista, (persona, confianza, distancia, _) in zip(
+                pendientes, self.reconocedor.identificar(embeddings, ubicaciones)):
+            pista.persona = persona
+            pista.confianza = confianza
+            pista.distancia = distancia
+            pista.verificada = True
+            pista.frames_desde_verificacion = 0
+
+    def _recortar(self, gris, ubicacion):
+        top, right, bottom, left = [int(v * self.escala) for v in ubicacion]
+        top, left = max(0, top), max(0, left)
+        return gris[top:bottom, left:right].copy()
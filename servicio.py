@@ -0,0 +1,443 @@
+"""
+Servicio HTTP local de reconocimiento facial y emociones.
+
+Mantiene los modelos cargados y agrupa las solicitudes concurrentes en
+micro-lotes: las que llegan dentro de una ventana corta (o hasta completar el
+tamaño máximo de lote) se procesan juntas, con una sola búsqueda en la galería
+y una sola pasada del clasificador de emociones para todos sus rostros.
+
+Endpoints:
+    POST /reconocer   cuerpo: imagen JPEG/PNG -> JSON con los rostros reconocidos
+    GET  /metricas    latencias p50/p99, tamaño medio de lote y contadores
+    GET  /salud       estado del servicio
+
+Uso (desde la carpeta del proyecto):
+    python servicio.py --puerto 8765 --ventana-ms 10 --lote-maximo 16 --concurrencia 64
+    curl --data-binary @foto.jpg http://127.0.0.1:8765/reconocer
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from database import DatabaseManager
+from face_recognizer import ReconocedorFacial
+from detectores import DETECTORES, crear_detector
+from emotion_analyzer import AnalizadorEmocionesFER
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_HTTP = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    408: 'Request Timeout',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+
+def _numero_json(valor):
+    """float finito o None: el JSON estándar no admite Infinity ni NaN (p. ej. huecos sin candidato del IVF)"""
+    if valor is None:
+        return None
+    valor = float(valor)
+    return valor if math.isfinite(valor) else None
+
+
+class MedidorLatencias:
+    """Guarda las últimas latencias (en segundos) y calcula percentiles sobre ellas"""
+
+    def __init__(self, ventana=4096):
+        self._muestras = deque(maxlen=ventana)
+        self.total = 0
+
+    def registrar(self, segundos):
+        self._muestras.append(segundos)
+        self.total += 1
+
+    def percentil(self, p):
+        if not self._muestras:
+            return 0.0
+        return float(np.percentile(np.fromiter(self._muestras, dtype=np.float64), p))
+
+    def resumen(self):
+        return {
+            'solicitudes': self.total,
+            'p50_ms': 1000 * self.percentil(50),
+            'p99_ms': 1000 * self.percentil(99),
+        }
+
+
+class LoteadorInferencia:
+    """
+    Agrupa en micro-lotes los elementos enviados desde varias corrutinas.
+
+    Un lote se cierra al llegar a `lote_maximo` elementos o cuando pasan
+    `ventana_ms` desde el primero, y se procesa en el ejecutor con
+    procesar_lote(elementos) -> lista de resultados en el mismo orden. Con
+    `lotes_simultaneos` lotes en curso, los siguientes elementos esperan en la
+    cola, de modo que bajo carga los lotes crecen solos.
+    """
+
+    def __init__(self, procesar_lote, ejecutor, ventana_ms=10.0, lote_maximo=16, lotes_simultaneos=1):
+        self.procesar_lote = procesar_lote
+        self.ejecutor = ejecutor
+        self.ventana = ventana_ms / 1000.0
+        self.lote_maximo = lote_maximo
+        self._cola = asyncio.Queue()
+        self._espacios = asyncio.Semaphore(lotes_simultaneos)
+        self._tarea = None
+        self.lotes = 0
+        self.elementos = 0
+
+    def iniciar(self):
+        self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+
+    async def enviar(self, elemento):
+        """Encola un elemento y espera su resultado"""
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((elemento, futuro))
+        return await futuro
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._espacios.acquire()
+            lote = [await self._cola.get()]
+            limite = loop.time() + self.ventana
+            while len(lote) < self.lote_maximo:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(await asyncio.wait_for(self._cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+            loop.create_task(self._ejecutar(lote))
+
+    async def _ejecutar(self, lote):
+        loop = asyncio.get_running_loop()
+        try:
+            resultados = await loop.run_in_executor(
+                self.ejecutor, self.procesar_lote, [elemento for elemento, _ in lote]
+            )
+            for (_, futuro), resultado in zip(lote, resultados):
+                if not futuro.done():
+                    futuro.set_result(resultado)
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+        finally:
+            self.lotes += 1
+            self.elementos += len(lote)
+            self._espacios.release()
+
+
+class ServicioReconocimiento:
+    """Servidor HTTP/1.1 mínimo (asyncio) sobre el reconocedor y el analizador de emociones"""
+
+    def __init__(self, reconocedor, analizador, escritor_detecciones=None, ventana_ms=10.0,
+                 lote_maximo=16, concurrencia=64, max_en_espera=256, hilos_inferencia=1,
+                 tamano_maximo=10 * 1024 * 1024):
+        self.reconocedor = reconocedor
+        self.analizador = analizador
+        self.escritor_detecciones = escritor_detecciones
+        self.concurrencia = concurrencia
+        self.max_en_espera = max_en_espera
+        self.tamano_maximo = tamano_maximo
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos_inferencia, thread_name_prefix="inferencia")
+        self.lotes = LoteadorInferencia(self.procesar_lote, self.ejecutor, ventana_ms,
+                                        lote_maximo, hilos_inferencia)
+        self.latencias = MedidorLatencias()
+        self.rechazadas = 0
+        self.en_curso = 0
+        self.en_espera = 0
+        self._limite = None
+        self._servidor = None
+
+    # --- Inferencia (hilo del ejecutor) ---
+
+    def procesar_lote(self, imagenes):
+        """
+        Procesa un micro-lote de imágenes codificadas (JPEG/PNG)
+
+        Returns:
+            list: por imagen, la lista de rostros (dicts) o una excepción ValueError
+        """
+        frames = []
+        ubicaciones = []
+        embeddings = []
+        for datos in imagenes:
+            frame = cv2.imdecode(np.frombuffer(datos, dtype=np.uint8), cv2.IMREAD_COLOR)
+            frames.append(frame)
+            if frame is None:
+                ubicaciones.append([])
+                continue
+            # La detección y la codificación de dlib son por imagen
+            ubicaciones_frame = self.reconocedor.detectar_rostros(frame)
+            embeddings_frame = self.reconocedor.codificar_rostros(frame, ubicaciones_frame)
+            if len(embeddings_frame) != len(ubicaciones_frame):
+                ubicaciones_frame, embeddings_frame = [], []
+            ubicaciones.append(ubicaciones_frame)
+            embeddings.extend(embeddings_frame)
+
+        # Una sola búsqueda en la galería y una sola pasada de emociones para todo el lote
+        todas_ubicaciones = [ubicacion for ubicaciones_frame in ubicaciones for ubicacion in ubicaciones_frame]
+        identificados = self.reconocedor.identificar(embeddings, todas_ubicaciones)
+        validos = [frame for frame in frames if frame is not None]
+        probabilidades = iter(self.analizador.predecir_emociones_lote(
+            validos, [u for frame, u in zip(frames, ubicaciones) if frame is not None]
+        ))
+
+        resultados = []
+        posicion = 0
+        for frame, ubicaciones_frame in zip(frames, ubicaciones):
+            if frame is None:
+                resultados.append(ValueError("La imagen no se pudo decodificar"))
+                continue
+
+            rostros = []
+            for (persona, confianza, distancia, ubicacion), emociones in zip(
+                identificados[posicion:posicion + len(ubicaciones_frame)], next(probabilidades)
+            ):
+                rostro = {
+                    'ubicacion': list(ubicacion),
+                    'persona_id': persona.id if persona else None,
+                    'nombre': f"{persona.nombre} {persona.apellido}" if persona else None,
+                    'confianza': _numero_json(confianza),
+                    'distancia': _numero_json(distancia),
+                    'emocion': None,
+                    'confianza_emocion': None,
+                    'emociones': emociones,
+                }
+                if emociones:
+                    rostro['emocion'], rostro['confianza_emocion'] = max(emociones.items(), key=lambda item: item[1])
+                    if persona and self.escritor_detecciones:
+                        self.escritor_detecciones.registrar(persona.id, rostro['emocion'],
+                                                            rostro['confianza_emocion'], timeout=0)
+                rostros.append(rostro)
+            posicion += len(ubicaciones_frame)
+            resultados.append(rostros)
+
+        return resultados
+
+    # --- HTTP ---
+
+    async def iniciar(self, host='127.0.0.1', puerto=8765):
+        self._limite = asyncio.Semaphore(self.concurrencia)
+        self.lotes.iniciar()
+        self._servidor = await asyncio.start_server(self._atender_conexion, host, puerto)
+        logger.info(f"Servicio escuchando en http://{host}:{puerto}")
+        return self._servidor
+
+    async def detener(self):
+        if self._servidor:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        await self.lotes.detener()
+        self.ejecutor.shutdown(wait=True)
+        logger.info(f"Servicio detenido: {json.dumps(self.metricas())}")
+
+    def metricas(self):
+        return {
+            **self.latencias.resumen(),
+            'rechazadas': self.rechazadas,
+            'en_curso': self.en_curso,
+            'en_espera': self.en_espera,
+            'lotes': self.lotes.lotes,
+            'tamano_medio_lote': self.lotes.elementos / self.lotes.lotes if self.lotes.lotes else 0.0,
+        }
+
+    async def _atender_conexion(self, reader, writer):
+        try:
+            while True:
+                try:
+                    cabecera = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=30)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._responder(writer, 413, {'error': 'Cabeceras demasiado grandes'}, False)
+                    break
+
+                lineas = cabecera.decode('latin-1').split('\r\n')
+                try:
+                    metodo, ruta, version = lineas[0].split(' ', 2)
+                except ValueError:
+                    await self._responder(writer, 400, {'error': 'Solicitud inválida'}, False)
+                    break
+                cabeceras = {}
+                for linea in lineas[1:]:
+                    if ':' in linea:
+                        nombre, valor = linea.split(':', 1)
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+
+                mantener = (cabeceras.get('connection', '').lower() != 'close'
+                            and version.upper() == 'HTTP/1.1')
+                if 'transfer-encoding' in cabeceras:
+                    # Sin soporte de cuerpos por fragmentos: leerlo como vacío lo perdería en silencio
+                    await self._responder(writer, 411, {'error': 'Se requiere Content-Length'}, False)
+                    break
+                try:
+                    longitud = int(cabeceras.get('content-length') or 0)
+                except ValueError:
+                    longitud = -1
+                if longitud < 0:
+                    await self._responder(writer, 400, {'error': 'Content-Length inválido'}, False)
+                    break
+                if longitud > self.tamano_maximo:
+                    await self._responder(writer, 413, {'error': 'Imagen demasiado grande'}, False)
+                    break
+                cuerpo = await reader.readexactly(longitud) if longitud else b''
+
+                estado, respuesta = await self._despachar(metodo, ruta.split('?', 1)[0], cuerpo)
+                await self._responder(writer, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except Exception as e:
+            logger.error(f"Error en la conexión: {str(e)}")
+        finally:
+            writer.close()
+
+    async def _despachar(self, metodo, ruta, cuerpo):
+        if metodo == 'GET' and ruta == '/salud':
+            return 200, {'estado': 'ok', 'personas': len(self.reconocedor.galeria)}
+        if metodo == 'GET' and ruta == '/metricas':
+            return 200, self.metricas()
+        if metodo == 'POST' and ruta == '/reconocer':
+            return await self._reconocer(cuerpo)
+        return 404, {'error': 'Ruta no encontrada'}
+
+    async def _reconocer(self, cuerpo):
+        if not cuerpo:
+            return 400, {'error': 'Se esperaba una imagen en el cuerpo'}
+
+        # Límite de concurrencia: más allá de max_en_espera se rechaza en lugar de encolar
+        if self._limite.locked() and self.en_espera >= self.max_en_espera:
+            self.rechazadas += 1
+            return 503, {'error': 'Servicio saturado'}
+
+        inicio = time.perf_counter()
+        self.en_espera += 1
+        try:
+            async with self._limite:
+                self.en_espera -= 1
+                self.en_curso += 1
+                try:
+                    resultado = await self.lotes.enviar(cuerpo)
+                finally:
+                    self.en_curso -= 1
+        except Exception as e:
+            logger.error(f"Error al reconocer: {str(e)}")
+            return 500, {'error': str(e)}
+
+        if isinstance(resultado, Exception):
+            return 400, {'error': str(resultado)}
+
+        segundos = time.perf_counter() - inicio
+        self.latencias.registrar(segundos)
+        return 200, {'rostros': resultado, 'latencia_ms': 1000 * segundos}
+
+    async def _responder(self, writer, estado, contenido, mantener):
+        try:
+            cuerpo = json.dumps(contenido, ensure_ascii=False, allow_nan=False).encode('utf-8')
+        except ValueError as e:
+            logger.error(f"Respuesta no serializable como JSON: {str(e)}")
+            estado = 500
+            cuerpo = json.dumps({'error': 'Respuesta no serializable'}).encode('utf-8')
+        cabecera = (
+            f"HTTP/1.1 {estado} {ESTADOS_HTTP.get(estado, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n"
+        )
+        writer.write(cabecera.encode('latin-1') + cuerpo)
+        await writer.drain()
+
+
+async def ejecutar_servicio(args):
+    db_manager = DatabaseManager(args.db)
+    reconocedor = ReconocedorFacial(db_manager, args.modo_busqueda, detector=args.detector)
+    analizador = AnalizadorEmocionesFER()
+
+    # Modelos residentes: cargarlos antes de aceptar solicitudes
+    logger.info("Cargando modelos...")
+    reconocedor.precargar()
+    analizador.precargar()
+
+    escritor = db_manager.crear_escritor_detecciones() if args.registrar else None
+    servicio = ServicioReconocimiento(
+        reconocedor, analizador, escritor,
+        ventana_ms=args.ventana_ms,
+        lote_maximo=args.lote_maximo,
+        concurrencia=args.concurrencia,
+        max_en_espera=args.max_en_espera,
+        hilos_inferencia=args.hilos_inferencia
+    )
+    servidor = await servicio.iniciar(args.host, args.puerto)
+
+    async def reportar():
+        while True:
+            await asyncio.sleep(args.intervalo_reporte)
+            logger.info(f"Métricas: {json.dumps(servicio.metricas())}")
+
+    reporte = asyncio.get_running_loop().create_task(reportar())
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        reporte.cancel()
+        await servicio.detener()
+        if escritor:
+            escritor.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--db', default='facial_emotion_system.db')
+    parser.add_argument('--modo-busqueda', choices=['exacto', 'ivf'], default='exacto')
+    parser.add_argument('--detector', choices=list(DETECTORES), default='hog', help='Detector de rostros')
+    parser.add_argument('--ventana-ms', type=float, default=10.0, help='Espera máxima para completar un lote')
+    parser.add_argument('--lote-maximo', type=int, default=16, help='Imágenes por micro-lote')
+    parser.add_argument('--concurrencia', type=int, default=64, help='Solicitudes de reconocimiento en curso')
+    parser.add_argument('--max-en-espera', type=int, default=256, help='Solicitudes en espera antes de responder 503')
+    parser.add_argument('--hilos-inferencia', type=int, default=1, help='Lotes procesados a la vez')
+    parser.add_argument('--registrar', action='store_true', help='Registrar las detecciones en la base de datos')
+    parser.add_argument('--intervalo-reporte', type=float, default=60.0, help='Segundos entre reportes de métricas')
+    args = parser.parse_args()
+    try:
+        # Modelos del detector ausentes: fallar ahora y no en cada frame
+        crear_detector(args.detector)
+    except (FileNotFoundError, RuntimeError) as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger('tensorflow').setLevel(logging.ERROR)
+    try:
+        asyncio.run(ejecutar_servicio(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
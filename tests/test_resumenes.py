@@ -0,0 +1,69 @@
+"""
+Los resúmenes por hora/día deben dar los mismos totales que agrupar la tabla de
+detecciones, incluidas las detecciones sin persona, para cualquier ventana de días.
+"""
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import sqlalchemy as db
+from sqlalchemy import func, select
+
+from database import DatabaseManager, DeteccionEmocion, acumular_resumenes
+
+EMOCIONES = ['Enojo', 'Felicidad', 'Tristeza', 'Neutral']
+VENTANAS = [None, 1, 2, 7, 30, 90, 365]
+
+
+class TestResumenesEmociones(unittest.TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directorio.name, 'prueba.db'))
+
+        rng = random.Random(7)
+        ahora = datetime.now()
+        self.filas = [
+            {
+                # Una de cada cuatro detecciones sin persona
+                'persona_id': None if rng.random() < 0.25 else rng.randint(1, 5),
+                'emocion': rng.choice(EMOCIONES),
+                'confianza': rng.random(),
+                'fecha_deteccion': ahora - timedelta(seconds=rng.randint(0, 400 * 24 * 3600)),
+            }
+            for _ in range(3000)
+        ]
+        with self.db.engine.begin() as conexion:
+            conexion.execute(db.insert(DeteccionEmocion.__table__), self.filas)
+            acumular_resumenes(conexion, self.filas)
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.engine.dispose()
+        self.directorio.cleanup()
+
+    def _crudo(self, dias):
+        query = select(DeteccionEmocion.emocion, func.count(DeteccionEmocion.id))
+        if dias is not None:
+            query = query.where(DeteccionEmocion.fecha_deteccion >= datetime.now() - timedelta(days=dias))
+        return dict(self.db.session.execute(query.group_by(DeteccionEmocion.emocion)).all())
+
+    def _comparar(self):
+        for dias in VENTANAS:
+            with self.subTest(dias=dias):
+                crudo = self._crudo(dias)
+                self.assertEqual(self.db.obtener_estadisticas_emociones(dias=dias), crudo)
+                self.assertEqual(self.db.obtener_conteo_detecciones(dias=dias), sum(crudo.values()))
+
+    def test_resumen_incremental_coincide_con_detecciones(self):
+        self._comparar()
+
+    def test_resumen_reconstruido_coincide_con_detecciones(self):
+        self.db.reconstruir_resumenes()
+        self._comparar()
+
+
+if __name__ == '__main__':
+    unittest.main()
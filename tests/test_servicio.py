@@ -0,0 +1,141 @@
+"""
+El servicio HTTP debe agrupar las solicitudes concurrentes en un solo micro-lote,
+rechazar con 503 lo que excede la espera permitida y responder 400 (sin cortar la
+conexión) a las solicitudes mal formadas. Los modelos se reemplazan por dobles que
+devuelven un rostro por imagen.
+"""
+import asyncio
+import json
+import threading
+import unittest
+
+import cv2
+import numpy as np
+
+from servicio import ServicioReconocimiento
+
+
+class ReconocedorFalso:
+    galeria = []
+
+    def detectar_rostros(self, frame):
+        alto, ancho = frame.shape[:2]
+        return [(0, ancho, alto, 0)]
+
+    def codificar_rostros(self, frame, ubicaciones):
+        return [np.zeros(128) for _ in ubicaciones]
+
+    def identificar(self, embeddings, ubicaciones):
+        return [(None, None, None, ubicacion) for ubicacion in ubicaciones]
+
+
+class AnalizadorFalso:
+    """Con `liberar` sin activar, cada lote queda bloqueado en el hilo de inferencia"""
+
+    def __init__(self):
+        self.liberar = threading.Event()
+        self.liberar.set()
+        self.lotes = []
+
+    def predecir_emociones_lote(self, frames, ubicaciones):
+        self.lotes.append(len(frames))
+        self.liberar.wait(timeout=5)
+        return [[{'Neutral': 1.0} for _ in ubicaciones_frame] for ubicaciones_frame in ubicaciones]
+
+
+def _imagen_jpeg():
+    _, datos = cv2.imencode('.jpg', np.full((32, 32, 3), 128, dtype=np.uint8))
+    return datos.tobytes()
+
+
+class TestServicio(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.analizador = AnalizadorFalso()
+        self.imagen = _imagen_jpeg()
+
+    async def asyncTearDown(self):
+        self.analizador.liberar.set()
+        await self.servicio.detener()
+
+    async def _iniciar(self, **kwargs):
+        self.servicio = ServicioReconocimiento(ReconocedorFalso(), self.analizador, **kwargs)
+        servidor = await self.servicio.iniciar('127.0.0.1', 0)
+        self.puerto = servidor.sockets[0].getsockname()[1]
+
+    async def _solicitud(self, cabecera, cuerpo=b''):
+        """Envía una solicitud cruda y retorna (estado, JSON) de la respuesta"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.puerto)
+        try:
+            writer.write(cabecera + cuerpo)
+            await writer.drain()
+            respuesta = await asyncio.wait_for(reader.read(), timeout=10)
+        finally:
+            writer.close()
+        encabezado, _, contenido = respuesta.partition(b'\r\n\r\n')
+        return int(encabezado.split(b' ', 2)[1]), json.loads(contenido)
+
+    async def _reconocer(self):
+        cabecera = (f"POST /reconocer HTTP/1.1\r\nContent-Length: {len(self.imagen)}\r\n"
+                    f"Connection: close\r\n\r\n").encode('latin-1')
+        return await self._solicitud(cabecera, self.imagen)
+
+    async def _esperar(self, condicion):
+        for _ in range(500):
+            if condicion():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("El servicio no llegó al estado esperado")
+
+    async def test_solicitudes_concurrentes_en_un_lote(self):
+        await self._iniciar(ventana_ms=500, lote_maximo=8)
+
+        respuestas = await asyncio.gather(*(self._reconocer() for _ in range(8)))
+
+        for estado, contenido in respuestas:
+            self.assertEqual(estado, 200)
+            self.assertEqual(len(contenido['rostros']), 1)
+            self.assertEqual(contenido['rostros'][0]['emocion'], 'Neutral')
+        self.assertEqual(self.analizador.lotes, [8])
+        self.assertEqual(self.servicio.metricas()['tamano_medio_lote'], 8.0)
+
+    async def test_saturado_responde_503(self):
+        await self._iniciar(ventana_ms=1, concurrencia=1, max_en_espera=1)
+        self.analizador.liberar.clear()
+
+        # Una solicitud ocupa el único lugar y otra llena la espera
+        en_curso = asyncio.ensure_future(self._reconocer())
+        await self._esperar(lambda: self.servicio.en_curso == 1)
+        en_espera = asyncio.ensure_future(self._reconocer())
+        await self._esperar(lambda: self.servicio.en_espera == 1)
+
+        estado, contenido = await self._reconocer()
+        self.assertEqual(estado, 503)
+        self.assertEqual(self.servicio.rechazadas, 1)
+
+        self.analizador.liberar.set()
+        self.assertEqual((await en_curso)[0], 200)
+        self.assertEqual((await en_espera)[0], 200)
+
+    async def test_solicitudes_mal_formadas_responden_400(self):
+        await self._iniciar()
+
+        casos = {
+            'content-length no numérico': b"POST /reconocer HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+            'content-length negativo': b"POST /reconocer HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+            'línea de solicitud inválida': b"BASURA\r\n\r\n",
+            'sin cuerpo': b"POST /reconocer HTTP/1.1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n",
+        }
+        for caso, cabecera in casos.items():
+            with self.subTest(caso):
+                estado, contenido = await self._solicitud(cabecera)
+                self.assertEqual(estado, 400)
+                self.assertIn('error', contenido)
+
+        estado, _ = await self._solicitud(
+            b"POST /reconocer HTTP/1.1\r\nContent-Length: 4\r\nConnection: close\r\n\r\n", b"nada")
+        self.assertEqual(estado, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()